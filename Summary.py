@@ -1,33 +1,36 @@
 ## Import Modules
-import pandas as pd
-import plotly.express as px
 import streamlit as st
-import yfinance as yf
+
+from html_table import render_table
+from market_data import TickerHandle, sp500_tickers
+from reports import company_name, summary_tables
+from rerun_profiler import capture
+from spans import rerun_span, section, span
+from startup_profile import lazy_import, warm_plotly
+
+px = lazy_import('plotly.express', on_load=warm_plotly)
 
 
 def initialize_ticker_obj():
     """
-    Store the yfinance ticker object for the selected ticker
-    in session state to reduce API hits and persist ticker
-    selection across pages
+    Store a handle for the selected ticker in session state to
+    persist ticker selection across pages. The data itself is
+    held once per process in the shared cache
     """
-    st.session_state['ticker_obj'] = yf.Ticker(st.session_state.ticker)
+    st.session_state['ticker_obj'] = TickerHandle(st.session_state.ticker)
 
 
 def format_table(content):
     """
     Format the summary table for display
-    using pandas styler
+    with the values in bold and right aligned
 
     Parameters
     ----------
     content: dict
         The data to be shown as key-value pairs
     """
-    df = pd.Series(content).reset_index()
-    s = df.style.set_properties(subset=[0], **{'font-weight': 'bold', 'text-align': 'right'})
-    s = s.hide_index().hide_columns()
-    return s.to_html()
+    return render_table(content.items(), bold=[1], align={1: 'right'})
 
 
 def human_format(num):
@@ -70,6 +73,7 @@ def run():
     st.set_page_config(layout="wide")
 
     ############################################# Ticker #############################################
+    section('Ticker')
     ## Set ticker value in session state to persist. Default 'MSFT'
     if "ticker" not in st.session_state:
         st.session_state.ticker = "MSFT"
@@ -84,7 +88,7 @@ def run():
     
     ################ Reference fin_dashboard01.py ################
     # Get the list of stock tickers from S&P500
-    ticker_list = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]['Symbol']
+    ticker_list = sp500_tickers()
 
     # Add the ticker selection on the sidebar
     st.sidebar.selectbox(label="Select a ticker"
@@ -94,12 +98,8 @@ def run():
     ####################################################################################################
     
     ############################################### Title ##############################################
-    if st.session_state.ticker_obj.info.get('longName', None):
-        title_str= st.session_state.ticker_obj.info['longName']
-    elif st.session_state.ticker_obj.info.get('shortName', None):
-        title_str= st.session_state.ticker_obj.info['shortName']
-    else:
-        title_str= st.session_state.ticker_obj.info['symbol']
+    section('Title')
+    title_str = company_name(st.session_state.ticker_obj.info)
     
     title_styled = f"""
     <p style='font-size:50px; font-weight:bold; margin-bottom:-20px'>
@@ -113,6 +113,7 @@ def run():
     ####################################################################################################
 
     ######################## Metric - Current Price and change from last close #########################
+    section('Metric')
     st.markdown("""
     <style>
     [data-testid=stMetricLabel]{
@@ -126,6 +127,7 @@ def run():
     ####################################################################################################
 
     ########################################## Summary Data ############################################
+    section('Summary Data')
     ## Summary Data:
     ### 1. Previous Close, Open, Bid, Ask, Day's Range, 52 Week Range, Volume, Avg. Volume
     ### 2. Market Cap, Beta(5Y Monthly), PE Ratio (TTM), EPS (TTM), Earnings Date, 
@@ -134,36 +136,21 @@ def run():
     col_info1, col_info2, col_chart = st.columns([1,1,2], gap="medium")
 
     ######################## Data Column 1 ########################
-    col_info1_content = {"Previous Close": f"{round(st.session_state.ticker_obj.info['previousClose'], 2) if st.session_state.ticker_obj.info['previousClose'] else 'N/A'}",
-        "Open": f"{round(st.session_state.ticker_obj.info['open'], 2) if st.session_state.ticker_obj.info['open'] else 'N/A'}",
-        "Bid": f"{st.session_state.ticker_obj.info['bid']} x {st.session_state.ticker_obj.info['bidSize']}",
-        "Ask": f"{st.session_state.ticker_obj.info['ask']} x {st.session_state.ticker_obj.info['askSize']}",
-        "Days's Range": f"{st.session_state.ticker_obj.info['dayLow']} - {st.session_state.ticker_obj.info['dayHigh']}",
-        "52 Week Range": f"{st.session_state.ticker_obj.info['fiftyTwoWeekLow']} - {st.session_state.ticker_obj.info['fiftyTwoWeekHigh']}",
-        "Volume": f"{st.session_state.ticker_obj.info['volume']:,}",
-        "Average Volume": f"{st.session_state.ticker_obj.info['averageVolume']:,}"
-    }
+    section('Data Column 1')
+    col_info1_content, col_info2_content = summary_tables(st.session_state.ticker_obj.info, st.session_state.ticker_obj.calendar)
 
     with col_info1:
         st.write(format_table(col_info1_content), unsafe_allow_html=True)
     ###############################################################
     
     ######################## Data Column 2 ########################
-    col_info2_content = {
-        "Market Cap": human_format(st.session_state.ticker_obj.info['marketCap']),
-        "Beta": f"{round(st.session_state.ticker_obj.info['beta'], 2) if st.session_state.ticker_obj.info['beta'] else 'N/A'}",
-        "PE Ratio (TTM)": f"{round(st.session_state.ticker_obj.info['trailingPE'], 2) if st.session_state.ticker_obj.info['trailingPE'] else 'N/A'}",
-        "EPS (TTM)": f"{round(st.session_state.ticker_obj.info['trailingEps'], 2) if st.session_state.ticker_obj.info['trailingEps'] else 'N/A'}",
-        "Earnings Date": ' - '.join(st.session_state.ticker_obj.calendar.loc['Earnings Date'].map(lambda x: x.date().strftime('%b %d, %Y')).to_list()) if st.session_state.ticker_obj.calendar.loc['Earnings Date'].any() else 'N/A',
-        "Forward Dividend & Yield": f"{st.session_state.ticker_obj.info.get('dividendRate', 'N/A')} ({str(round(st.session_state.ticker_obj.info['dividendYield']*100, 2))+'%' if st.session_state.ticker_obj.info['dividendYield'] else 'N/A'})",
-        "exDividendDate": pd.to_datetime(st.session_state.ticker_obj.info['exDividendDate'], unit='s', origin='unix').strftime("%b %d, %Y") if st.session_state.ticker_obj.info['exDividendDate'] else "N/A",
-        "1y Target EST": f"{round(st.session_state.ticker_obj.info['targetMeanPrice'], 2) if st.session_state.ticker_obj.info['targetMeanPrice'] else 'N/A'}"
-    }
+    section('Data Column 2')
     with col_info2:
         st.write(format_table(col_info2_content), unsafe_allow_html=True)
     ###############################################################
 
     ######################## Chart Column ########################
+    section('Chart Column')
     with col_chart:
         ## Multiple tabs show different period of historical
         ## closing price data
@@ -172,36 +159,43 @@ def run():
         with tab_1m:
             data = st.session_state.ticker_obj.history(period="1mo", interval="1d")
             fig = create_chart(data)
-            st.plotly_chart(fig, use_container_width=True)
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
         ## 6 Month
         with tab_6m:
             data = st.session_state.ticker_obj.history(period="6mo", interval="1d")
             fig = create_chart(data)
-            st.plotly_chart(fig, use_container_width=True)
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
         ## Year to Date
         with tab_ytd:
             data = st.session_state.ticker_obj.history(period="ytd", interval="1d")
             fig = create_chart(data)
-            st.plotly_chart(fig, use_container_width=True)
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
         ## 1 Year
         with tab_1y:
             data = st.session_state.ticker_obj.history(period="1y", interval="1d")
             fig = create_chart(data)
-            st.plotly_chart(fig, use_container_width=True)
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
         ## 5 Year
         with tab_5y:
             data = st.session_state.ticker_obj.history(period="5y", interval="1d")
             fig = create_chart(data)
-            st.plotly_chart(fig, use_container_width=True)
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
         ## All available data
         with tab_max:
             data = st.session_state.ticker_obj.history(period="max", interval="1d")
             fig = create_chart(data)
-            st.plotly_chart(fig, use_container_width=True)
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
     ###############################################################  
     ####################################################################################################
 
     ############################################## Source ##############################################
+    section('Source')
     source_str="""
     <p style='font-size:15px; color:grey; text-align:right'>
         Source: Yahoo Finance
@@ -211,4 +205,5 @@ def run():
     #####################################################################################################
 
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    with rerun_span('Summary'), capture('Summary'):
+        run()
\ No newline at end of file
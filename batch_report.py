@@ -0,0 +1,313 @@
+"""
+Headless batch reports of the Summary, Financials, Forecasting and
+Sustainability pages for a list of tickers.
+
+Every ticker is computed with the functions in reports.py that the pages
+use, on a pool of worker processes, and written as JSON, HTML and PDF
+files. The workers share the data caches that live outside the
+process: price history in the shared frame store, statements in the
+fundamentals store, and Monte Carlo paths in the cache directory, so a
+nightly run reuses the simulations of the pages and of earlier runs
+whose window is unchanged.
+
+    python batch_report.py --symbols MSFT AAPL --formats json html pdf
+    python batch_report.py --symbols-file watchlist.txt --workers 8 --output reports/nightly
+
+Without --symbols or --symbols-file, reports are generated for the
+S&P 500 list. An index.json and index.html listing all reports is
+written to the output directory.
+"""
+import argparse
+import base64
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from html import escape
+import io
+import json
+import logging
+import os
+import time
+
+from html_table import render_frame, render_table
+from reports import SECTIONS, build_report, prune_simulations
+
+FORMATS = ('json', 'html', 'pdf')
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_json(df):
+    return {'columns': [str(column) for column in df.columns], 'index': [str(label) for label in df.index],
+            'data': df.astype(object).where(df.notna(), None).values.tolist()}
+
+
+def to_json(report):
+    """
+    JSON text of a report. Tables are split into columns, index and data
+    """
+    document = {key: value for key, value in report.items() if key not in SECTIONS}
+    if 'summary' in report:
+        summary = dict(report['summary'])
+        history = summary.pop('history')
+        summary['history'] = {str(index.date()): float(value) for index, value in history.items()}
+        document['summary'] = summary
+    if 'financials' in report:
+        document['financials'] = {' / '.join(label): _frame_json(view) for label, view in report['financials'].items()}
+    if 'forecasting' in report:
+        document['forecasting'] = {key: value for key, value in report['forecasting'].items() if key != 'simulation'}
+    if 'sustainability' in report:
+        document['sustainability'] = report['sustainability']
+    return json.dumps(document, indent=1, default=str)
+
+
+def _price_figure(history, title=None):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(10, 4))
+    ax.plot(history.index, history.to_numpy(dtype='float64'))
+    ax.set_ylabel('Close')
+    if title:
+        ax.set_title(title)
+    return fig
+
+
+def _png(fig):
+    import matplotlib.pyplot as plt
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight')
+    plt.close(fig)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{font-family: sans-serif; margin: 2em;}} table {{border-collapse: collapse; margin-bottom: 1em;}}
+td, th {{padding: 2px 8px; border-bottom: 1px solid #ddd; font-size: 13px;}} .grey {{color: grey;}}
+</style></head><body>
+<h1>{title}</h1><p class="grey">Generated {generated}. Source: Yahoo Finance</p>
+{body}
+</body></html>
+"""
+
+
+def to_html(report):
+    """
+    Standalone HTML page of a report, charts embedded as PNG
+    """
+    parts = []
+    if 'summary' in report:
+        summary = report['summary']
+        parts.append(f"<h2>Summary</h2><p>Current price {escape(str(summary['current_price']))} "
+                     f"{escape(str(report.get('currency') or ''))}</p>")
+        for table in (summary['trading'], summary['valuation']):
+            parts.append(render_table(table.items(), bold=[1], align={1: 'right'}))
+        parts.append(f"<img src='data:image/png;base64,{_png(_price_figure(summary['history'], 'Last year'))}'>")
+    if 'financials' in report:
+        parts.append('<h2>Financials</h2>')
+        for label, view in report['financials'].items():
+            parts.append(f"<h3>{escape(' / '.join(label))}</h3>")
+            ## Row labels in bold, like the index of st.table on the page
+            parts.append(render_frame(view, bold=[view.index.name or ''], index=True))
+    if 'forecasting' in report:
+        forecast = report['forecasting']
+        parts.append(f"<h2>Forecasting</h2><p>Monte Carlo simulation of the next {forecast['time_horizon']} days, "
+                     f"{forecast['n_simulation']} paths, estimated from {forecast['start_date']} to "
+                     f"{forecast['end_date']}. VaR at {forecast['confidence']:.0%} confidence interval is "
+                     f"{forecast['value_at_risk']:.2f} USD</p>")
+        parts.append(render_table(forecast['final_price_percentiles'].items(), bold=[1], align={1: 'right'},
+                                  precision=2))
+        parts.append(f"<img src='data:image/png;base64,{_png(forecast['simulation'].plot_simulation_price())}'>")
+    if 'sustainability' in report:
+        esg = report['sustainability']
+        if esg is None:
+            parts.append('<h2>Sustainability</h2><p>Sustainability data is not available</p>')
+        else:
+            parts.append('<h2>Sustainability</h2>')
+            parts.append(render_table([(key.replace('_', ' ').capitalize(), value) for key, value in esg.items()],
+                                      bold=[1], align={1: 'right'}, precision=2))
+    for section, error in report['errors'].items():
+        parts.append(f"<p class='grey'>{escape(section)} unavailable: {escape(error)}</p>")
+    return HTML_TEMPLATE.format(title=escape(f"{report['name']} ({report['symbol']})"),
+                                generated=escape(report['generated']), body='\n'.join(parts))
+
+
+def _table_page(pdf, title, rows, columns=None):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(11, 8.5))
+    ax.axis('off')
+    ax.set_title(title, loc='left')
+    if rows:
+        table = ax.table(cellText=[[str(cell) for cell in row] for row in rows], colLabels=columns, loc='upper left')
+        table.auto_set_font_size(False)
+        table.set_fontsize(7 if len(rows) > 25 else 9)
+        table.auto_set_column_width(list(range(len(rows[0]))))
+    pdf.savefig(fig)
+    plt.close(fig)
+
+
+def to_pdf(report, path):
+    """
+    Write a report as a PDF file, one page per table or chart
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    title = f"{report['name']} ({report['symbol']})"
+    with PdfPages(path) as pdf:
+        if 'summary' in report:
+            summary = report['summary']
+            rows = list(summary['trading'].items()) + list(summary['valuation'].items())
+            _table_page(pdf, f"{title} - Summary, generated {report['generated']}", rows)
+            fig = _price_figure(summary['history'], f'{title} - Last year')
+            pdf.savefig(fig)
+            plt.close(fig)
+        for label, view in report.get('financials', {}).items():
+            rows = [[index] + list(values) for index, values in zip(view.index, view.to_numpy())]
+            _table_page(pdf, f"{title} - {' / '.join(label)}", rows, [''] + [str(column) for column in view.columns])
+        if 'forecasting' in report:
+            forecast = report['forecasting']
+            fig = forecast['simulation'].plot_simulation_price()
+            fig.suptitle(f"{title} - Monte Carlo simulation, next {forecast['time_horizon']} days. VaR at "
+                         f"{forecast['confidence']:.0%} confidence interval is {forecast['value_at_risk']:.2f} USD")
+            pdf.savefig(fig)
+            plt.close(fig)
+        if report.get('sustainability'):
+            rows = [(key.replace('_', ' ').capitalize(), value) for key, value in report['sustainability'].items()]
+            _table_page(pdf, f'{title} - Sustainability', rows)
+        if report['errors']:
+            _table_page(pdf, f'{title} - Unavailable sections', list(report['errors'].items()))
+
+
+def generate(symbol, output, formats=FORMATS, sections=SECTIONS, time_horizon=30, n_simulation=1000, seed=1024):
+    """
+    Build the report of one ticker and write it in each format. Returns
+    the status of the ticker: files written, errors and seconds taken
+
+    Parameters
+    ----------
+    symbol: str
+        The ticker symbol
+
+    output: str
+        Output directory
+
+    formats: tuple
+        Valid formats: json, html, pdf
+        Default: all
+
+    sections: tuple
+        Report sections, see reports.build_report
+        Default: all
+
+    time_horizon, n_simulation, seed:
+        As in MonteCarlo
+    """
+    start = time.perf_counter()
+    status = {'symbol': symbol, 'files': {}, 'errors': {}}
+    try:
+        report = build_report(symbol, sections, time_horizon=time_horizon, n_simulation=n_simulation, seed=seed)
+        status['name'] = report['name']
+        status['errors'].update(report['errors'])
+        for fmt in formats:
+            path = os.path.join(output, f'{symbol}.{fmt}')
+            if fmt == 'pdf':
+                to_pdf(report, path)
+            else:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(to_json(report) if fmt == 'json' else to_html(report))
+            status['files'][fmt] = os.path.basename(path)
+    except Exception as e:
+        logger.warning('%s failed: %r', symbol, e)
+        status['errors']['report'] = repr(e)
+    status['seconds'] = time.perf_counter() - start
+    return status
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _generate_task(args):
+    return generate(*args)
+
+
+def write_index(output, statuses):
+    """
+    Write index.json and index.html listing the reports of a run
+    """
+    with open(os.path.join(output, 'index.json'), 'w') as f:
+        json.dump(statuses, f, indent=1)
+    rows = ''.join(f"<tr><td><b>{escape(status['symbol'])}</b></td><td>{escape(status.get('name', ''))}</td><td>"
+                   + ' '.join(f"<a href='{escape(name)}'>{fmt}</a>" for fmt, name in status['files'].items())
+                   + f"</td><td>{escape(', '.join(status['errors']))}</td></tr>"
+                   for status in statuses)
+    table = f"<table><tr><th>Symbol</th><th>Name</th><th>Reports</th><th>Unavailable</th></tr>{rows}</table>"
+    with open(os.path.join(output, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(HTML_TEMPLATE.format(title='Ticker reports', generated=escape(date.today().isoformat()), body=table))
+
+
+def run_batch(symbols, output, formats=FORMATS, sections=SECTIONS, workers=None, time_horizon=30,
+              n_simulation=1000, seed=1024):
+    """
+    Generate the reports of all symbols on worker processes and write the
+    index. Returns the status of each ticker, in symbol order
+
+    Parameters
+    ----------
+    symbols: list
+        Ticker symbols
+
+    output: str
+        Output directory
+
+    workers: int
+        Worker processes. Default: the number of CPUs
+
+    Other parameters as in generate
+    """
+    os.makedirs(output, exist_ok=True)
+    prune_simulations()
+    tasks = [(symbol, output, tuple(formats), tuple(sections), time_horizon, n_simulation, seed)
+             for symbol in symbols]
+    statuses = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(_generate_task, task) for task in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            status = future.result()
+            statuses.append(status)
+            logger.info('[%d/%d] %s in %.1fs%s', done, len(tasks), status['symbol'], status['seconds'],
+                        f" ({', '.join(status['errors'])} unavailable)" if status['errors'] else '')
+    statuses.sort(key=lambda status: status['symbol'])
+    write_index(output, statuses)
+    return statuses
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Generate ticker reports without the Streamlit server')
+    parser.add_argument('--symbols', nargs='*', help='Tickers to report on')
+    parser.add_argument('--symbols-file', help='File with one ticker per line')
+    parser.add_argument('--formats', nargs='*', default=list(FORMATS), choices=FORMATS, help='Output formats')
+    parser.add_argument('--sections', nargs='*', default=list(SECTIONS), choices=SECTIONS, help='Report sections')
+    parser.add_argument('--output', default=os.path.join('reports', date.today().isoformat()),
+                        help='Output directory. Default: reports/<today>')
+    parser.add_argument('--workers', type=int, help='Worker processes. Default: the number of CPUs')
+    parser.add_argument('--time-horizon', type=int, default=30, help='Monte Carlo horizon in days')
+    parser.add_argument('--n-simulation', type=int, default=1000, help='Monte Carlo paths')
+    parser.add_argument('--seed', type=int, default=1024, help='Seed for random number generator')
+    args = parser.parse_args()
+
+    symbols = list(args.symbols or [])
+    if args.symbols_file:
+        with open(args.symbols_file) as f:
+            symbols += [line.strip().upper() for line in f if line.strip() and not line.startswith('#')]
+    if not symbols:
+        from market_data import sp500_tickers
+        symbols = list(sp500_tickers())
+    started = time.perf_counter()
+    statuses = run_batch(symbols, args.output, args.formats, args.sections, args.workers, args.time_horizon,
+                         args.n_simulation, args.seed)
+    failed = [status['symbol'] for status in statuses if 'report' in status['errors']]
+    logger.info('%d reports in %s in %.0fs, %d failed', len(statuses) - len(failed), args.output,
+                time.perf_counter() - started, len(failed))
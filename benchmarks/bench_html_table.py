@@ -0,0 +1,75 @@
+"""
+Compare the pandas Styler table path with html_table.
+
+Run from the repository root:
+    python benchmarks/bench_html_table.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_table import render_frame, render_table  # noqa: E402
+
+
+SUMMARY_CONTENT = {
+    "Previous Close": "241.01", "Open": "242.21", "Bid": "240.9 x 1000", "Ask": "241.1 x 1100",
+    "Days's Range": "239.58 - 243.8", "52 Week Range": "213.43 - 349.67",
+    "Volume": "21,114,402", "Average Volume": "29,827,451",
+}
+
+HOLDERS = pd.DataFrame({
+    'Holder': [f'Holder {i}' for i in range(10)],
+    'Shares': np.arange(10) * 1_000_000,
+    'Date Reported': pd.date_range('2022-09-30', periods=10, freq='D'),
+    '% Out': np.linspace(0.01, 0.08, 10),
+    'Value': np.arange(10) * 250_000_000,
+})
+
+
+def _hide(styler, columns):
+    """
+    Hide index (and optionally columns) on both old and new pandas
+    """
+    if hasattr(styler, 'hide_index'):
+        styler = styler.hide_index()
+        return styler.hide_columns() if columns else styler
+    styler = styler.hide(axis='index')
+    return styler.hide(axis='columns') if columns else styler
+
+
+def styler_summary():
+    df = pd.Series(SUMMARY_CONTENT).reset_index()
+    s = df.style.set_properties(subset=[0], **{'font-weight': 'bold', 'text-align': 'right'})
+    return _hide(s, columns=True).to_html()
+
+
+def template_summary():
+    return render_table(SUMMARY_CONTENT.items(), bold=[1], align={1: 'right'})
+
+
+def styler_holders():
+    s = HOLDERS.style.set_properties(subset=['Holder', '% Out'], **{'font-weight': 'bold', 'text-align': 'right'})
+    return _hide(s, columns=False).to_html()
+
+
+def template_holders():
+    return render_frame(HOLDERS, bold=['Holder', '% Out'], align={'Holder': 'right', '% Out': 'right'})
+
+
+def bench(func, number=200):
+    """
+    Return the best mean time per call in microseconds
+    """
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+if __name__ == '__main__':
+    for name, old, new in [('summary', styler_summary, template_summary),
+                           ('holders', styler_holders, template_holders)]:
+        t_old, t_new = bench(old), bench(new)
+        print(f'{name:8s} styler {t_old:9.1f} us  template {t_new:9.1f} us  speedup {t_old/t_new:6.1f}x')
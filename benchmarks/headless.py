@@ -0,0 +1,377 @@
+"""
+Headless stand-in for the parts of the streamlit API used by the pages.
+
+Streamlit 1.14 has no way to run a script without a browser session, so
+the load test installs this module as `streamlit` and executes the page
+scripts itself, the same way the Streamlit script runner does: the page
+code is compiled once and executed as a fresh __main__ module on every
+rerun, on the thread of the session.
+
+Each simulated user is a `Session` holding its own session state, widget
+values and on_change callbacks. Widgets return the scripted value of the
+session or their default. Elements do the serialization work Streamlit
+does before sending them to the browser (plotly figures to JSON, pyplot
+figures to PNG, DataFrames to Arrow) so reruns cost about what they cost
+in the server, minus the websocket.
+"""
+from contextlib import contextmanager
+from datetime import date
+import io
+import json
+import sys
+import threading
+import types
+
+__version__ = '1.14.1+headless'
+
+_local = threading.local()
+_code = {}
+_code_lock = threading.Lock()
+
+
+class StopScript(Exception):
+    """
+    Raised by st.stop() to end the current rerun
+    """
+
+
+class RerunScript(Exception):
+    """
+    Raised by st.experimental_rerun() to end the current rerun. The load
+    test runs the next rerun on its own schedule
+    """
+
+
+class Session(object):
+    """
+    State of one simulated browser session
+
+    Parameters
+    ----------
+    session_id: int
+        Identifier of the session
+    """
+    def __init__(self, session_id):
+        self.id = session_id
+        self.state = {}
+        self.widgets = {}
+        self.keyed = set()
+        self.callbacks = {}
+        self.query_params = {}
+
+    @contextmanager
+    def activate(self):
+        """
+        Make this the session of the current thread
+        """
+        previous = getattr(_local, 'session', None)
+        _local.session = self
+        try:
+            yield self
+        finally:
+            _local.session = previous
+
+
+def current_session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        raise RuntimeError('No headless session is active on this thread')
+    return session
+
+
+def run_script(session, path):
+    """
+    Execute a page script once as __main__ for a session
+
+    Parameters
+    ----------
+    session: Session
+        The simulated session
+
+    path: str
+        Path of the page script
+    """
+    with _code_lock:
+        code = _code.get(path)
+        if code is None:
+            with open(path, encoding='utf-8') as f:
+                code = _code[path] = compile(f.read(), path, 'exec')
+    module = types.ModuleType('__main__')
+    module.__file__ = path
+    with session.activate():
+        try:
+            exec(code, module.__dict__)
+        except (StopScript, RerunScript):
+            pass
+
+
+def interact(session, widget, value):
+    """
+    Change a widget value the way the browser does: set the value and
+    run its on_change callback before the next rerun. Buttons are
+    clicked by passing True
+
+    Parameters
+    ----------
+    session: Session
+        The simulated session
+
+    widget: str
+        Widget key, or label for widgets without a key
+
+    value: object
+        The new value
+    """
+    store = session.state if widget in session.keyed else session.widgets
+    if store.get(widget) == value:
+        return
+    store[widget] = value
+    callback = session.callbacks.get(widget)
+    if callback is not None:
+        func, args, kwargs = callback
+        with session.activate():
+            func(*args, **kwargs)
+
+
+class _SessionState(object):
+    """
+    st.session_state of the session running on the current thread
+    """
+    def __getattr__(self, name):
+        try:
+            return current_session().state[name]
+        except KeyError:
+            raise AttributeError(f'st.session_state has no attribute "{name}"') from None
+
+    def __setattr__(self, name, value):
+        current_session().state[name] = value
+
+    def __delattr__(self, name):
+        del current_session().state[name]
+
+    def __getitem__(self, name):
+        return current_session().state[name]
+
+    def __setitem__(self, name, value):
+        current_session().state[name] = value
+
+    def __delitem__(self, name):
+        del current_session().state[name]
+
+    def __contains__(self, name):
+        return name in current_session().state
+
+    def __iter__(self):
+        return iter(list(current_session().state))
+
+    def __len__(self):
+        return len(current_session().state)
+
+    def get(self, name, default=None):
+        return current_session().state.get(name, default)
+
+
+def _marshal_figure(fig):
+    import plotly.utils
+    json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def _marshal_frame(data):
+    import pandas as pd
+    if hasattr(data, '_compute') and hasattr(data, 'data'):
+        ## pandas Styler: Streamlit computes the styles and sends the data
+        data._compute()
+        data = data.data
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    if not isinstance(data, pd.DataFrame):
+        return
+    try:
+        import pyarrow as pa
+    except ImportError:
+        data.to_json()
+        return
+    try:
+        table = pa.Table.from_pandas(data)
+    except (pa.ArrowException, TypeError, ValueError):
+        table = pa.Table.from_pandas(data.astype(str))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _marshal(value):
+    if hasattr(value, 'to_plotly_json'):
+        _marshal_figure(value)
+    elif hasattr(value, 'savefig'):
+        _pyplot(value, False)
+    else:
+        _marshal_frame(value)
+
+
+def _pyplot(fig, clear_figure):
+    fig.savefig(io.BytesIO(), format='png')
+    if clear_figure:
+        fig.clf()
+
+
+class _Container(object):
+    """
+    Layout block. Elements and widgets can be called on it directly
+    or inside a with block, like a Streamlit DeltaGenerator
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    ## Layout
+    def columns(self, spec, gap=None):
+        return [_Container() for _ in range(spec if isinstance(spec, int) else len(spec))]
+
+    def tabs(self, tabs):
+        return [_Container() for _ in tabs]
+
+    def empty(self):
+        return _Container()
+
+    def container(self):
+        return _Container()
+
+    def expander(self, label, expanded=False):
+        return _Container()
+
+    ## Text and media elements
+    def _text(self, body=None, *args, **kwargs):
+        return self
+
+    markdown = text = header = subheader = title = caption = code = latex = _text
+    info = success = warning = error = exception = metric = _text
+
+    def write(self, *args, **kwargs):
+        for value in args:
+            _marshal(value)
+        return self
+
+    def table(self, data=None):
+        _marshal_frame(data)
+        return self
+
+    def dataframe(self, data=None, width=None, height=None, use_container_width=False):
+        _marshal_frame(data)
+        return self
+
+    def plotly_chart(self, figure_or_data, use_container_width=False, sharing='streamlit', theme=None, **kwargs):
+        _marshal_figure(figure_or_data)
+        return self
+
+    def pyplot(self, fig=None, clear_figure=None, **kwargs):
+        if fig is None:
+            import matplotlib.pyplot as plt
+            fig = plt.gcf()
+            clear_figure = True if clear_figure is None else clear_figure
+        _pyplot(fig, clear_figure)
+        return self
+
+    ## Widgets
+    def _widget(self, label, default, key=None, on_change=None, args=None, kwargs=None, options=None):
+        session = current_session()
+        widget = key or label
+        if key:
+            session.keyed.add(key)
+        if on_change is not None:
+            session.callbacks[widget] = (on_change, args or (), kwargs or {})
+        store = session.state if key else session.widgets
+        value = store.get(widget, default)
+        if options is not None and value not in options:
+            value = default
+        store[widget] = value
+        return value
+
+    def selectbox(self, label, options, index=0, format_func=str, key=None, help=None, on_change=None,
+                  args=None, kwargs=None, disabled=False, label_visibility='visible'):
+        options = list(options)
+        return self._widget(label, options[index] if options else None, key, on_change, args, kwargs, options)
+
+    radio = selectbox
+
+    def multiselect(self, label, options, default=None, format_func=str, key=None, help=None, on_change=None,
+                    args=None, kwargs=None, disabled=False, label_visibility='visible'):
+        return self._widget(label, list(default or []), key, on_change, args, kwargs)
+
+    def checkbox(self, label, value=False, key=None, help=None, on_change=None, args=None, kwargs=None,
+                 disabled=False, label_visibility='visible'):
+        return self._widget(label, bool(value), key, on_change, args, kwargs)
+
+    def date_input(self, label, value=None, min_value=None, max_value=None, key=None, help=None,
+                   on_change=None, args=None, kwargs=None, disabled=False, label_visibility='visible'):
+        return self._widget(label, value if value is not None else date.today(), key, on_change, args, kwargs)
+
+    def slider(self, label, min_value=None, max_value=None, value=None, step=None, format=None, key=None,
+               help=None, on_change=None, args=None, kwargs=None, disabled=False, label_visibility='visible'):
+        return self._widget(label, value if value is not None else min_value, key, on_change, args, kwargs)
+
+    def number_input(self, label, min_value=None, max_value=None, value=None, step=None, format=None, key=None,
+                     help=None, on_change=None, args=None, kwargs=None, disabled=False,
+                     label_visibility='visible'):
+        default = value if value is not None else (min_value if min_value is not None else 0)
+        return self._widget(label, default, key, on_change, args, kwargs)
+
+    def text_input(self, label, value='', max_chars=None, key=None, type='default', help=None,
+                   on_change=None, args=None, kwargs=None, placeholder=None, disabled=False,
+                   label_visibility='visible'):
+        return self._widget(label, value, key, on_change, args, kwargs)
+
+    def button(self, label, key=None, help=None, on_click=None, args=None, kwargs=None, type='secondary',
+               disabled=False):
+        session = current_session()
+        widget = key or label
+        if on_click is not None:
+            session.callbacks[widget] = (on_click, args or (), kwargs or {})
+        return bool(session.widgets.pop(widget, False))
+
+
+_main = _Container()
+sidebar = _Container()
+session_state = _SessionState()
+
+for _name in ('columns', 'tabs', 'empty', 'container', 'expander', 'markdown', 'text', 'header',
+              'subheader', 'title', 'caption', 'code', 'latex', 'info', 'success', 'warning', 'error',
+              'exception', 'metric', 'write', 'table', 'dataframe', 'plotly_chart', 'pyplot', 'selectbox',
+              'radio', 'multiselect', 'checkbox', 'date_input', 'slider', 'number_input', 'text_input',
+              'button'):
+    globals()[_name] = getattr(_main, _name)
+
+
+def set_page_config(page_title=None, page_icon=None, layout='centered', initial_sidebar_state='auto',
+                    menu_items=None):
+    pass
+
+
+@contextmanager
+def spinner(text='In progress...'):
+    yield
+
+
+def stop():
+    raise StopScript()
+
+
+def experimental_rerun():
+    raise RerunScript()
+
+
+def experimental_get_query_params():
+    return {name: list(values) for name, values in current_session().query_params.items()}
+
+
+def __getattr__(name):
+    raise AttributeError(f'st.{name} is not available in the headless load test')
+
+
+def install():
+    """
+    Register this module as `streamlit` so page imports resolve to it
+    """
+    sys.modules['streamlit'] = sys.modules[__name__]
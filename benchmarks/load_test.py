@@ -0,0 +1,287 @@
+"""
+Multi-session load test for Summary.py and the pages/ scripts.
+
+Simulates many concurrent users in one process, like one Streamlit
+server: every session runs on its own thread and reruns page scripts
+through the headless streamlit stand-in in benchmarks/headless.py. Data
+comes from recorded fixtures through the replay backend, so the run
+needs no network and upstream fetches can be counted exactly.
+
+Each session starts on the Summary page with a random recorded ticker
+and performs a random sequence of actions with think time in between:
+    page      switch to another page
+    ticker    pick another ticker in the sidebar
+    widget    change an input of the page (interval, chart type,
+              number of simulations, time horizon, screener sort)
+    tab       switch tabs. Streamlit renders all tabs on every rerun,
+              so this costs no rerun and is only counted
+
+Record fixtures first with replay_backend.py, then from the repository
+root:
+
+    python benchmarks/load_test.py --sessions 100 --actions 20 --think 1
+
+The report has, per page, the rerun latency percentiles, errors and the
+number of upstream fetches by dataset, plus the peak RSS of the process.
+Caches start cold in a temporary directory unless --warm is given.
+"""
+import argparse
+from collections import Counter, defaultdict
+import glob
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## Widget values a session may pick per page, by widget label
+PAGE_WIDGETS = {
+    'Chart': {'Interval': ('1 Day', '5 Day', '1 Week', '1 Month', '3 Month'),
+              'Chart Type': ('line', 'candle')},
+    'Forecasting': {'Number of Simulations': (250, 500, 1000),
+                    'Time Horizon': (30, 60, 90)},
+    'Screener': {'Sort by': ('Market Cap', 'P/E', 'Dividend Yield', 'Upside to Target'),
+                 'Ascending': (False, True),
+                 'Rows': (25, 50, 100, 500)},
+}
+INTRADAY_OPTIONS = ('1 Minute', '2 Minute', '5 Minute', '15 Minute', '30 Minute', '60 Minute', '90 Minute')
+TAB_PAGES = ('Summary', 'Chart', 'Financials')
+
+## Relative frequency of the actions
+ACTION_WEIGHTS = {'page': 3, 'ticker': 2, 'widget': 3, 'tab': 2}
+
+
+def discover_pages():
+    """
+    Return the page scripts by page name, Summary first
+    """
+    pages = {'Summary': os.path.join(ROOT, 'Summary.py')}
+    for path in sorted(glob.glob(os.path.join(ROOT, 'pages', '*.py'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        pages[name.split('_', 1)[-1]] = path
+    return pages
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of sorted values
+    """
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def peak_rss():
+    """
+    Peak resident set size of the process in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class LoadStats(object):
+    """
+    Rerun latencies, fetches and errors per page, shared by all sessions
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.fetches = defaultdict(Counter)
+        self.errors = Counter()
+        self.error_samples = {}
+        self.actions = Counter()
+
+    def record(self, page, seconds, fetched, error=None):
+        with self._lock:
+            self.latencies[page].append(seconds)
+            self.fetches[page].update(fetched)
+            if error is not None:
+                self.errors[page] += 1
+                self.error_samples.setdefault(page, error)
+
+    def action(self, kind):
+        with self._lock:
+            self.actions[kind] += 1
+
+    def report(self):
+        """
+        Return the per-page summary
+        """
+        pages = {}
+        with self._lock:
+            for page, latencies in self.latencies.items():
+                latencies = sorted(latencies)
+                fetched = self.fetches[page]
+                pages[page] = {'reruns': len(latencies), 'errors': self.errors[page],
+                               'p50': percentile(latencies, 0.5), 'p95': percentile(latencies, 0.95),
+                               'p99': percentile(latencies, 0.99), 'max': latencies[-1],
+                               'mean': sum(latencies) / len(latencies),
+                               'fetches': sum(fetched.values()), 'fetches_by_dataset': dict(fetched),
+                               'error_sample': self.error_samples.get(page)}
+        return pages
+
+
+def scenario(rng, pages, tickers, n_actions, intraday=False):
+    """
+    Random sequence of (action, target, value) steps for one session
+
+    Parameters
+    ----------
+    rng: random.Random
+        Random generator of the session
+
+    pages: list
+        Page names
+
+    tickers: list
+        Ticker symbols with fixtures
+
+    n_actions: int
+        Number of steps
+
+    intraday: bool
+        Also pick intraday chart intervals
+    """
+    page = 'Summary'
+    for _ in range(n_actions):
+        widgets = dict(PAGE_WIDGETS.get(page, {}))
+        if intraday and 'Interval' in widgets:
+            widgets['Interval'] = widgets['Interval'] + INTRADAY_OPTIONS
+        kinds = [kind for kind in ACTION_WEIGHTS
+                 if (kind != 'widget' or widgets) and (kind != 'tab' or page in TAB_PAGES)
+                 and (kind != 'ticker' or len(tickers) > 1)]
+        kind = rng.choices(kinds, [ACTION_WEIGHTS[kind] for kind in kinds])[0]
+        if kind == 'page':
+            page = rng.choice([name for name in pages if name != page])
+            yield 'page', page, None
+        elif kind == 'ticker':
+            yield 'ticker', 'ticker', rng.choice(tickers)
+        elif kind == 'widget':
+            label = rng.choice(sorted(widgets))
+            yield 'widget', label, rng.choice(widgets[label])
+        else:
+            yield 'tab', page, None
+
+
+def run_session(session_id, args, pages, tickers, stats, headless, track_fetches):
+    """
+    Drive one simulated user through its scenario
+    """
+    rng = random.Random(args.seed * 100003 + session_id)
+    session = headless.Session(session_id)
+    session.state['ticker'] = rng.choice(tickers)
+    page = 'Summary'
+
+    def rerun():
+        error = None
+        with track_fetches() as fetched:
+            start = time.perf_counter()
+            try:
+                headless.run_script(session, pages[page])
+            except Exception:
+                error = traceback.format_exc()
+            elapsed = time.perf_counter() - start
+        stats.record(page, elapsed, fetched, error)
+
+    rerun()
+    for kind, target, value in scenario(rng, list(pages), tickers, args.actions, args.intraday):
+        if args.think:
+            time.sleep(rng.uniform(0, 2 * args.think))
+        stats.action(kind)
+        if kind == 'page':
+            page = target
+        elif kind == 'tab':
+            continue
+        else:
+            headless.interact(session, target, value)
+        rerun()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the dashboard pages with simulated sessions')
+    parser.add_argument('--sessions', type=int, default=100, help='Number of concurrent sessions')
+    parser.add_argument('--actions', type=int, default=20, help='Actions per session')
+    parser.add_argument('--think', type=float, default=1.0, help='Mean think time between actions in seconds')
+    parser.add_argument('--ramp', type=float, default=10.0, help='Seconds over which sessions are started')
+    parser.add_argument('--pages', nargs='*', help='Only visit these pages. Default: all')
+    parser.add_argument('--tickers', nargs='*', help='Tickers to pick from. Default: all recorded tickers')
+    parser.add_argument('--intraday', action='store_true', help='Also pick intraday chart intervals')
+    parser.add_argument('--fixtures', help='Fixture directory. Default: FD_FIXTURE_DIR or fixtures/')
+    parser.add_argument('--warm', action='store_true', help='Use the configured cache directories')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the scenarios')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args(argv)
+
+    ## Replay fixtures and, unless warm, start from empty caches
+    os.environ['FD_DATA_BACKEND'] = 'replay'
+    if args.fixtures:
+        os.environ['FD_FIXTURE_DIR'] = os.path.abspath(args.fixtures)
+    if not args.warm:
+        scratch = tempfile.mkdtemp(prefix='fd_load_')
+        os.environ['FD_CACHE_DIR'] = os.path.join(scratch, 'cache')
+        os.environ['FD_SHARED_DIR'] = os.path.join(scratch, 'shared')
+    sys.path.insert(0, ROOT)
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import headless
+    headless.install()
+    from replay_backend import fetch_counts, get_fixture_store, track_fetches
+    from data_cache import get_cache
+
+    tickers = args.tickers or get_fixture_store().symbols()
+    if not tickers:
+        parser.error('no recorded tickers, record fixtures with replay_backend.py first')
+    pages = discover_pages()
+    if args.pages:
+        pages = {name: path for name, path in pages.items() if name in args.pages or name == 'Summary'}
+
+    stats = LoadStats()
+    rss_before = peak_rss()
+    threads = []
+    started = time.perf_counter()
+    for session_id in range(args.sessions):
+        thread = threading.Thread(target=run_session, name=f'session-{session_id}', daemon=True,
+                                  args=(session_id, args, pages, tickers, stats, headless, track_fetches))
+        thread.start()
+        threads.append(thread)
+        if args.ramp and args.sessions > 1:
+            time.sleep(args.ramp / args.sessions)
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    pages_report = stats.report()
+    reruns = sum(page['reruns'] for page in pages_report.values())
+    report = {'sessions': args.sessions, 'actions': dict(stats.actions), 'reruns': reruns,
+              'wall_seconds': wall, 'reruns_per_second': reruns / wall,
+              'peak_rss_bytes': peak_rss(), 'peak_rss_before_load_bytes': rss_before,
+              'fetches': sum(fetch_counts.values()), 'cache': get_cache().stats(), 'pages': pages_report}
+
+    print(f'\n{"page":15s} {"reruns":>7s} {"errors":>7s} {"p50 ms":>9s} {"p95 ms":>9s} {"p99 ms":>9s} '
+          f'{"max ms":>9s} {"fetches":>8s}')
+    for name in pages:
+        page = pages_report.get(name)
+        if page is None:
+            continue
+        print(f'{name:15s} {page["reruns"]:7d} {page["errors"]:7d} {page["p50"]*1000:9.1f} '
+              f'{page["p95"]*1000:9.1f} {page["p99"]*1000:9.1f} {page["max"]*1000:9.1f} {page["fetches"]:8d}')
+    print(f'\n{reruns} reruns in {wall:.1f}s ({reruns / wall:.1f}/s), '
+          f'peak RSS {report["peak_rss_bytes"] / 2**20:.0f} MB '
+          f'({rss_before / 2**20:.0f} MB before load), {report["fetches"]} upstream fetches')
+    for name, page in pages_report.items():
+        if page['error_sample']:
+            print(f'\nFirst error on {name}:\n{page["error_sample"]}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, default=str)
+    return 1 if any(page['errors'] for page in pages_report.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Benchmark suite for the dashboard hot paths.
+
+Runs against recorded fixtures through the replay backend, so results
+measure our code and not Yahoo. Record fixtures first with
+replay_backend.py, or pass --synthetic to generate them, then from the
+repository root:
+
+    python benchmarks/run.py --symbol MSFT --output results.json
+    python benchmarks/run.py --symbol MSFT --save-baseline
+    python benchmarks/run.py --symbol MSFT --baseline benchmarks/baseline.json --threshold 0.2
+
+Timings only compare on the same machine, so no baseline is kept in the
+repository. CI runs the regression gate in one step: --against runs the
+suite of the base revision in a temporary git worktree, then the
+current tree, on the same synthetic fixtures, and fails on regressions:
+
+    python benchmarks/run.py --synthetic --against origin/main --threshold 0.2
+
+Cases are parameterized over Monte Carlo path counts and horizons and
+over history lengths from 1M to MAX. Each case is run until it has taken
+at least --min-time seconds (at least --min-repeats times). The median
+time is compared against the baseline and the run fails when any case is
+slower than the baseline by more than the threshold.
+"""
+import argparse
+from datetime import timedelta
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+PERIODS = ('1mo', '6mo', 'ytd', '1y', '5y', 'max')
+PATHS = (250, 500, 1000)
+HORIZONS = (30, 60, 90)
+
+
+def _load_page(name, filename):
+    """
+    Import a page script as a module. The page body only runs
+    under __main__, so this only defines its functions
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, 'pages', filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def cases(symbol):
+    """
+    Yield (name, function) benchmark cases for a ticker
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    import Summary
+    from market_data import TickerHandle
+    from monte_carlo import MonteCarlo
+
+    chart = _load_page('chart_page', '1_Chart.py')
+    handle = TickerHandle(symbol)
+
+    for period in PERIODS:
+        data = handle.history(period=period, interval='1d')
+        yield f'chart.create_chart[line-{period}]', lambda data=data: chart.create_chart(data, 'line', 50)
+        yield f'chart.create_chart[candle-{period}]', lambda data=data: chart.create_chart(data, 'candle', 50, name=symbol)
+        yield f'summary.create_chart[{period}]', lambda data=data: Summary.create_chart(data)
+
+    info = {"Previous Close": "241.01", "Open": "242.21", "Bid": "240.9 x 1000", "Ask": "241.1 x 1100",
+            "Days's Range": "239.58 - 243.8", "52 Week Range": "213.43 - 349.67",
+            "Volume": "21,114,402", "Average Volume": "29,827,451"}
+    yield 'summary.format_table', lambda: Summary.format_table(info)
+    numbers = [(-1) ** i * 10 ** (i % 15) * 1.2345 for i in range(1000)]
+    yield 'summary.human_format[1000]', lambda: [Summary.human_format(x) for x in numbers]
+
+    ## One year estimation window ending at the last recorded bar
+    end = handle.history(period='max', interval='1d').index[-1].date() + timedelta(days=1)
+    start = end - timedelta(days=365)
+    for n_simulation in PATHS:
+        for time_horizon in HORIZONS:
+            mc = MonteCarlo(ticker=handle, start_date=start, end_date=end,
+                            time_horizon=time_horizon, n_simulation=n_simulation, seed=1024)
+            label = f'{n_simulation}x{time_horizon}'
+            yield f'monte_carlo.run_simulation[{label}]', mc.run_simulation
+            mc.run_simulation()
+            yield f'monte_carlo.value_at_risk[{label}]', mc.value_at_risk
+
+            def plot(mc=mc):
+                plt.close(mc.plot_simulation_price())
+            yield f'monte_carlo.plot_simulation_price[{label}]', plot
+
+
+def measure(func, min_time, min_repeats):
+    """
+    Run func until min_time has passed and it ran at least
+    min_repeats times. Returns the timings in seconds
+    """
+    func()  # warm up
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < min_repeats or time.perf_counter() - started < min_time:
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(symbol, selected=None, min_time=0.5, min_repeats=3):
+    """
+    Run the benchmark cases and return the results document
+
+    Parameters
+    ----------
+    symbol: str
+        Ticker with recorded fixtures
+
+    selected: str
+        Only run cases containing this text
+
+    min_time: float
+        Minimum seconds spent per case
+
+    min_repeats: int
+        Minimum runs per case
+    """
+    results = {}
+    for name, func in cases(symbol):
+        if selected and selected not in name:
+            continue
+        timings = measure(func, min_time, min_repeats)
+        results[name] = {'median': statistics.median(timings), 'min': min(timings),
+                         'mean': statistics.mean(timings), 'repeats': len(timings)}
+        print(f'{name:55s} {results[name]["median"]*1000:10.3f} ms  ({len(timings)} runs)', flush=True)
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    meta = {'symbol': symbol, 'python': platform.python_version(), 'platform': platform.platform(),
+            'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    return {'meta': meta, 'results': results}
+
+
+def compare(results, baseline, threshold):
+    """
+    Return (name, baseline, current, change) for cases slower than
+    baseline by more than threshold, and print the comparison
+
+    Parameters
+    ----------
+    results: dict
+        Current results document
+
+    baseline: dict
+        Baseline results document
+
+    threshold: float
+        Allowed relative slowdown, e.g. 0.2 for 20%
+    """
+    regressions = []
+    print(f'\n{"case":55s} {"baseline":>12s} {"current":>12s} {"change":>8s}')
+    for name, current in sorted(results['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f'{name:55s} {"-":>12s} {current["median"]*1000:9.3f} ms {"new":>8s}')
+            continue
+        change = current['median'] / base['median'] - 1
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f'{name:55s} {base["median"]*1000:9.3f} ms {current["median"]*1000:9.3f} ms {change:+7.1%}{flag}')
+        if change > threshold:
+            regressions.append((name, base['median'], current['median'], change))
+    return regressions
+
+
+def run_revision(revision, argv):
+    """
+    Run the suite of another git revision in a temporary worktree and
+    return its results document
+
+    Parameters
+    ----------
+    revision: str
+        Commit, branch or tag, e.g. origin/main
+
+    argv: list
+        Options passed to its run.py
+    """
+    scratch = tempfile.mkdtemp(prefix='fd_bench_')
+    tree = os.path.join(scratch, 'tree')
+    output = os.path.join(scratch, 'results.json')
+    subprocess.run(['git', 'worktree', 'add', '--detach', tree, revision], cwd=ROOT, check=True,
+                   capture_output=True)
+    try:
+        print(f'Benchmarking {revision}', flush=True)
+        subprocess.run([sys.executable, os.path.join(tree, 'benchmarks', 'run.py'), *argv, '--output', output],
+                       cwd=tree, check=True)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        subprocess.run(['git', 'worktree', 'remove', '--force', tree], cwd=ROOT, capture_output=True)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard hot paths on recorded fixtures')
+    parser.add_argument('--symbol', default='MSFT', help='Ticker with recorded fixtures')
+    parser.add_argument('--fixtures', help='Fixture directory. Default: FD_FIXTURE_DIR or fixtures/')
+    parser.add_argument('--filter', help='Only run cases whose name contains this text')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Minimum seconds per case')
+    parser.add_argument('--min-repeats', type=int, default=3, help='Minimum runs per case')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against this baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative slowdown. Default: 0.2')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Write the results to {DEFAULT_BASELINE}')
+    parser.add_argument('--against', metavar='REVISION',
+                        help='Use the results of this git revision, run on this machine, as the baseline')
+    parser.add_argument('--synthetic', action='store_true',
+                        help='Benchmark on synthetic fixtures for --symbol generated in a temporary directory')
+    args = parser.parse_args(argv)
+    if args.baseline and args.against:
+        parser.error('--baseline and --against are exclusive')
+
+    ## Serve all data from the fixtures and keep the run isolated from shared caches
+    os.environ['FD_DATA_BACKEND'] = 'replay'
+    os.environ.setdefault('FD_SHARED_FRAMES', '0')
+    if args.synthetic:
+        args.fixtures = args.fixtures or tempfile.mkdtemp(prefix='fd_fixtures_')
+    if args.fixtures:
+        os.environ['FD_FIXTURE_DIR'] = os.path.abspath(args.fixtures)
+    sys.path.insert(0, ROOT)
+    if args.synthetic:
+        from replay_backend import FixtureStore, synthetic
+        synthetic([args.symbol], FixtureStore(os.environ['FD_FIXTURE_DIR']))
+
+    baseline = None
+    if args.against:
+        ## Same fixtures and settings for both trees. The other tree resolves its default
+        ## fixture directory inside its worktree, so pass the one of this tree
+        from replay_backend import FIXTURE_DIR
+        options = ['--symbol', args.symbol, '--fixtures', os.path.abspath(FIXTURE_DIR),
+                   '--min-time', str(args.min_time), '--min-repeats', str(args.min_repeats)]
+        baseline = run_revision(args.against, options + (['--filter', args.filter] if args.filter else []))
+        print('Benchmarking the working tree', flush=True)
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run(args.symbol, args.filter, args.min_time, args.min_repeats)
+    for path in filter(None, (args.output, DEFAULT_BASELINE if args.save_baseline else None)):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=1)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} case(s) regressed by more than {args.threshold:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Compact dtypes for price history frames before they are cached.
+
+yfinance returns every OHLCV column as float64 or int64 along with
+mostly-zero Dividends and Stock Splits columns. Compaction stores prices
+as float32 when the round trip error stays below `PRICE_ATOL`, volume as
+uint32 when it fits, drops event columns that are all zero and keeps the
+others as sparse columns. The index becomes a sorted, duplicate-free
+datetime64 DatetimeIndex (8 bytes a bar): object indexes of Timestamps,
+e.g. intraday bars whose UTC offset changes across a DST switch, take
+about 17 times that. This roughly halves the memory of a cached history
+frame.
+"""
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMNS = ('Open', 'High', 'Low', 'Close', 'Adj Close')
+EVENT_COLUMNS = ('Dividends', 'Stock Splits', 'Capital Gains')
+
+## Largest absolute error allowed when storing prices as float32
+PRICE_ATOL = 5e-5
+
+
+def _compact_prices(series, atol):
+    """
+    Downcast a price column to float32 if the round trip
+    error is within atol
+    """
+    values = series.to_numpy(dtype='float64')
+    compact = values.astype('float32')
+    error = np.abs(compact.astype('float64') - values)
+    if not (error > atol).any():
+        return pd.Series(compact, index=series.index, name=series.name)
+    return series
+
+
+def _compact_volume(series):
+    """
+    Downcast volume to the smallest unsigned integer that fits
+    """
+    values = series.to_numpy()
+    if np.issubdtype(values.dtype, np.floating) and (np.isnan(values).any() or (values % 1).any()):
+        return series.astype('float32')
+    if values.size and values.min() < 0:
+        return series
+    upper = values.max() if values.size else 0
+    for dtype in ('uint32', 'uint64'):
+        if upper <= np.iinfo(dtype).max:
+            return series.astype(dtype)
+    return series
+
+
+def _compact_index(index):
+    """
+    Convert a bar index to a datetime64 DatetimeIndex. Timestamps with
+    mixed UTC offsets are converted to their common time zone, or to UTC
+    when they have none
+    """
+    if isinstance(index, pd.DatetimeIndex):
+        return index
+    try:
+        return pd.DatetimeIndex(index, name=index.name)
+    except (TypeError, ValueError):
+        zones = {str(getattr(value, 'tzinfo', None)) for value in index}
+        converted = pd.DatetimeIndex(pd.to_datetime(index, utc=True), name=index.name)
+        tz = getattr(index[0], 'tz', None) if len(zones) == 1 else None
+        return converted.tz_convert(tz) if tz is not None else converted
+
+
+def compact_history(df, atol=PRICE_ATOL):
+    """
+    Return a copy of a price history frame with compact dtypes
+
+    Parameters
+    ----------
+    df: DataFrame
+        Price history as returned by yfinance.Ticker.history
+
+    atol: float
+        Largest absolute price error allowed for float32 storage
+        Default: PRICE_ATOL
+    """
+    if df is None or df.empty:
+        return df
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        if name in PRICE_COLUMNS:
+            columns[name] = _compact_prices(series, atol)
+        elif name == 'Volume':
+            columns[name] = _compact_volume(series)
+        elif name in EVENT_COLUMNS:
+            values = series.to_numpy(dtype='float64')
+            if not np.nan_to_num(values).any():
+                continue
+            columns[name] = pd.Series(pd.arrays.SparseArray(values, fill_value=0.0), index=series.index, name=name)
+        else:
+            columns[name] = series
+    compact = pd.DataFrame(columns, index=df.index)
+    compact.index = _compact_index(compact.index)
+    if not compact.index.is_monotonic_increasing:
+        compact = compact.sort_index(kind='stable')
+    if compact.index.has_duplicates:
+        ## A bar fetched twice while it was forming: keep the later values
+        compact = compact[~compact.index.duplicated(keep='last')]
+    return compact
+
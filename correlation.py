@@ -0,0 +1,317 @@
+"""
+Exponentially weighted return correlations across the ticker universe.
+
+The daily closes of every ticker are aligned into one wide matrix of
+returns (dates x tickers) and reduced to an exponentially weighted mean
+vector and covariance matrix. After that, each new trading day is folded
+in with one rank-one update, O(N^2) for N tickers, instead of
+recomputing from the whole history:
+
+    d     = r - mean
+    mean += (1 - lambda) * d
+    cov   = lambda * (cov + (1 - lambda) * d d')
+
+A ticker without a return on a day contributes no deviation that day.
+The state is saved next to the fundamentals panel and the Chart page
+only reads it. Build it, then update it after each close, from the
+command line:
+
+    python correlation.py --period 2y
+    python correlation.py
+
+The update rebuilds from --period of history when the ticker universe
+changed.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_cache import get_cache
+from fundamentals_panel import PANEL_TTL
+from fundamentals_store import CACHE_DIR
+
+CORRELATION_PATH = os.path.join(CACHE_DIR, 'panel', 'correlation.npz')
+
+## Trading days after which a return has half the weight of today's
+HALFLIFE = 60
+
+logger = logging.getLogger(__name__)
+
+
+def return_matrix(symbols, period='2y', workers=8):
+    """
+    Daily close returns of the tickers aligned on the union of their
+    trading days, one column per ticker. Missing days are missing
+    returns, not zero returns
+
+    Parameters
+    ----------
+    symbols: list
+        Ticker symbols
+
+    period: str
+        History to read, as in yfinance.Ticker.history
+        Default: 2y
+
+    workers: int
+        Concurrent history reads
+        Default: 8
+    """
+    from market_data import TickerHandle
+
+    def close(symbol):
+        try:
+            return TickerHandle(symbol).history(period=period, interval='1d')['Close'].astype('float64')
+        except Exception as e:
+            logger.warning('Skipping %s: %s', symbol, e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        closes = dict(zip(symbols, pool.map(close, symbols)))
+    closes = {symbol: series for symbol, series in closes.items() if series is not None and len(series) > 1}
+    if not closes:
+        return pd.DataFrame()
+    prices = pd.concat(closes, axis=1).sort_index()
+    values = prices.to_numpy()
+    returns = values[1:] / values[:-1] - 1
+    return pd.DataFrame(returns, index=prices.index[1:], columns=prices.columns)
+
+
+class CorrelationMatrix(object):
+    """
+    Exponentially weighted mean and covariance of daily returns
+
+    Parameters
+    ----------
+    symbols: list
+        Ticker symbols, in matrix order
+
+    mean: ndarray
+        Weighted mean return of each ticker
+
+    cov: ndarray
+        Weighted covariance matrix
+
+    halflife: float
+        Halflife of the weights in trading days
+        Default: 60
+
+    last_date: Timestamp
+        Date of the last return folded in
+
+    Methods
+    -------
+
+    from_returns
+        Build the state from a return matrix
+
+    update
+        Fold in the returns of the days after last_date
+
+    correlation
+        Correlation matrix
+
+    peers
+        Most correlated tickers of a ticker
+
+    save, load
+        Write and read the state file
+    """
+    def __init__(self, symbols, mean, cov, halflife=HALFLIFE, last_date=None):
+        self.symbols = np.asarray(symbols, dtype=object)
+        self.positions = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.mean = mean
+        self.cov = cov
+        self.halflife = halflife
+        self.decay = 0.5 ** (1 / halflife)
+        self.last_date = last_date
+        self._correlation = None
+
+    @classmethod
+    def from_returns(cls, returns, halflife=HALFLIFE):
+        """
+        Build the state from a return matrix in one pass, with the
+        weights the updates would have given each day
+
+        Parameters
+        ----------
+        returns: DataFrame
+            Dates x tickers, from return_matrix
+
+        halflife: float
+            Halflife of the weights in trading days
+            Default: 60
+        """
+        values = returns.to_numpy(dtype='float64')
+        decay = 0.5 ** (1 / halflife)
+        weights = decay ** np.arange(len(values) - 1, -1, -1)
+        weights /= weights.sum()
+        present = ~np.isnan(values)
+        ## Weighted mean over the days each ticker has a return
+        mean = np.nansum(values * weights[:, None], axis=0) / np.maximum((present * weights[:, None]).sum(axis=0),
+                                                                           np.finfo('float64').tiny)
+        deviations = np.where(present, values - mean, 0.0)
+        cov = (deviations * weights[:, None]).T @ deviations
+        return cls(list(returns.columns), mean, cov, halflife, returns.index[-1] if len(returns) else None)
+
+    def update(self, returns):
+        """
+        Fold in the returns dated after last_date, one day at a time.
+        Returns the number of days folded in
+
+        Parameters
+        ----------
+        returns: DataFrame
+            Dates x tickers. Tickers outside the matrix are ignored
+        """
+        if self.last_date is not None:
+            returns = returns[returns.index > self.last_date]
+        returns = returns.reindex(columns=self.symbols)
+        weight = 1 - self.decay
+        for day in returns.to_numpy(dtype='float64'):
+            deviation = np.nan_to_num(day - self.mean)
+            self.mean += weight * deviation
+            self.cov += weight * np.outer(deviation, deviation)
+            self.cov *= self.decay
+        if len(returns):
+            self.last_date = returns.index[-1]
+            self._correlation = None
+        return len(returns)
+
+    def correlation(self):
+        """
+        Correlation matrix, missing for tickers without variance
+        """
+        if self._correlation is None:
+            deviation = np.sqrt(np.diag(self.cov))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                correlation = self.cov / np.outer(deviation, deviation)
+            correlation[:, deviation == 0] = np.nan
+            correlation[deviation == 0, :] = np.nan
+            self._correlation = np.clip(correlation, -1, 1)
+        return self._correlation
+
+    def submatrix(self, symbols):
+        """
+        Correlations between the given tickers as a DataFrame
+        """
+        positions = [self.positions[symbol] for symbol in symbols]
+        return pd.DataFrame(self.correlation()[np.ix_(positions, positions)], index=symbols, columns=symbols)
+
+    def peers(self, symbol, k=10):
+        """
+        The k tickers most correlated with symbol, most correlated first,
+        as a Series of correlations. Empty if symbol is not in the matrix
+
+        Parameters
+        ----------
+        symbol: str
+            The ticker symbol
+
+        k: int
+            Number of peers
+            Default: 10
+        """
+        position = self.positions.get(symbol)
+        if position is None:
+            return pd.Series(dtype='float64')
+        row = self.correlation()[position].copy()
+        row[position] = np.nan
+        candidates = np.flatnonzero(~np.isnan(row))
+        k = min(k, len(candidates))
+        if k == 0:
+            return pd.Series(dtype='float64')
+        ## Partial selection of the k largest, then sort only those
+        top = candidates[np.argpartition(-row[candidates], k - 1)[:k]]
+        top = top[np.argsort(-row[top], kind='stable')]
+        return pd.Series(row[top], index=self.symbols[top], name='correlation')
+
+    def save(self, path=CORRELATION_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, symbols=self.symbols.astype(str), mean=self.mean, cov=self.cov,
+                     halflife=self.halflife, last_date=str(self.last_date))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=CORRELATION_PATH):
+        with np.load(path) as data:
+            last_date = str(data['last_date'])
+            return cls(list(data['symbols']), data['mean'], data['cov'], float(data['halflife']),
+                       pd.Timestamp(last_date) if last_date != 'None' else None)
+
+
+def refresh(path=CORRELATION_PATH, symbols=None, period='2y', halflife=HALFLIFE, rebuild=False):
+    """
+    Update the saved state with the days since its last update, or build
+    it from period of history if there is none, the universe changed or
+    rebuild is set. Returns the state
+
+    Parameters
+    ----------
+    path: str
+        Location of the state file
+
+    symbols: list
+        Tickers. Default: the S&P 500 ticker list
+
+    period: str
+        History used for a build
+        Default: 2y
+
+    halflife: float
+        Halflife of the weights in trading days, for a build
+        Default: 60
+
+    rebuild: bool
+        Build even if the saved state can be updated
+        Default: False
+    """
+    from market_data import sp500_tickers
+
+    symbols = sorted({symbol.upper() for symbol in (symbols or sp500_tickers())})
+    matrix = CorrelationMatrix.load(path) if os.path.exists(path) and not rebuild else None
+    if matrix is not None and set(matrix.symbols) == set(symbols) and matrix.last_date is not None:
+        days = matrix.update(return_matrix(symbols, period='1mo'))
+        logger.info('Folded in %d days up to %s', days, matrix.last_date)
+    else:
+        matrix = CorrelationMatrix.from_returns(return_matrix(symbols, period=period), halflife)
+        logger.info('Built from %s of history for %d tickers', period, len(matrix.symbols))
+    matrix.save(path)
+    return matrix
+
+
+def get_matrix(path=CORRELATION_PATH):
+    """
+    Return the saved correlation state, shared by all sessions of the
+    process and reloaded when the file changes, or None if it was not
+    built yet
+
+    Parameters
+    ----------
+    path: str
+        Location of the state file
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    return get_cache().get_or_fetch(('correlation', path, mtime), lambda: CorrelationMatrix.load(path),
+                                    ttl=PANEL_TTL)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Build or update the return correlation matrix')
+    parser.add_argument('--symbols', nargs='*', help='Tickers to include. Default: the S&P 500 list')
+    parser.add_argument('--period', default='2y', help='History used to build the matrix')
+    parser.add_argument('--halflife', type=float, default=HALFLIFE, help='Halflife of the weights in trading days')
+    parser.add_argument('--rebuild', action='store_true', help='Build from --period even if an update is possible')
+    parser.add_argument('--path', default=CORRELATION_PATH, help='State file')
+    args = parser.parse_args()
+    refresh(args.path, args.symbols, args.period, args.halflife, args.rebuild)
@@ -0,0 +1,276 @@
+"""
+Process-wide in-memory cache with an explicit memory budget.
+
+Entries are sized on insert (DataFrames by their deep memory usage) and
+evicted once the total size exceeds the budget. Two eviction policies
+are available: lru evicts the least recently used entry, lfu evicts the
+entry with the fewest hits per byte. Hit, miss and eviction counters
+are kept for monitoring.
+
+The budget defaults to 512 MB and can be set in bytes with the
+FD_CACHE_BYTES environment variable.
+"""
+from collections import OrderedDict
+import os
+import pickle
+import sys
+import threading
+import time
+
+import pandas as pd
+
+DEFAULT_BUDGET = int(os.environ.get('FD_CACHE_BYTES', 512 * 1024 ** 2))
+
+_MISSING = object()
+
+
+def sizeof(value):
+    """
+    Estimate the memory held by a cached value in bytes
+
+    Parameters
+    ----------
+    value: object
+        The cached value
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return sys.getsizeof(value)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class _Entry(object):
+    __slots__ = ('value', 'nbytes', 'expires', 'hits')
+
+    def __init__(self, value, nbytes, expires):
+        self.value = value
+        self.nbytes = nbytes
+        self.expires = expires
+        self.hits = 0
+
+
+class DataCache(object):
+    """
+    Thread-safe, memory-budgeted key-value cache
+
+    Parameters
+    ----------
+    budget: int
+        Maximum total size of the cached values in bytes
+        Default: FD_CACHE_BYTES or 512 MB
+
+    policy: str
+        Eviction policy.
+        Valid policies: lru, lfu
+        Default: lru
+
+    Methods
+    -------
+
+    get
+        Return a cached value or a default
+
+    put
+        Insert a value, evicting entries to stay within budget
+
+    get_or_fetch
+        Return a cached value, fetching and caching it on a miss.
+        Concurrent misses on the same key fetch only once
+
+    discard
+        Remove an entry
+
+    stats
+        Counters and current usage
+    """
+    def __init__(self, budget=DEFAULT_BUDGET, policy='lru'):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f'Unknown eviction policy {policy!r}. Valid policies: lru, lfu')
+        self.budget = budget
+        self.policy = policy
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._fetch_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
+
+    def _lookup(self, key):
+        """
+        Return the live entry for key or None. Caller holds the lock
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires is not None and entry.expires <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.nbytes -= entry.nbytes
+
+    def _victim(self):
+        """
+        Key of the entry to evict next. Caller holds the lock
+        """
+        if self.policy == 'lru':
+            return next(iter(self._entries))
+        ## Fewest hits per byte, oldest first on ties
+        return min(self._entries, key=lambda key: (self._entries[key].hits + 1) / max(self._entries[key].nbytes, 1))
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default on a miss
+
+        Parameters
+        ----------
+        key: hashable
+            The cache key
+
+        default: object
+            Value returned on a miss
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            entry.hits += 1
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def put(self, key, value, ttl=None, nbytes=None):
+        """
+        Insert or replace a value. Values larger than the whole
+        budget are not cached
+
+        Parameters
+        ----------
+        key: hashable
+            The cache key
+
+        value: object
+            The value to cache
+
+        ttl: float
+            Seconds until the entry expires. None never expires
+
+        nbytes: int
+            Size of the value. Default: estimated with sizeof
+        """
+        nbytes = sizeof(value) if nbytes is None else nbytes
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if nbytes > self.budget:
+                self.rejections += 1
+                return
+            while self._entries and self.nbytes + nbytes > self.budget:
+                self._remove(self._victim())
+                self.evictions += 1
+            self._entries[key] = _Entry(value, nbytes, expires)
+            self.nbytes += nbytes
+
+    def get_or_fetch(self, key, fetch, ttl=None):
+        """
+        Return the cached value for key, calling fetch() and caching
+        the result on a miss
+
+        Parameters
+        ----------
+        key: hashable
+            The cache key
+
+        fetch: callable
+            Function without arguments returning the value
+
+        ttl: float
+            Seconds until the fetched entry expires. None never expires
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+        try:
+            with fetch_lock:
+                with self._lock:
+                    entry = self._lookup(key)
+                if entry is not None:
+                    return entry.value
+                value = fetch()
+                self.put(key, value, ttl)
+                return value
+        finally:
+            with self._lock:
+                self._fetch_locks.pop(key, None)
+
+    def discard(self, key):
+        """
+        Remove key from the cache if present
+
+        Parameters
+        ----------
+        key: hashable
+            The cache key
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        """
+        Remove all entries. Counters are kept
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def stats(self):
+        """
+        Return the cache counters and current memory usage
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.nbytes, 'budget': self.budget,
+                    'policy': self.policy, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'expirations': self.expirations,
+                    'rejections': self.rejections}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the process-wide DataCache
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DataCache(policy=os.environ.get('FD_CACHE_POLICY', 'lru'))
+        return _cache
@@ -0,0 +1,268 @@
+"""
+Per-industry ESG peer index for the ticker universe.
+
+Yahoo returns a single universe percentile with the sustainability data
+of a ticker. To compare a company with its industry, the ESG risk
+scores of every ticker (total, environment, social, governance and
+highest controversy) are kept in one table next to the fundamentals
+panel, with the Sustainalytics peer group as the industry. The table is
+refreshed incrementally from the command line like the fundamentals
+panel, since sustainability ratings change at most monthly:
+
+    python esg_index.py --max-age 168
+
+The Sustainability page never fetches other tickers. It loads the index,
+which holds every score of every industry as a sorted array, and answers
+percentile, rank and nearest peers with binary searches.
+"""
+import argparse
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_cache import get_cache
+from fundamentals_panel import FundamentalsPanel, PANEL_TTL
+from fundamentals_store import CACHE_DIR
+
+ESG_PATH = os.path.join(CACHE_DIR, 'panel', 'esg.feather')
+
+## Table column -> sustainability field
+SCORES = {
+    'total_esg': 'totalEsg',
+    'environment': 'environmentScore',
+    'social': 'socialScore',
+    'governance': 'governanceScore',
+    'controversy': 'highestControversy',
+}
+SCORE_LABELS = {'total_esg': 'Total ESG Risk', 'environment': 'Environment Risk', 'social': 'Social Risk',
+                'governance': 'Governance Risk', 'controversy': 'Highest Controversy'}
+
+## Hours before a row is refetched by default
+MAX_AGE = 24 * 7
+
+logger = logging.getLogger(__name__)
+
+
+def empty_table():
+    """
+    ESG table without rows, with all columns and dtypes
+    """
+    table = pd.DataFrame({column: pd.Series(dtype='float64') for column in ('industry',) + tuple(SCORES)})
+    table['updated'] = pd.Series(dtype='datetime64[ns]')
+    table.index.name = 'symbol'
+    return normalize(table)
+
+
+def normalize(table):
+    """
+    Apply the table dtypes and order: industry as a category, scores as
+    float64 with non-numeric values missing, rows sorted by symbol
+    """
+    table = table.copy()
+    table['industry'] = table['industry'].astype('object').where(table['industry'].notna(), None).astype('category')
+    for column in SCORES:
+        values = pd.to_numeric(table[column], errors='coerce').astype('float64')
+        table[column] = values.where(np.isfinite(values))
+    table['updated'] = pd.to_datetime(table['updated'])
+    table.index.name = 'symbol'
+    return table[['industry'] + list(SCORES) + ['updated']].sort_index()
+
+
+def row_from_sustainability(sustainability, now=None):
+    """
+    Table row for a sustainability frame. A ticker without ESG data
+    gets a row of missing scores, so it is not refetched before max_age
+
+    Parameters
+    ----------
+    sustainability: DataFrame
+        yfinance ticker sustainability, or None
+
+    now: Timestamp
+        Time of the fetch
+        Default: now
+    """
+    values = sustainability.squeeze() if sustainability is not None else pd.Series(dtype='object')
+    row = {column: values.get(field) for column, field in SCORES.items()}
+    row['industry'] = values.get('peerGroup')
+    row['updated'] = now or pd.Timestamp.now()
+    return row
+
+
+class EsgTable(FundamentalsPanel):
+    """
+    ESG risk scores of the ticker universe, stored as one Arrow file and
+    refreshed like the fundamentals panel
+
+    Parameters
+    ----------
+    path: str
+        Location of the table file
+        Default: <FD_CACHE_DIR>/panel/esg.feather
+    """
+    def __init__(self, path=ESG_PATH):
+        super().__init__(path)
+
+    def empty(self):
+        return empty_table()
+
+    def normalize(self, table):
+        return normalize(table)
+
+    def fetch_row(self, symbol):
+        from market_data import TickerHandle
+        return row_from_sustainability(TickerHandle(symbol).sustainability)
+
+
+class EsgIndex(object):
+    """
+    Sorted score arrays per industry for binary-search peer lookups.
+    Lower ESG risk ranks first
+
+    Parameters
+    ----------
+    table: DataFrame
+        ESG table, from EsgTable.load
+
+    Methods
+    -------
+
+    members
+        Number of scored companies of an industry
+
+    percentile
+        Share of an industry's companies with a lower score
+
+    rank
+        Rank of a score within an industry, 1 being the lowest risk
+
+    peers
+        Companies of an industry with the closest scores
+    """
+    def __init__(self, table):
+        self.table = table
+        self._arrays = {}
+        symbols = table.index.to_numpy()
+        codes = table['industry'].cat.codes.to_numpy()
+        for column in SCORES:
+            values = table[column].to_numpy(dtype='float64')
+            valid = (codes >= 0) & ~np.isnan(values)
+            ## One sort by industry then score, then split at the industry boundaries
+            order = np.flatnonzero(valid)[np.lexsort((values[valid], codes[valid]))]
+            bounds = np.flatnonzero(np.diff(codes[order])) + 1
+            for chunk in np.split(order, bounds) if len(order) else ():
+                industry = table['industry'].cat.categories[codes[chunk[0]]]
+                self._arrays[(industry, column)] = (values[chunk], symbols[chunk])
+
+    def _array(self, industry, column):
+        return self._arrays.get((industry, column), (np.empty(0), np.empty(0, dtype=object)))
+
+    def members(self, industry, column='total_esg'):
+        return len(self._array(industry, column)[0])
+
+    def percentile(self, industry, column, value):
+        """
+        Percent of the industry's companies with a lower score than value,
+        or None if the industry has no scores
+
+        Parameters
+        ----------
+        industry: str
+            Peer group
+
+        column: str
+            Score column, one of SCORES
+
+        value: float
+            The score
+        """
+        values = self._array(industry, column)[0]
+        if not len(values) or value is None or np.isnan(value):
+            return None
+        return 100.0 * np.searchsorted(values, value, side='left') / len(values)
+
+    def rank(self, industry, column, value):
+        """
+        Rank of value among the industry's scores, 1 being the lowest
+        risk. Ties share the best rank
+        """
+        values = self._array(industry, column)[0]
+        if not len(values) or value is None or np.isnan(value):
+            return None
+        return int(np.searchsorted(values, value, side='left')) + 1
+
+    def peers(self, industry, value, column='total_esg', k=5, exclude=None):
+        """
+        The k companies of the industry with the scores closest to value,
+        closest first, as a table of all their scores
+
+        Parameters
+        ----------
+        industry: str
+            Peer group
+
+        value: float
+            The score to compare with
+
+        column: str
+            Score column, one of SCORES
+            Default: total_esg
+
+        k: int
+            Number of peers
+            Default: 5
+
+        exclude: str
+            Symbol left out, usually the company itself
+        """
+        values, symbols = self._array(industry, column)
+        if exclude is not None:
+            keep = symbols != exclude
+            values, symbols = values[keep], symbols[keep]
+        if not len(values) or value is None or np.isnan(value):
+            return self.table.iloc[:0]
+        ## The nearest scores are a window around the insertion point:
+        ## grow it k times towards the closer side
+        low = high = int(np.searchsorted(values, value))
+        for _ in range(min(k, len(values))):
+            if high >= len(values) or (low > 0 and value - values[low - 1] <= values[high] - value):
+                low -= 1
+            else:
+                high += 1
+        window = np.arange(low, high)
+        window = window[np.argsort(np.abs(values[window] - value), kind='stable')]
+        return self.table.loc[symbols[window]]
+
+
+def get_index(path=ESG_PATH):
+    """
+    Return the ESG index of the local table, shared by all sessions of
+    the process and rebuilt when the file changes, or None if the table
+    was not built yet
+
+    Parameters
+    ----------
+    path: str
+        Location of the table file
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    return get_cache().get_or_fetch(('esg_index', path, mtime), lambda: EsgIndex(EsgTable(path).load()),
+                                    ttl=PANEL_TTL)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Build or refresh the ESG table for industry peer ranking')
+    parser.add_argument('--symbols', nargs='*', help='Tickers to include. Default: the S&P 500 list')
+    parser.add_argument('--max-age', type=float, default=MAX_AGE, help='Hours before a row is refetched')
+    parser.add_argument('--limit', type=int, help='Refetch at most this many rows')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent fetches')
+    parser.add_argument('--path', default=ESG_PATH, help='Table file')
+    args = parser.parse_args()
+    count = EsgTable(args.path).refresh(args.symbols, args.max_age, args.limit, args.workers)
+    logger.info('Updated %d rows in %s', count, args.path)
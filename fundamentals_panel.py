@@ -0,0 +1,381 @@
+"""
+Columnar panel of screening fields for the whole ticker universe.
+
+One row per S&P 500 ticker with the fields Summary.py shows for a single
+ticker (market cap, beta, P/E, EPS, dividend yield, target price) plus
+name, sector and industry. The panel lives in the cache directory as an
+Arrow (feather) file and is the only thing the Screener page reads, so a
+query never goes to the network.
+
+The panel is refreshed incrementally from the command line or a cron
+job. Only rows that are missing or older than --max-age are refetched,
+through the shared transport and its rate limit, and progress is saved
+every few rows so an interrupted refresh resumes where it stopped:
+
+    python fundamentals_panel.py --max-age 24
+    python fundamentals_panel.py --symbols MSFT AAPL --max-age 0
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_cache import get_cache
+from fundamentals_store import CACHE_DIR
+from statements import human_format_array
+
+PANEL_PATH = os.path.join(CACHE_DIR, 'panel', 'fundamentals.feather')
+
+## Panel column -> info field
+FIELDS = {
+    'name': 'shortName',
+    'sector': 'sector',
+    'industry': 'industry',
+    'price': 'currentPrice',
+    'market_cap': 'marketCap',
+    'pe': 'trailingPE',
+    'forward_pe': 'forwardPE',
+    'eps': 'trailingEps',
+    'beta': 'beta',
+    'dividend_yield': 'dividendYield',
+    'target_price': 'targetMeanPrice',
+}
+TEXT_COLUMNS = ('name', 'sector', 'industry')
+NUMERIC_COLUMNS = tuple(column for column in FIELDS if column not in TEXT_COLUMNS)
+
+## Display format of the numeric columns: human, pct or number
+FORMATS = {'price': 'number', 'market_cap': 'human', 'pe': 'number', 'forward_pe': 'number', 'eps': 'number',
+           'beta': 'number', 'dividend_yield': 'pct', 'target_price': 'number', 'upside': 'pct',
+           'percentile': 'pct'}
+
+## Hours before a row is refetched by default
+MAX_AGE = 24
+## Seconds a loaded panel is reused before the file is checked again
+PANEL_TTL = 60
+
+logger = logging.getLogger(__name__)
+
+
+def empty_panel():
+    """
+    Panel without rows, with all columns and dtypes
+    """
+    panel = pd.DataFrame({column: pd.Series(dtype='float64') for column in FIELDS})
+    panel['updated'] = pd.Series(dtype='datetime64[ns]')
+    panel.index.name = 'symbol'
+    return normalize(panel)
+
+
+def normalize(panel):
+    """
+    Apply the panel dtypes and order: text as categories, numbers as
+    float64 with non-numeric and infinite values missing, rows sorted
+    by symbol
+    """
+    panel = panel.copy()
+    for column in TEXT_COLUMNS:
+        panel[column] = panel[column].astype('object').where(panel[column].notna(), None).astype('category')
+    for column in NUMERIC_COLUMNS:
+        values = pd.to_numeric(panel[column], errors='coerce').astype('float64')
+        panel[column] = values.where(np.isfinite(values))
+    panel['updated'] = pd.to_datetime(panel['updated'])
+    panel.index.name = 'symbol'
+    return panel[list(FIELDS) + ['updated']].sort_index()
+
+
+def derive(panel):
+    """
+    Add the derived columns to a panel
+    """
+    price = panel['price'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        upside = panel['target_price'].to_numpy() / price - 1
+    return panel.assign(upside=np.where(price > 0, upside, np.nan))
+
+
+def row_from_info(info, now=None):
+    """
+    Panel row for a ticker info dict
+
+    Parameters
+    ----------
+    info: dict
+        yfinance ticker info
+
+    now: Timestamp
+        Time of the fetch
+        Default: now
+    """
+    row = {column: info.get(field) for column, field in FIELDS.items()}
+    row['updated'] = now or pd.Timestamp.now()
+    return row
+
+
+class FundamentalsPanel(object):
+    """
+    Screening fields for the ticker universe, stored as one Arrow file
+
+    Parameters
+    ----------
+    path: str
+        Location of the panel file
+        Default: <FD_CACHE_DIR>/panel/fundamentals.feather
+
+    Methods
+    -------
+
+    load
+        Read the panel, or an empty panel if none was built yet
+
+    save
+        Write the panel atomically
+
+    stale
+        Symbols whose row is missing or too old
+
+    refresh
+        Refetch stale rows and save them
+
+    Subclasses holding other per-ticker fields override empty,
+    normalize and fetch_row
+    """
+    def __init__(self, path=PANEL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def empty(self):
+        return empty_panel()
+
+    def normalize(self, panel):
+        return normalize(panel)
+
+    def fetch_row(self, symbol):
+        """
+        Fetch the panel row of one ticker, or None to skip it
+        """
+        from market_data import TickerHandle
+        return row_from_info(TickerHandle(symbol).info)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self.empty()
+        return self.normalize(pd.read_feather(self.path).set_index('symbol'))
+
+    def save(self, panel):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        self.normalize(panel).reset_index().to_feather(tmp)
+        os.replace(tmp, self.path)
+
+    def stale(self, panel, symbols, max_age=MAX_AGE, now=None):
+        """
+        Return the symbols to refetch, missing rows first, then the
+        oldest rows
+
+        Parameters
+        ----------
+        panel: DataFrame
+            The current panel
+
+        symbols: list
+            The ticker universe
+
+        max_age: float
+            Hours after which a row is refetched
+
+        now: Timestamp
+            Default: now
+        """
+        now = now or pd.Timestamp.now()
+        updated = panel['updated'].reindex(pd.Index(symbols, name='symbol'))
+        cutoff = now - pd.Timedelta(hours=max_age)
+        due = updated[updated.isna() | (updated <= cutoff)]
+        return list(due.sort_values(na_position='first').index)
+
+    def refresh(self, symbols=None, max_age=MAX_AGE, limit=None, workers=8, checkpoint=50):
+        """
+        Refetch the info of stale tickers and save the panel every
+        checkpoint rows. Returns the number of rows updated
+
+        Parameters
+        ----------
+        symbols: list
+            Tickers to refresh. Default: the S&P 500 ticker list, in
+            which case rows of tickers that left it are dropped
+
+        max_age: float
+            Hours after which a row is refetched
+            Default: 24
+
+        limit: int
+            Refetch at most this many rows. None refetches all stale rows
+
+        workers: int
+            Concurrent fetches. The transport rate limit still applies
+            Default: 8
+
+        checkpoint: int
+            Rows fetched between two saves
+            Default: 50
+        """
+        from market_data import sp500_tickers
+
+        universe = symbols is None
+        if universe:
+            symbols = list(sp500_tickers())
+        symbols = sorted({symbol.upper() for symbol in symbols})
+        with self._lock:
+            panel = self.load()
+            if universe:
+                panel = panel[panel.index.isin(symbols)]
+            todo = self.stale(panel, symbols, max_age)[:limit]
+            rows = {}
+            updated = 0
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(self.fetch_row, symbol): symbol for symbol in todo}
+                for future in as_completed(futures):
+                    try:
+                        row = future.result()
+                    except Exception as e:
+                        logger.warning('Skipping %s: %s', futures[future], e)
+                        continue
+                    if row is not None:
+                        rows[futures[future]] = row
+                    if len(rows) >= checkpoint:
+                        panel, updated = self._merge(panel, rows), updated + len(rows)
+                        self.save(panel)
+                        rows = {}
+            panel, updated = self._merge(panel, rows), updated + len(rows)
+            self.save(panel)
+            return updated
+
+    def _merge(self, panel, rows):
+        if not rows:
+            return panel
+        new = pd.DataFrame.from_dict(rows, orient='index')
+        return self.normalize(pd.concat([panel[~panel.index.isin(new.index)], new]))
+
+
+def get_panel(path=PANEL_PATH):
+    """
+    Return the panel with derived columns from the local file, shared
+    by all sessions of the process and reloaded when the file changes
+
+    Parameters
+    ----------
+    path: str
+        Location of the panel file
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return derive(empty_panel())
+    return get_cache().get_or_fetch(('fundamentals_panel', path, mtime),
+                                    lambda: derive(FundamentalsPanel(path).load()), ttl=PANEL_TTL)
+
+
+def screen(panel, ranges=None, sectors=None, sort_by='market_cap', ascending=False, limit=None):
+    """
+    Filter, sort and rank the panel. Returns the matching rows in order
+    with their rank and the universe percentile of the sort column
+
+    Parameters
+    ----------
+    panel: DataFrame
+        Panel with derived columns, from get_panel
+
+    ranges: dict
+        Numeric column -> (low, high). A None bound is open. Rows
+        missing a filtered value do not match
+
+    sectors: list
+        Keep only these sectors. Empty or None keeps all
+
+    sort_by: str
+        Numeric column to sort and rank by
+        Default: market_cap
+
+    ascending: bool
+        Sort order. Missing values are always last
+        Default: False
+
+    limit: int
+        Number of rows to return. None returns all matches
+    """
+    mask = np.ones(len(panel), dtype=bool)
+    for column, (low, high) in (ranges or {}).items():
+        values = panel[column].to_numpy(dtype='float64')
+        with np.errstate(invalid='ignore'):
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+    if sectors:
+        mask &= panel['sector'].isin(sectors).to_numpy()
+
+    keys = panel[sort_by].to_numpy(dtype='float64')
+    valid = ~np.isnan(keys)
+    ## Percentile of the sort value within the whole universe
+    percentile = np.full(len(keys), np.nan)
+    order = np.argsort(keys[valid], kind='stable')
+    ranks = np.empty(len(order))
+    ranks[order] = np.arange(1, len(order) + 1)
+    percentile[valid] = ranks / max(len(order), 1)
+
+    selected = np.flatnonzero(mask)
+    selected_keys = keys[selected]
+    ## NaN sorts last either way
+    order = np.argsort(selected_keys if ascending else -selected_keys, kind='stable')
+    selected = selected[order][:limit]
+    result = panel.iloc[selected].copy()
+    result.insert(0, 'rank', np.arange(1, len(result) + 1))
+    result['percentile'] = percentile[selected]
+    return result
+
+
+def format_screen(result, na_rep='N/A'):
+    """
+    Format the numeric columns of a screen result for display, one
+    vectorized pass per column
+
+    Parameters
+    ----------
+    result: DataFrame
+        Rows returned by screen
+
+    na_rep: str
+        Text shown for missing values
+        Default: N/A
+    """
+    view = result.drop(columns='updated')
+    for column, kind in FORMATS.items():
+        if column not in view:
+            continue
+        values = view[column].to_numpy(dtype='float64')
+        if kind == 'human':
+            text = human_format_array(values, na_rep=na_rep)
+        else:
+            text = np.char.mod('%.2f%%' if kind == 'pct' else '%.2f', values * 100 if kind == 'pct' else values)
+            text = text.astype(object)
+            text[np.isnan(values)] = na_rep
+        view[column] = text
+    for column in TEXT_COLUMNS:
+        view[column] = view[column].astype(object).where(view[column].notna(), na_rep)
+    return view
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Build or refresh the fundamentals panel for the screener')
+    parser.add_argument('--symbols', nargs='*', help='Tickers to include. Default: the S&P 500 list')
+    parser.add_argument('--max-age', type=float, default=MAX_AGE, help='Hours before a row is refetched')
+    parser.add_argument('--limit', type=int, help='Refetch at most this many rows')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent fetches')
+    parser.add_argument('--path', default=PANEL_PATH, help='Panel file')
+    args = parser.parse_args()
+    count = FundamentalsPanel(args.path).refresh(args.symbols, args.max_age, args.limit, args.workers)
+    logger.info('Updated %d rows in %s', count, args.path)
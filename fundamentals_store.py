@@ -0,0 +1,406 @@
+"""
+Versioned on-disk store for datasets that only change around filings.
+
+Financial statements, holder tables and ESG data are kept per ticker and
+dataset. A dataset is refetched only once the next earnings date from
+the ticker calendar (plus a grace period for the filing to show up) has
+passed, or when it is older than a maximum TTL. Each refetch that changes
+the data creates a new version. Prior versions are kept for diffing.
+
+Layout under the cache directory:
+    fundamentals/<TICKER>/manifest.json
+    fundamentals/<TICKER>/<dataset>.<version>.pkl
+"""
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.environ.get('FD_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+DATASETS = ('financials', 'quarterly_financials',
+            'balance_sheet', 'quarterly_balance_sheet',
+            'cashflow', 'quarterly_cashflow',
+            'major_holders', 'institutional_holders', 'mutualfund_holders',
+            'sustainability')
+
+
+def next_earnings_date(calendar):
+    """
+    Return the last date of the upcoming earnings date range
+    from a yfinance calendar, or None if unavailable
+
+    Parameters
+    ----------
+    calendar: DataFrame
+        The yfinance ticker calendar with an 'Earnings Date' row
+    """
+    if calendar is None or 'Earnings Date' not in calendar.index:
+        return None
+    dates = pd.to_datetime(pd.Series(calendar.loc['Earnings Date']), errors='coerce').dropna()
+    if dates.empty:
+        return None
+    latest = dates.max()
+    if latest.tzinfo is not None:
+        latest = latest.tz_convert(None)
+    return latest.to_pydatetime()
+
+
+def _content_hash(data):
+    """
+    Hash of a dataset used to detect unchanged refetches
+    """
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        try:
+            digest = pd.util.hash_pandas_object(data, index=True).values.tobytes()
+        except TypeError:
+            ## Unhashable cells, e.g. the peer performance dicts of sustainability
+            digest = pickle.dumps(data)
+        labels = repr(list(data.columns) if isinstance(data, pd.DataFrame) else data.name).encode()
+        return hashlib.sha1(digest + labels).hexdigest()
+    return hashlib.sha1(pickle.dumps(data)).hexdigest()
+
+
+class FundamentalsStore(object):
+    """
+    Versioned store for fundamentals datasets with earnings-calendar
+    driven invalidation
+
+    Parameters
+    ----------
+    root: str
+        Directory to keep the store in.
+        Default: <FD_CACHE_DIR>/fundamentals
+
+    max_ttl: timedelta
+        Refetch a dataset at least this often
+        Default: 30 days
+
+    min_ttl: timedelta
+        Never refetch a dataset more often than this, even when
+        the calendar still shows a past earnings date
+        Default: 1 day
+
+    grace: timedelta
+        Time after the earnings date before the new filing is
+        expected to be available
+        Default: 1 day
+
+    retry_ttl: timedelta
+        Refetch interval once the filing is due but the calendar
+        still shows the past earnings date, for up to max_ttl
+        Default: 1 day
+
+    keep: int
+        Number of versions kept per dataset
+        Default: 5
+
+    Methods
+    -------
+
+    get
+        Return the current version of a dataset, refetching it if stale
+
+    version
+        Current version number of a dataset
+
+    versions
+        Metadata of all kept versions of a dataset
+
+    load
+        Load a specific version of a dataset
+
+    diff
+        Cells that changed between two versions of a dataset
+
+    invalidate
+        Force a refetch on next access
+    """
+    def __init__(self, root=None, max_ttl=timedelta(days=30), min_ttl=timedelta(days=1),
+                 grace=timedelta(days=1), retry_ttl=timedelta(days=1), keep=5):
+        self.root = root or os.path.join(CACHE_DIR, 'fundamentals')
+        self.max_ttl = max_ttl
+        self.min_ttl = min_ttl
+        self.grace = grace
+        self.retry_ttl = retry_ttl
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._symbol_locks = {}
+
+    def _symbol_lock(self, symbol):
+        with self._lock:
+            return self._symbol_locks.setdefault(symbol.upper(), threading.RLock())
+
+    def _dir(self, symbol):
+        return os.path.join(self.root, symbol.upper())
+
+    def _path(self, symbol, dataset, version):
+        return os.path.join(self._dir(symbol), f'{dataset}.{version}.pkl')
+
+    def _read_manifest(self, symbol):
+        try:
+            with open(os.path.join(self._dir(symbol), 'manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'datasets': {}}
+
+    def _write_manifest(self, symbol, manifest):
+        path = os.path.join(self._dir(symbol), 'manifest.json')
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, path)
+
+    def _expires_at(self, now, earnings):
+        """
+        Time after which a dataset fetched now is stale
+        """
+        expires = now + self.max_ttl
+        if earnings is not None:
+            due = earnings + self.grace
+            if due > now:
+                expires = min(expires, due)
+            elif now - due < self.max_ttl:
+                ## The filing is due but may not be visible yet: retry until
+                ## the calendar moves on to the next earnings date
+                expires = min(expires, now + self.retry_ttl)
+        return max(expires, now + self.min_ttl)
+
+    def is_stale(self, symbol, dataset, now=None):
+        """
+        Whether the dataset needs to be refetched
+
+        Parameters
+        ----------
+        symbol: str
+            The ticker symbol
+
+        dataset: str
+            Name of the dataset, one of DATASETS
+
+        now: datetime
+            Current time. Default: datetime.now()
+        """
+        entry = self._read_manifest(symbol)['datasets'].get(dataset)
+        if entry is None or entry.get('expires_at') is None:
+            return True
+        return (now or datetime.now()) >= datetime.fromisoformat(entry['expires_at'])
+
+    def get(self, ticker_obj, dataset, now=None):
+        """
+        Return the current version of a dataset for a yfinance ticker,
+        refetching it from the ticker only if it is stale
+
+        Parameters
+        ----------
+        ticker_obj: yfinance.Ticker object
+            Ticker to fetch the dataset from when stale
+
+        dataset: str
+            Name of the dataset, one of DATASETS
+
+        now: datetime
+            Current time. Default: datetime.now()
+        """
+        return self.get_versioned(ticker_obj, dataset, now)[1]
+
+    def get_versioned(self, ticker_obj, dataset, now=None):
+        """
+        Same as get, returning (version, data). The version is read under
+        the same lock as the data, so it always numbers the returned data
+
+        Parameters
+        ----------
+        ticker_obj: yfinance.Ticker object
+            Ticker to fetch the dataset from when stale
+
+        dataset: str
+            Name of the dataset, one of DATASETS
+
+        now: datetime
+            Current time. Default: datetime.now()
+        """
+        if dataset not in DATASETS:
+            raise ValueError(f'Unknown dataset {dataset!r}. Valid datasets: {", ".join(DATASETS)}')
+        symbol = ticker_obj.ticker
+        now = now or datetime.now()
+        with self._symbol_lock(symbol):
+            manifest = self._read_manifest(symbol)
+            entry = manifest['datasets'].get(dataset)
+            if entry is not None and entry['expires_at'] and now < datetime.fromisoformat(entry['expires_at']):
+                return entry['current'], self.load(symbol, dataset, entry['current'])
+
+            data = getattr(ticker_obj, dataset)
+            earnings = next_earnings_date(ticker_obj.calendar)
+            content_hash = _content_hash(data)
+            os.makedirs(self._dir(symbol), exist_ok=True)
+
+            if entry is None:
+                entry = {'current': 0, 'versions': []}
+            if not entry['versions'] or entry['versions'][-1]['hash'] != content_hash:
+                version = entry['current'] + 1
+                with open(self._path(symbol, dataset, version), 'wb') as f:
+                    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                entry['versions'].append({'version': version, 'fetched_at': now.isoformat(), 'hash': content_hash})
+                entry['current'] = version
+                for old in entry['versions'][:-self.keep]:
+                    try:
+                        os.remove(self._path(symbol, dataset, old['version']))
+                    except OSError:
+                        pass
+                entry['versions'] = entry['versions'][-self.keep:]
+            entry['fetched_at'] = now.isoformat()
+            entry['next_earnings'] = earnings.isoformat() if earnings else None
+            entry['expires_at'] = self._expires_at(now, earnings).isoformat()
+            manifest['datasets'][dataset] = entry
+            self._write_manifest(symbol, manifest)
+            return entry['current'], data
+
+    def version(self, symbol, dataset):
+        """
+        Current version number of a dataset, 0 if never fetched
+
+        Parameters
+        ----------
+        symbol: str
+            The ticker symbol
+
+        dataset: str
+            Name of the dataset
+        """
+        entry = self._read_manifest(symbol)['datasets'].get(dataset)
+        return entry['current'] if entry else 0
+
+    def versions(self, symbol, dataset):
+        """
+        Metadata (version, fetched_at, hash) of the kept versions
+        of a dataset, oldest first
+
+        Parameters
+        ----------
+        symbol: str
+            The ticker symbol
+
+        dataset: str
+            Name of the dataset
+        """
+        entry = self._read_manifest(symbol)['datasets'].get(dataset)
+        return list(entry['versions']) if entry else []
+
+    def load(self, symbol, dataset, version=None):
+        """
+        Load a version of a dataset
+
+        Parameters
+        ----------
+        symbol: str
+            The ticker symbol
+
+        dataset: str
+            Name of the dataset
+
+        version: int
+            Version to load. Default: current version
+        """
+        version = version or self.version(symbol, dataset)
+        with open(self._path(symbol, dataset, version), 'rb') as f:
+            return pickle.load(f)
+
+    def diff(self, symbol, dataset, old=None, new=None):
+        """
+        Cells that differ between two versions of a table dataset,
+        one row per changed cell with columns row, column, old, new.
+        An old version that was pruned is replaced by the oldest kept
+        version. Returns None when new is not kept or has no older
+        kept version. Raises ValueError when old is not a version
+        before new
+
+        Parameters
+        ----------
+        symbol: str
+            The ticker symbol
+
+        dataset: str
+            Name of the dataset
+
+        old: int
+            Older version. Default: the kept version before new
+
+        new: int
+            Newer version. Default: current version
+        """
+        kept = [entry['version'] for entry in self.versions(symbol, dataset)]
+        new = new or self.version(symbol, dataset)
+        if old is not None and not 1 <= old < new:
+            raise ValueError(f'Version {old!r} of {symbol} {dataset} is not a version before {new}')
+        older = [version for version in kept if version < new]
+        if new not in kept or not older:
+            return None
+        if old is None:
+            old = older[-1]
+        elif old not in older:
+            if old > older[0]:
+                raise ValueError(f'Version {old} of {symbol} {dataset} is not kept')
+            ## Versions are pruned oldest first
+            old = older[0]
+        before = self.load(symbol, dataset, old)
+        after = self.load(symbol, dataset, new)
+        before, after = pd.DataFrame(before).align(pd.DataFrame(after))
+        changed = ~((before == after) | (before.isna() & after.isna())).to_numpy()
+        rows, cols = np.nonzero(changed)
+        return pd.DataFrame({'row': before.index[rows], 'column': before.columns[cols],
+                             'old': before.to_numpy()[rows, cols], 'new': after.to_numpy()[rows, cols]})
+
+    def invalidate(self, symbol, dataset=None):
+        """
+        Mark a dataset, or all datasets of a ticker, as stale
+
+        Parameters
+        ----------
+        symbol: str
+            The ticker symbol
+
+        dataset: str
+            Name of the dataset. Default: all datasets
+        """
+        with self._symbol_lock(symbol):
+            manifest = self._read_manifest(symbol)
+            for name, entry in manifest['datasets'].items():
+                if dataset is None or name == dataset:
+                    entry['expires_at'] = None
+            if manifest['datasets']:
+                self._write_manifest(symbol, manifest)
+
+
+_store = None
+
+
+def get_store():
+    """
+    Return the process-wide FundamentalsStore
+    """
+    global _store
+    if _store is None:
+        _store = FundamentalsStore()
+    return _store
+
+
+def get_dataset(ticker_obj, dataset):
+    """
+    Return a fundamentals dataset for a ticker through the
+    process-wide store
+
+    Parameters
+    ----------
+    ticker_obj: yfinance.Ticker object
+        Ticker to fetch the dataset from when stale
+
+    dataset: str
+        Name of the dataset, one of DATASETS
+    """
+    return get_store().get(ticker_obj, dataset)
@@ -0,0 +1,140 @@
+"""
+Lightweight HTML table rendering for the dashboard pages.
+
+Renders plain key/value and DataFrame tables without going through
+pandas Styler. The row template for a given column layout is built once
+and reused, so rendering a table is one string format per row.
+"""
+from functools import lru_cache
+from html import escape
+import math
+import numbers
+
+
+def _format_cell(value, precision):
+    """
+    Convert a cell value to escaped display text. Floats use a fixed
+    number of decimals, like the Styler default display
+
+    Parameters
+    ----------
+    value: object
+        The cell value
+
+    precision: int
+        Number of decimals for float values
+    """
+    if isinstance(value, numbers.Real) and not isinstance(value, numbers.Integral):
+        value = 'nan' if math.isnan(value) else f'{value:.{precision}f}'
+    return escape(str(value))
+
+
+def _cell_style(bold, align):
+    """
+    Build the inline style attribute for a cell
+    """
+    props = []
+    if bold:
+        props.append('font-weight: bold')
+    if align:
+        props.append(f'text-align: {align}')
+    return f' style="{"; ".join(props)}"' if props else ''
+
+
+@lru_cache(maxsize=64)
+def _row_template(tag, styles):
+    """
+    Compile the format string for one table row
+
+    Parameters
+    ----------
+    tag: str
+        Cell tag, td or th
+
+    styles: tuple
+        Inline style attribute for each column
+    """
+    cells = ''.join(f'<{tag}{style}>{{{i}}}</{tag}>' for i, style in enumerate(styles))
+    return f'<tr>{cells}</tr>'
+
+
+def render_table(rows, columns=None, bold=(), align=None, header=False, precision=6):
+    """
+    Render rows as an HTML table
+
+    Parameters
+    ----------
+    rows: iterable
+        Sequence of rows, each a sequence of cell values
+
+    columns: list
+        Column labels. Used for the header and to refer to columns
+        by name in bold and align. Default: column positions
+
+    bold: iterable
+        Columns (labels or positions) shown in bold
+
+    align: dict
+        Column (label or position) to text-align value,
+        e.g. {0: 'right'}
+
+    header: bool
+        Show the column labels as a header row
+        Default: False
+
+    precision: int
+        Number of decimals for float values
+        Default: 6
+    """
+    rows = [tuple(row) for row in rows]
+    n_cols = len(columns) if columns is not None else max((len(row) for row in rows), default=0)
+    labels = list(columns) if columns is not None else list(range(n_cols))
+    position = {i: i for i in range(n_cols)}
+    position.update({label: i for i, label in enumerate(labels)})
+    bold_pos = {position[col] for col in bold}
+    align_pos = {position[col]: value for col, value in (align or {}).items()}
+    styles = tuple(_cell_style(i in bold_pos, align_pos.get(i)) for i in range(n_cols))
+
+    parts = ['<table>']
+    if header:
+        template = _row_template('th', ('',) * n_cols)
+        parts.append('<thead>')
+        parts.append(template.format(*(escape(str(label)) for label in labels)))
+        parts.append('</thead>')
+    template = _row_template('td', styles)
+    parts.append('<tbody>')
+    parts.extend(template.format(*(_format_cell(value, precision) for value in row)) for row in rows)
+    parts.append('</tbody></table>')
+    return ''.join(parts)
+
+
+def render_frame(df, bold=(), align=None, index=False, header=True, precision=6):
+    """
+    Render a DataFrame as an HTML table
+
+    Parameters
+    ----------
+    df: DataFrame
+        The data to render
+
+    bold: iterable
+        Column labels shown in bold
+
+    align: dict
+        Column label to text-align value
+
+    index: bool
+        Include the index as the first column
+        Default: False
+
+    header: bool
+        Show the column labels
+        Default: True
+
+    precision: int
+        Number of decimals for float values
+        Default: 6
+    """
+    columns = ([df.index.name or ''] if index else []) + list(df.columns)
+    return render_table(df.itertuples(index=index, name=None), columns=columns,
+                        bold=bold, align=align, header=header, precision=precision)
@@ -0,0 +1,257 @@
+"""
+Shared HTTP transport for all market data requests.
+
+`Transport` is a requests.Session that every yfinance ticker and the
+S&P 500 list fetch go through. It adds:
+    - keep-alive connection pooling shared by all sessions of the process
+    - a process-wide token bucket capping the request rate to upstream
+    - retries with jittered exponential backoff on connection errors,
+      timeouts and 429/5xx responses (honoring Retry-After)
+    - per-endpoint latency, error and retry metrics
+
+Settings come from the environment:
+    FD_HTTP_RATE     requests per second (default 5)
+    FD_HTTP_BURST    token bucket capacity (default 10)
+    FD_HTTP_RETRIES  retries after the first attempt (default 3)
+    FD_HTTP_POOL     connections kept per host (default 20)
+"""
+from collections import deque
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_TICKER_SEGMENT = re.compile(r'^(?=.*[A-Z])[A-Z0-9.\-^=%]+$')
+
+
+def endpoint_name(url):
+    """
+    Group a URL into an endpoint for metrics: host and path with
+    ticker symbols and numeric ids replaced by placeholders
+
+    Parameters
+    ----------
+    url: str
+        Request URL
+    """
+    parts = urlsplit(url)
+    segments = []
+    for segment in parts.path.split('/'):
+        if segment.isdigit():
+            segment = '{id}'
+        elif _TICKER_SEGMENT.match(segment):
+            segment = '{symbol}'
+        segments.append(segment)
+    return parts.netloc + '/'.join(segments)
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket rate limiter
+
+    Parameters
+    ----------
+    rate: float
+        Tokens added per second
+
+    capacity: float
+        Maximum number of tokens, i.e. the allowed burst
+    """
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1.0):
+        """
+        Block until tokens are available and take them.
+        Returns the time spent waiting in seconds
+
+        Parameters
+        ----------
+        tokens: float
+            Number of tokens to take
+            Default: 1
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class EndpointMetrics(object):
+    """
+    Request counters and latency samples per endpoint
+
+    Parameters
+    ----------
+    samples: int
+        Number of most recent latencies kept per endpoint
+        Default: 1024
+    """
+    def __init__(self, samples=1024):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, seconds, error=False, retry=False, throttled=0.0):
+        """
+        Record one request attempt
+
+        Parameters
+        ----------
+        endpoint: str
+            Endpoint name
+
+        seconds: float
+            Latency of the attempt
+
+        error: bool
+            The attempt failed
+
+        retry: bool
+            The attempt is a retry
+
+        throttled: float
+            Time spent waiting for the rate limiter
+        """
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {'requests': 0, 'errors': 0, 'retries': 0,
+                                                     'throttled_seconds': 0.0, 'seconds': 0.0,
+                                                     'latencies': deque(maxlen=self.samples)}
+            stats['requests'] += 1
+            stats['errors'] += int(error)
+            stats['retries'] += int(retry)
+            stats['throttled_seconds'] += throttled
+            stats['seconds'] += seconds
+            stats['latencies'].append(seconds)
+
+    def snapshot(self):
+        """
+        Return counters and latency percentiles (seconds) per endpoint
+        """
+        with self._lock:
+            items = [(name, dict(stats, latencies=sorted(stats['latencies'])))
+                     for name, stats in self._endpoints.items()]
+        result = {}
+        for name, stats in items:
+            latencies = stats.pop('latencies')
+            n = len(latencies)
+            for label, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                stats[label] = latencies[min(n - 1, int(q * n))] if n else None
+            stats['max'] = latencies[-1] if n else None
+            result[name] = stats
+        return result
+
+
+class Transport(requests.Session):
+    """
+    requests.Session with pooling, rate limiting, retries and metrics
+
+    Parameters
+    ----------
+    rate: float
+        Requests per second across all threads using this transport
+
+    burst: float
+        Requests allowed at once before rate limiting applies
+
+    retries: int
+        Retries after the first attempt
+
+    backoff: float
+        Base delay in seconds of the exponential backoff
+
+    max_backoff: float
+        Largest backoff delay in seconds
+
+    pool_size: int
+        Connections kept per host
+
+    timeout: float
+        Default request timeout in seconds
+    """
+    def __init__(self, rate=5.0, burst=10, retries=3, backoff=0.5, max_backoff=8.0, pool_size=20, timeout=10.0):
+        super().__init__()
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.metrics = EndpointMetrics()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def _delay(self, attempt, response=None):
+        """
+        Backoff before the next attempt: Retry-After when the server
+        sends one, otherwise full jitter exponential backoff
+        """
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint_name(url)
+        attempt = 0
+        while True:
+            throttled = self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.metrics.record(endpoint, time.perf_counter() - start, error=True,
+                                    retry=attempt > 0, throttled=throttled)
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            failed = response.status_code in RETRY_STATUSES
+            self.metrics.record(endpoint, time.perf_counter() - start, error=failed,
+                                retry=attempt > 0, throttled=throttled)
+            if not failed or attempt >= self.retries:
+                return response
+            time.sleep(self._delay(attempt, response))
+            response.close()
+            attempt += 1
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the process-wide Transport
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = Transport(rate=float(os.environ.get('FD_HTTP_RATE', 5)),
+                                 burst=float(os.environ.get('FD_HTTP_BURST', 10)),
+                                 retries=int(os.environ.get('FD_HTTP_RETRIES', 3)),
+                                 pool_size=int(os.environ.get('FD_HTTP_POOL', 20)))
+        return _session
@@ -0,0 +1,336 @@
+"""
+Live intraday charts updated incrementally from a bar feed.
+
+A `LiveStream` holds the bars, indicator values and plotly figure for one
+ticker and interval. It is shared by every session in the process that
+watches the same ticker and interval. Each refresh asks the feed for bars
+newer than the last one (the last bar may be revised while it is still
+forming), appends only those to the stored columns and updates the SMA
+and volume colors for the new bars. Bars of sessions older than the ones
+the stream started with are dropped, so a stream left running keeps a
+bounded window.
+
+Feeds:
+    PollingBarFeed  polls the cached intraday history of the ticker
+    ReplayBarFeed   replays a recorded frame a few bars at a time, as a
+                    local stand-in for tests and offline runs
+"""
+from collections import OrderedDict
+import threading
+import time
+
+import numpy as np
+
+from market_data import INTRADAY_INTERVALS, TickerHandle
+from startup_profile import lazy_import, warm_plotly
+
+go = lazy_import('plotly.graph_objects', on_load=warm_plotly)
+subplots = lazy_import('plotly.subplots', on_load=warm_plotly)
+
+## Period of history loaded when a stream starts
+LIVE_PERIODS = {'1m': '1d', '2m': '1d', '5m': '1d', '15m': '5d', '30m': '5d',
+                '60m': '5d', '90m': '5d', '1h': '5d'}
+
+## Streams not refreshed for this many seconds are dropped
+STREAM_IDLE = 10 * 60
+
+
+class PollingBarFeed(object):
+    """
+    Bar feed polling the intraday history of a ticker. Polls go through
+    the shared cache, so concurrent streams cost at most one download
+    per cache TTL
+
+    Parameters
+    ----------
+    symbol: str
+        The ticker symbol
+
+    interval: str
+        Intraday bar interval.
+        Valid intervals: 1m,2m,5m,15m,30m,60m,90m,1h
+    """
+    def __init__(self, symbol, interval):
+        if interval not in INTRADAY_INTERVALS:
+            raise ValueError(f'Live mode needs an intraday interval, got {interval!r}')
+        self.handle = TickerHandle(symbol)
+        self.interval = interval
+        ## Trading sessions in the initial history, e.g. 5 for '5d'
+        self.sessions = int(LIVE_PERIODS[interval].rstrip('d'))
+        self.last = None
+
+    def initial(self):
+        """
+        Return the bars to start the chart with
+        """
+        bars = self.handle.history(period=LIVE_PERIODS[self.interval], interval=self.interval)
+        if not bars.empty:
+            self.last = bars.index[-1]
+        return bars
+
+    def poll(self):
+        """
+        Return the bars at or after the last seen bar. The first row
+        revises the last seen bar when it is still forming
+        """
+        bars = self.handle.history(period='1d', interval=self.interval)
+        if self.last is not None:
+            bars = bars[bars.index >= self.last]
+        if not bars.empty:
+            self.last = bars.index[-1]
+        return bars
+
+
+class ReplayBarFeed(object):
+    """
+    Bar feed replaying a recorded frame
+
+    Parameters
+    ----------
+    frame: DataFrame
+        Recorded bars with Open, High, Low, Close and Volume
+
+    start: int
+        Number of bars returned by initial()
+        Default: 60
+
+    step: int
+        Number of new bars returned by each poll()
+        Default: 1
+
+    sessions: int
+        Number of trading sessions kept on the chart
+        Default: 1
+    """
+    def __init__(self, frame, start=60, step=1, sessions=1):
+        self.frame = frame
+        self.position = min(start, len(frame))
+        self.step = step
+        self.sessions = sessions
+
+    def initial(self):
+        return self.frame.iloc[:self.position]
+
+    def poll(self):
+        bars = self.frame.iloc[self.position:self.position + self.step]
+        self.position += len(bars)
+        return bars
+
+
+class LiveStream(object):
+    """
+    Incrementally updated bars, indicators and figure for one ticker
+    and interval
+
+    Parameters
+    ----------
+    feed: PollingBarFeed or ReplayBarFeed
+        Source of the bars
+
+    chart_type: str
+        Valid chart_type: line, candle
+        Default: line
+
+    ma: int
+        Number of bars for the simple moving average.
+        None indicates not to add a sma line
+
+    poll_seconds: float
+        Minimum time between two polls of the feed
+        Default: 15
+
+    up_color: str
+        Volume bar color when volume rises
+        Default: green
+
+    down_color: str
+        Volume bar color when volume falls
+        Default: red
+
+    sessions: int
+        Number of trading sessions kept. Bars of older sessions are
+        dropped when a new session starts
+        Default: the sessions of the feed
+    """
+    def __init__(self, feed, chart_type='line', ma=None, poll_seconds=15, up_color='green', down_color='red',
+                 sessions=None):
+        self.feed = feed
+        self.chart_type = chart_type
+        self.ma = ma
+        self.poll_seconds = poll_seconds
+        self.up_color = up_color
+        self.down_color = down_color
+        self.sessions = sessions or feed.sessions
+        self.lock = threading.RLock()
+        self.last_poll = 0.0
+        self.last_used = time.monotonic()
+        self.volume_max = 0
+        ## up is 1 when the volume rose from the previous bar. Colors are mapped through
+        ## the colorscale of the volume trace, plotly validates color names one by one
+        self.columns = {name: [] for name in ('x', 'open', 'high', 'low', 'close', 'volume', 'up', 'sma')}
+        self.figure = self._build_figure()
+        self.apply(feed.initial())
+
+    def _build_figure(self):
+        fig = subplots.make_subplots(specs=[[{"secondary_y": True}]])
+        if self.chart_type == 'candle':
+            fig.add_trace(go.Candlestick(x=[], open=[], high=[], low=[], close=[], name='price'))
+            fig.update_layout(xaxis_rangeslider_visible=False)
+        else:
+            fig.add_trace(go.Scatter(x=[], y=[], mode='lines', fill='tozeroy', name='close', hovertemplate=None))
+        fig.add_trace(go.Bar(x=[], y=[], name='volume', opacity=0.8, hovertemplate=None,
+                             marker=dict(colorscale=[[0, self.down_color], [1, self.up_color]], cmin=0, cmax=1)),
+                      secondary_y=True)
+        if self.ma:
+            fig.add_trace(go.Scatter(x=[], y=[], name=f'SMA({self.ma})', hovertemplate=None, line=dict(color="orange")))
+        fig.update_layout(hovermode="x", height=600)
+        fig.update_xaxes(showspikes=True, spikemode="across", title=None)
+        fig.update_yaxes(showspikes=True, spikemode="across", title=None, secondary_y=False)
+        fig.update_yaxes(showspikes=True, spikemode="across", title=None, showticklabels=False, secondary_y=True)
+        return fig
+
+    def _pop_last(self):
+        """
+        Remove the last bar, which is being revised
+        """
+        volume = self.columns['volume'][-1]
+        for values in self.columns.values():
+            values.pop()
+        if volume >= self.volume_max:
+            self.volume_max = max(self.columns['volume'], default=0)
+
+    def _trim(self):
+        """
+        Drop the bars of the sessions before the last `sessions` ones
+        """
+        x = self.columns['x']
+        days = 0
+        for i in range(len(x) - 1, 0, -1):
+            if x[i].date() != x[i - 1].date():
+                days += 1
+                if days == self.sessions:
+                    for values in self.columns.values():
+                        del values[:i]
+                    self.volume_max = max(self.columns['volume'], default=0)
+                    return
+
+    def _append(self, bars):
+        """
+        Append bars to the stored columns and compute the indicator
+        values of the new bars only
+        """
+        cols = self.columns
+        closes = cols['close']
+        new_session = False
+        for ts, o, h, l, c, v in zip(bars.index, bars['Open'].to_numpy(), bars['High'].to_numpy(),
+                                     bars['Low'].to_numpy(), bars['Close'].to_numpy(), bars['Volume'].to_numpy()):
+            previous = cols['volume'][-1] if cols['volume'] else None
+            new_session = new_session or (bool(cols['x']) and ts.date() != cols['x'][-1].date())
+            ## The feed reports no volume for some bars
+            v = 0 if np.isnan(v) else int(v)
+            cols['x'].append(ts)
+            cols['open'].append(float(o))
+            cols['high'].append(float(h))
+            cols['low'].append(float(l))
+            closes.append(float(c))
+            cols['volume'].append(v)
+            self.volume_max = max(self.volume_max, v)
+            cols['up'].append(1 if previous is not None and v > previous else 0)
+            cols['sma'].append(float(np.mean(closes[-self.ma:])) if self.ma and len(closes) >= self.ma else np.nan)
+        if new_session:
+            self._trim()
+
+    def _sync_figure(self):
+        """
+        Copy the stored columns to the figure. Plotly validates lists
+        element by element but copies numpy arrays whole
+        """
+        cols = {name: values if name == 'x' else np.asarray(values) for name, values in self.columns.items()}
+        price = self.figure.data[0]
+        if self.chart_type == 'candle':
+            price.update(x=cols['x'], open=cols['open'], high=cols['high'], low=cols['low'], close=cols['close'])
+        else:
+            price.update(x=cols['x'], y=cols['close'])
+        self.figure.data[1].update(x=cols['x'], y=cols['volume'], marker=dict(color=cols['up']))
+        if self.ma:
+            self.figure.data[2].update(x=cols['x'], y=cols['sma'])
+        self.figure.update_yaxes(range=[0, self.volume_max * 3], secondary_y=True)
+
+    def apply(self, bars):
+        """
+        Add new bars. A first bar with the same timestamp as the last
+        stored bar replaces it. Returns the number of bars applied
+
+        Parameters
+        ----------
+        bars: DataFrame
+            Bars in time order with Open, High, Low, Close and Volume
+        """
+        if bars is None or bars.empty:
+            return 0
+        with self.lock:
+            x = self.columns['x']
+            if x:
+                bars = bars[bars.index >= x[-1]]
+                if bars.empty:
+                    return 0
+                if bars.index[0] == x[-1]:
+                    self._pop_last()
+            self._append(bars)
+            self._sync_figure()
+            return len(bars)
+
+    def refresh(self):
+        """
+        Poll the feed if the last poll is older than poll_seconds.
+        Returns the number of bars applied
+        """
+        with self.lock:
+            self.last_used = time.monotonic()
+            if self.last_used - self.last_poll < self.poll_seconds:
+                return 0
+            self.last_poll = self.last_used
+            return self.apply(self.feed.poll())
+
+
+_streams = OrderedDict()
+_streams_lock = threading.Lock()
+
+
+def get_stream(symbol, interval, chart_type='line', ma=None, feed=None, **kwargs):
+    """
+    Return the process-wide LiveStream for a ticker, interval, chart
+    type and moving average, creating it if needed
+
+    Parameters
+    ----------
+    symbol: str
+        The ticker symbol
+
+    interval: str
+        Intraday bar interval
+
+    chart_type: str
+        Valid chart_type: line, candle
+        Default: line
+
+    ma: int
+        Number of bars for the simple moving average
+
+    feed: PollingBarFeed or ReplayBarFeed
+        Feed used when a new stream is created.
+        Default: PollingBarFeed for the ticker and interval
+
+    kwargs:
+        Other LiveStream parameters
+    """
+    key = (symbol.upper(), interval, chart_type, ma)
+    now = time.monotonic()
+    with _streams_lock:
+        for stale in [k for k, stream in _streams.items() if now - stream.last_used > STREAM_IDLE]:
+            del _streams[stale]
+        stream = _streams.get(key)
+        if stream is None:
+            stream = LiveStream(feed or PollingBarFeed(symbol, interval), chart_type, ma, **kwargs)
+            _streams[key] = stream
+        return stream
@@ -0,0 +1,168 @@
+"""
+Shared market data access for all pages.
+
+Sessions keep a `TickerHandle` in session state instead of a
+yfinance.Ticker. The handle only holds the ticker symbol; every dataset
+is served from the process-wide DataCache, so data for a ticker is held
+once per process no matter how many sessions view it. Fundamentals go
+through the versioned FundamentalsStore underneath.
+
+All requests go through the pooled, rate-limited transport in
+http_transport.py, or are recorded/replayed by replay_backend.py
+depending on FD_DATA_BACKEND. Price history is compacted on ingest (see compaction.py) and shared
+between the worker processes of a host through memory-mapped Arrow
+segments (see shared_frames.py). Frames returned from the cache are
+shared between sessions and must not be modified in place.
+"""
+from collections import OrderedDict
+from io import StringIO
+import threading
+import time
+
+import pandas as pd
+
+from compaction import compact_history
+from data_cache import get_cache
+from fundamentals_store import DATASETS, get_store
+from http_transport import get_session
+from replay_backend import wrap_ticker, wrap_ticker_list
+from shared_frames import get_shared_store
+from spans import span
+from startup_profile import lazy_import
+
+yf = lazy_import('yfinance')
+
+SP500_URL = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
+INTRADAY_INTERVALS = ('1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h')
+
+## Seconds before a cached entry is refetched
+INFO_TTL = 5 * 60
+HISTORY_TTL = 15 * 60
+INTRADAY_TTL = 60
+FUNDAMENTALS_TTL = 60 * 60
+TICKER_LIST_TTL = 24 * 60 * 60
+
+## yfinance.Ticker objects are kept briefly so the datasets fetched for
+## one page run share a single download, then released
+_TICKER_TTL = 60
+_TICKER_MAX = 32
+_tickers = OrderedDict()
+_tickers_lock = threading.Lock()
+
+
+def _yf_ticker(symbol):
+    """
+    Return a recently created ticker object for symbol or a new one.
+    This is a yfinance.Ticker, or its recording or replay stand-in
+    """
+    now = time.monotonic()
+    with _tickers_lock:
+        while _tickers and next(iter(_tickers.values()))[0] + _TICKER_TTL <= now:
+            _tickers.popitem(last=False)
+        if symbol in _tickers:
+            return _tickers[symbol][1]
+        ticker_obj = wrap_ticker(symbol, lambda symbol: yf.Ticker(symbol, session=get_session()))
+        _tickers[symbol] = (now, ticker_obj)
+        while len(_tickers) > _TICKER_MAX:
+            _tickers.popitem(last=False)
+        return ticker_obj
+
+
+def fetch_sp500_tickers():
+    """
+    Download the list of S&P 500 ticker symbols from Wikipedia
+    """
+    response = get_session().get(SP500_URL)
+    response.raise_for_status()
+    return pd.read_html(StringIO(response.text))[0]['Symbol']
+
+
+def sp500_tickers():
+    """
+    Return the list of S&P 500 ticker symbols
+    """
+    with span('sp500_tickers', 'fetch'):
+        return get_cache().get_or_fetch(('sp500_tickers',), lambda: wrap_ticker_list(fetch_sp500_tickers),
+                                        ttl=TICKER_LIST_TTL)
+
+
+class TickerHandle(object):
+    """
+    Lightweight stand-in for yfinance.Ticker that reads through
+    the process-wide cache
+
+    Parameters
+    ----------
+    symbol: str
+        The ticker symbol
+    """
+    __slots__ = ('ticker',)
+
+    def __init__(self, symbol):
+        self.ticker = symbol.upper()
+
+    def __repr__(self):
+        return f'TickerHandle({self.ticker!r})'
+
+    def _cached(self, name, fetch, ttl):
+        with span(name if isinstance(name, str) else name[0], 'fetch'):
+            return get_cache().get_or_fetch((self.ticker, name), fetch, ttl=ttl)
+
+    @property
+    def info(self):
+        return self._cached('info', lambda: _yf_ticker(self.ticker).info, INFO_TTL)
+
+    @property
+    def calendar(self):
+        return self._cached('calendar', lambda: _yf_ticker(self.ticker).calendar, FUNDAMENTALS_TTL)
+
+    def dataset(self, name):
+        """
+        Return a fundamentals dataset through the versioned store
+
+        Parameters
+        ----------
+        name: str
+            Name of the dataset, one of fundamentals_store.DATASETS
+        """
+        return self.versioned_dataset(name)[1]
+
+    def versioned_dataset(self, name):
+        """
+        Return (store version, data) of a fundamentals dataset. The pair
+        is cached together, so the version always numbers the cached data
+        even when another process writes a newer version meanwhile
+
+        Parameters
+        ----------
+        name: str
+            Name of the dataset, one of fundamentals_store.DATASETS
+        """
+        return self._cached(name, lambda: get_store().get_versioned(_yf_ticker(self.ticker), name), FUNDAMENTALS_TTL)
+
+    def history(self, period='1mo', interval='1d', start=None, end=None, **kwargs):
+        """
+        Return the price history with compact dtypes, same
+        parameters as yfinance.Ticker.history. Another worker
+        process's copy is mapped when available
+        """
+        key = ('history', period, interval, str(start), str(end), tuple(sorted(kwargs.items())))
+        ttl = INTRADAY_TTL if interval in INTRADAY_INTERVALS else HISTORY_TTL
+
+        def fetch():
+            shared = get_shared_store()
+            frame = shared.get((self.ticker,) + key, max_age=ttl) if shared else None
+            if frame is None:
+                frame = compact_history(_yf_ticker(self.ticker).history(period, interval, start, end, **kwargs))
+                if shared and frame is not None and not frame.empty:
+                    frame = shared.put((self.ticker,) + key, frame)
+            return frame
+        return self._cached(key, fetch, ttl)
+
+
+def _dataset_property(name):
+    return property(lambda self: self.dataset(name), doc=f'The {name} dataset')
+
+
+for _name in DATASETS:
+    setattr(TickerHandle, _name, _dataset_property(_name))
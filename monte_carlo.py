@@ -1,7 +1,12 @@
-import matplotlib.pyplot as plt
+from datetime import timedelta
+
 import numpy as np
 import pandas as pd
 
+from startup_profile import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
+
 
 class MonteCarlo(object):
     """
@@ -41,6 +46,9 @@ class MonteCarlo(object):
     
     value_at_risk
         Print the Value at Risk at 95% confidence interval 
+
+    backtest
+        Backtest value_at_risk by sliding the estimation window over history
     """
     def __init__(self, ticker, start_date, end_date, time_horizon, n_simulation, seed):
         
@@ -57,8 +65,8 @@ class MonteCarlo(object):
         self.stock_price = self.ticker.history(interval="1d", start=self.start_date, end=self.end_date)
         
         # Calculate financial metrics
-        # Daily return (of close price)
-        self.daily_return = self.stock_price['Close'].pct_change()
+        # Daily return (of close price), in full precision as cached prices may be float32
+        self.daily_return = self.stock_price['Close'].astype('float64').pct_change()
         # Volatility (of close price)
         self.daily_volatility = np.std(self.daily_return)
         
@@ -129,4 +137,28 @@ class MonteCarlo(object):
 
         # Value at Risk
         VaR = self.stock_price['Close'][-1] - future_price_95ci
-        return f'VaR at 95% confidence interval is {str(np.round(VaR, 2))} USD'
\ No newline at end of file
+        return f'VaR at 95% confidence interval is {str(np.round(VaR, 2))} USD'
+
+    def backtest(self, years=10, step=None):
+        """
+        Slide an estimation window as long as this one over the last
+        years of history and compare each VaR forecast with the loss
+        realized time_horizon days later. Returns the forecasts and the
+        breach summary, see var_backtest
+
+        Parameters
+        ----------
+        years: float
+            Years of history to backtest
+            Default: 10
+
+        step: int
+            Days between forecasts. None uses time_horizon
+        """
+        from var_backtest import rolling_var, summarize
+
+        window = int(self.daily_return.count())
+        start = self.end_date - timedelta(days=int(365.25 * years) + (self.end_date - self.start_date).days)
+        history = self.ticker.history(interval="1d", start=start, end=self.end_date)
+        result = rolling_var(history['Close'], window, self.time_horizon, self.n_simulation, self.seed, step=step)
+        return result, summarize(result)
@@ -1,24 +1,32 @@
 ## Import Modules
 from datetime import datetime, timedelta
+import time
 
-import cufflinks as cf
-import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import streamlit as st
-import yfinance as yf
+
+from correlation import get_matrix
+from fundamentals_panel import get_panel
+from live_feed import get_stream
+from market_data import INTRADAY_INTERVALS, TickerHandle, sp500_tickers
+from rerun_profiler import capture, capture_widgets
+from spans import rerun_span, section, span
+from startup_profile import lazy_import, warm_plotly
+
+cf = lazy_import('cufflinks')
+go = lazy_import('plotly.graph_objects', on_load=warm_plotly)
+subplots = lazy_import('plotly.subplots', on_load=warm_plotly)
 
 
 def initialize_ticker_obj():
     """
-    Store the yfinance ticker object for the selected ticker
-    in session state to reduce API hits and persist ticker
-    selection across pages
+    Store a handle for the selected ticker in session state to
+    persist ticker selection across pages. The data itself is
+    held once per process in the shared cache
     """
-    st.session_state['ticker_obj'] = yf.Ticker(st.session_state.ticker)
+    st.session_state['ticker_obj'] = TickerHandle(st.session_state.ticker)
 
 
-def create_chart(data,chart_type,ma=None,up_color="green",down_color="red"):
+def create_chart(data,chart_type,ma=None,up_color="green",down_color="red",name=None):
     """
     Create the ticker history chart and 
     return the figure
@@ -48,6 +56,10 @@ def create_chart(data,chart_type,ma=None,up_color="green",down_color="red"):
         The color to use to show decline in a
         field from last period
         Default: red
+
+    name: str
+        Name of the candle chart series
+        Default: the selected ticker
     """
     if chart_type=='line':
     ###################### Ref: cufflinks ######################
@@ -62,20 +74,21 @@ def create_chart(data,chart_type,ma=None,up_color="green",down_color="red"):
             else:
                 bar_colors.append(down_color)
     ############################################################
-        fig = make_subplots(specs=[[{"secondary_y": True}]])
+        fig = subplots.make_subplots(specs=[[{"secondary_y": True}]])
         fig.add_trace(go.Scatter(x=data.index, y=data['Close'], mode='lines', fill='tozeroy', name='close', hovertemplate=None))
         fig.add_trace(go.Bar(x=data.index, y=data['Volume'], name='volume', hovertemplate=None), secondary_y=True)
         fig['data'][1].update(marker=dict(color=bar_colors), opacity=0.8)
         if ma:
-            data[f'SMA({ma})'] = data['Close'].rolling(ma).mean()
-            fig.add_trace(go.Scatter(x=data.index, y=data[f'SMA({ma})'], name=f'SMA({ma})', hovertemplate=None, line=dict(color="orange")))
+            ## data is shared through the cache, keep the indicator out of it
+            sma = data['Close'].rolling(ma).mean()
+            fig.add_trace(go.Scatter(x=data.index, y=sma, name=f'SMA({ma})', hovertemplate=None, line=dict(color="orange")))
         fig.update_layout(hovermode="x", height=600)
         fig.update_xaxes(showspikes=True, spikemode="across", title=None)
         fig.update_yaxes(showspikes=True, spikemode="across", title=None, row=1, col=1)
-        fig.update_yaxes(range=[0, data['Volume'].max()*3], showspikes=True, spikemode="across", title=None, showticklabels=False, secondary_y=True)
+        fig.update_yaxes(range=[0, int(data['Volume'].max())*3], showspikes=True, spikemode="across", title=None, showticklabels=False, secondary_y=True)
     
     elif chart_type=='candle':
-        qf = cf.QuantFig(data, name=st.session_state.ticker,kind='candlestick')
+        qf = cf.QuantFig(data.copy(), name=name or st.session_state.ticker,kind='candlestick')
         qf.add_volume()
         if ma:
             qf.add_sma(ma)
@@ -116,11 +129,17 @@ def get_histoy(period="1mo", interval="1d", start=None, end=None):
     return st.session_state.ticker_obj.history(period,interval,start,end)
 
 
-if __name__ == '__main__':
+def run():
+    """
+    Render the page. Returns the seconds after which the page is to be
+    rerun for live updates, or None
+    """
+    refresh_in = None
     ## Page config
     st.set_page_config(layout="wide")
 
     ####################################################### Ticker #######################################################
+    section('Ticker')
     ## Set ticker value in session state to persist. Default 'MSFT'
     if "ticker" not in st.session_state:
         st.session_state.ticker = "MSFT"
@@ -135,7 +154,7 @@ if __name__ == '__main__':
     
     ################ Reference fin_dashboard01.py ################
     # Get the list of stock tickers from S&P500
-    ticker_list = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]['Symbol']
+    ticker_list = sp500_tickers()
 
     # Add the ticker selection on the sidebar
     st.sidebar.selectbox(label="Select a ticker", options=ticker_list,key='ticker', on_change=initialize_ticker_obj)
@@ -143,6 +162,7 @@ if __name__ == '__main__':
     #######################################################################################################################
 
     ############################################### Title ##############################################
+    section('Title')
     if st.session_state.ticker_obj.info.get('longName', None):
         title_str= st.session_state.ticker_obj.info['longName']
     elif st.session_state.ticker_obj.info.get('shortName', None):
@@ -154,17 +174,22 @@ if __name__ == '__main__':
     ####################################################################################################
 
     ########################################### Input Boxes ############################################
-    ## 1. Select interval from the dropdown - 1 Day, 5 Day, 1 Week, 1 Month, 3 Month
+    section('Input Boxes')
+    ## 1. Select interval from the dropdown - 1 Minute to 90 Minute (live intraday), 1 Day, 5 Day, 1 Week, 1 Month, 3 Month
     ## 2. Select the chart type - line, candle
     col_interval, col_chart_type = st.columns(2)
     
     with col_interval:
         interval = st.selectbox(label="Interval"
-                        , options=("1 Day", "5 Day", "1 Week", "1 Month", "3 Month")
-                        , help="Historical data interval")
+                        , options=("1 Day", "5 Day", "1 Week", "1 Month", "3 Month",
+                                   "1 Minute", "2 Minute", "5 Minute", "15 Minute", "30 Minute", "60 Minute", "90 Minute")
+                        , help="Historical data interval. Minute intervals show today's bars with optional live updates")
     
     ## Parsing Interval value
-    if interval == "1 Day":
+    if interval.endswith(" Minute"):
+        interval = interval.split()[0] + "m"
+        ma = 20
+    elif interval == "1 Day":
         interval = "1d"
         ma = 50
     elif interval == "5 Day":
@@ -187,85 +212,147 @@ if __name__ == '__main__':
         chart_type = st.selectbox(label="Chart Type"
                         , options=("line", "candle")
                         , help="Visualization type")
+    capture_widgets(interval=interval, chart_type=chart_type)
     ####################################################################################################
-    
+
     ############################################### Period ##############################################
-    tab_date_range, tab_1m, tab_6m, tab_ytd, tab_1y, tab_3y, tab_5y, tab_max = st.tabs(["Date Range", "1M", "6M", "YTD", "1Y", "3Y", "5Y", "MAX"])
-    with tab_date_range:
-        ## Date range for historical data
-        sb_col1, sb_col2 = st.columns(2)
-        start_date = sb_col1.date_input(label="Start date"
-                                        , value=datetime.today().date() - timedelta(days=30))
-        end_date = sb_col2.date_input(label="End date"
-                                    , value=datetime.today().date())
-        ## Historical data for selected period and interval
-        data = get_histoy(period=None,interval=interval,start=start_date,end=end_date)
-        ## Plotly figure object containing plotting data
-        if (end_date-start_date).days > 50:
-            fig = create_chart(data, chart_type, ma)
-        else:
+    section('Period')
+    if interval in INTRADAY_INTERVALS:
+        ## Intraday bars: the stream is shared by all sessions watching this ticker and interval
+        ## and only new bars are appended on each refresh
+        live = st.checkbox(label="Live updates", value=False
+                        , help="Keep polling for new bars and rerun the page when they arrive")
+        stream = get_stream(st.session_state.ticker, interval, chart_type, ma)
+        stream.refresh()
+        with stream.lock:
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(stream.figure, use_container_width=True)
+        if live:
+            refresh_in = stream.poll_seconds
+    else:
+        tab_date_range, tab_1m, tab_6m, tab_ytd, tab_1y, tab_3y, tab_5y, tab_max = st.tabs(["Date Range", "1M", "6M", "YTD", "1Y", "3Y", "5Y", "MAX"])
+        with tab_date_range:
+            ## Date range for historical data
+            sb_col1, sb_col2 = st.columns(2)
+            start_date = sb_col1.date_input(label="Start date"
+                                            , value=datetime.today().date() - timedelta(days=30))
+            end_date = sb_col2.date_input(label="End date"
+                                        , value=datetime.today().date())
+            ## Historical data for selected period and interval
+            data = get_histoy(period=None,interval=interval,start=start_date,end=end_date)
+            ## Plotly figure object containing plotting data
+            if (end_date-start_date).days > 50:
+                fig = create_chart(data, chart_type, ma)
+            else:
+                fig = create_chart(data, chart_type)
+            ## Show visualization
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
+        with tab_1m:
+            ## Historical data for selected period and interval
+            data = get_histoy(period="1mo", interval=interval)
+            ## Plotly figure object containing plotting data
             fig = create_chart(data, chart_type)
-        ## Show visualization
-        st.plotly_chart(fig, use_container_width=True)
-    with tab_1m:
-        ## Historical data for selected period and interval
-        data = get_histoy(period="1mo", interval=interval)
-        ## Plotly figure object containing plotting data
-        fig = create_chart(data, chart_type)
-        ## Show visualization
-        st.plotly_chart(fig, use_container_width=True)
-    with tab_6m:
-        ## Historical data for selected period and interval
-        data = get_histoy(period="6mo", interval=interval)
-        ## Plotly figure object containing plotting data
-        fig = create_chart(data, chart_type, ma)
-        ## Show visualization
-        st.plotly_chart(fig, use_container_width=True)
-    with tab_ytd:
-        ## Historical data for selected period and interval
-        data = get_histoy(period="ytd", interval=interval)
-        ## Plotly figure object containing plotting data
-        if (datetime.today()-datetime(datetime.today().year, 1, 1)).days > 50:
+            ## Show visualization
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
+        with tab_6m:
+            ## Historical data for selected period and interval
+            data = get_histoy(period="6mo", interval=interval)
+            ## Plotly figure object containing plotting data
             fig = create_chart(data, chart_type, ma)
+            ## Show visualization
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
+        with tab_ytd:
+            ## Historical data for selected period and interval
+            data = get_histoy(period="ytd", interval=interval)
+            ## Plotly figure object containing plotting data
+            if (datetime.today()-datetime(datetime.today().year, 1, 1)).days > 50:
+                fig = create_chart(data, chart_type, ma)
+            else:
+                fig = create_chart(data, chart_type)
+            ## Show visualization
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
+        with tab_1y:
+            ## Historical data for selected period and interval
+            data = get_histoy(period="1y", interval=interval)
+            ## Plotly figure object containing plotting data
+            fig = create_chart(data, chart_type, ma)
+            ## Show visualization
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
+        with tab_3y:
+            ## Historical data for selected period and interval
+            data = get_histoy(period="3y", interval=interval)
+            ## Plotly figure object containing plotting data
+            fig = create_chart(data, chart_type, ma)
+            ## Show visualization
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
+        with tab_5y:
+            ## Historical data for selected period and interval
+            data = get_histoy(period="5y", interval=interval)
+            ## Plotly figure object containing plotting data
+            fig = create_chart(data, chart_type, ma)
+            ## Show visualization
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
+        with tab_max:
+            ## Historical data for selected period and interval
+            data = get_histoy(period="max", interval=interval)
+            ## Plotly figure object containing plotting data
+            fig = create_chart(data, chart_type, ma)
+            ## Show visualization
+            with span('plotly_chart', 'render'):
+                st.plotly_chart(fig, use_container_width=True)
+    ####################################################################################################
+    
+    ########################################## Correlated Peers ########################################
+    section('Correlated Peers')
+    ## Read from the saved correlation state, built and updated by correlation.py
+    with st.expander("Correlated Peers"):
+        correlation_matrix = get_matrix()
+        peers = correlation_matrix.peers(st.session_state.ticker, k=10) if correlation_matrix is not None else None
+        if peers is None or peers.empty:
+            st.text("Return correlations are not available for this ticker")
         else:
-            fig = create_chart(data, chart_type)
-        ## Show visualization
-        st.plotly_chart(fig, use_container_width=True)
-    with tab_1y:
-        ## Historical data for selected period and interval
-        data = get_histoy(period="1y", interval=interval)
-        ## Plotly figure object containing plotting data
-        fig = create_chart(data, chart_type, ma)
-        ## Show visualization
-        st.plotly_chart(fig, use_container_width=True)
-    with tab_3y:
-        ## Historical data for selected period and interval
-        data = get_histoy(period="3y", interval=interval)
-        ## Plotly figure object containing plotting data
-        fig = create_chart(data, chart_type, ma)
-        ## Show visualization
-        st.plotly_chart(fig, use_container_width=True)
-    with tab_5y:
-        ## Historical data for selected period and interval
-        data = get_histoy(period="5y", interval=interval)
-        ## Plotly figure object containing plotting data
-        fig = create_chart(data, chart_type, ma)
-        ## Show visualization
-        st.plotly_chart(fig, use_container_width=True)
-    with tab_max:
-        ## Historical data for selected period and interval
-        data = get_histoy(period="max", interval=interval)
-        ## Plotly figure object containing plotting data
-        fig = create_chart(data, chart_type, ma)
-        ## Show visualization
-        st.plotly_chart(fig, use_container_width=True)
+            st.caption(f"Exponentially weighted correlation of daily returns, halflife {correlation_matrix.halflife:g} trading days, as of {correlation_matrix.last_date:%Y-%m-%d}")
+            col_peers, col_heatmap = st.columns([1,2])
+            with col_peers:
+                peer_table = peers.round(3).rename('Correlation').to_frame()
+                peer_table.insert(0, 'Name', get_panel()['name'].astype(object).reindex(peer_table.index).fillna(''))
+                peer_table.index.name = 'Symbol'
+                with span('table', 'render'):
+                    st.table(peer_table)
+            with col_heatmap:
+                heatmap = correlation_matrix.submatrix([st.session_state.ticker] + list(peers.index))
+                fig = go.Figure(go.Heatmap(z=heatmap.to_numpy(), x=heatmap.columns, y=heatmap.index,
+                                           zmin=-1, zmax=1, colorscale='RdBu', reversescale=True,
+                                           text=heatmap.round(2).to_numpy(), texttemplate='%{text}'))
+                fig.update_layout(yaxis={'autorange': 'reversed'}, margin={'t': 20})
+                with span('plotly_chart', 'render'):
+                    st.plotly_chart(fig, use_container_width=True)
     ####################################################################################################
     
     ############################################## Source ##############################################
+    section('Source')
     source_str="""
     <p style='font-size:15px; color:grey; text-align:right'>
         Source: Yahoo Finance
     </p>
     """
     st.markdown(source_str,unsafe_allow_html=True)
-    #####################################################################################################
\ No newline at end of file
+    #####################################################################################################
+    return refresh_in
+
+
+if __name__ == '__main__':
+    with rerun_span('Chart'), capture('Chart'):
+        refresh_in = run()
+    ## Live updates: wait for the next poll outside the timed rerun, then rerun the page.
+    ## Widget changes in the meantime are picked up by the rerun
+    if refresh_in:
+        time.sleep(refresh_in)
+        st.experimental_rerun()
@@ -1,22 +1,26 @@
-import pandas as pd
 import streamlit as st
-import yfinance as yf
+
+from html_table import render_frame
+from market_data import TickerHandle, sp500_tickers
+from rerun_profiler import capture
+from spans import rerun_span, section
 
 
 def initialize_ticker_obj():
     """
-    Store the yfinance ticker object for the selected ticker
-    in session state to reduce API hits and persist ticker
-    selection across pages
+    Store a handle for the selected ticker in session state to
+    persist ticker selection across pages. The data itself is
+    held once per process in the shared cache
     """
-    st.session_state['ticker_obj'] = yf.Ticker(st.session_state.ticker)
+    st.session_state['ticker_obj'] = TickerHandle(st.session_state.ticker)
 
 
-if __name__ == '__main__':
+def run():
     ## Page config
     st.set_page_config(layout="wide")
 
     ####################################################### Ticker #######################################################
+    section('Ticker')
     ## Set ticker value in session state to persist. Default 'MSFT'
     if "ticker" not in st.session_state:
         st.session_state.ticker = "MSFT"
@@ -31,7 +35,7 @@ if __name__ == '__main__':
     
     ################ Reference fin_dashboard01.py ################
     # Get the list of stock tickers from S&P500
-    ticker_list = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]['Symbol']
+    ticker_list = sp500_tickers()
 
     # Add the ticker selection on the sidebar
     st.sidebar.selectbox(label="Select a ticker", options=ticker_list,key='ticker', on_change=initialize_ticker_obj)
@@ -39,6 +43,7 @@ if __name__ == '__main__':
     #######################################################################################################################
 
     ##################################################### Company Name ####################################################
+    section('Company Name')
     if st.session_state.ticker_obj.info.get('longName', None):
         title_str= st.session_state.ticker_obj.info['longName']
     elif st.session_state.ticker_obj.info.get('shortName', None):
@@ -50,6 +55,7 @@ if __name__ == '__main__':
     #######################################################################################################################
 
     ################################################ Companny Information #################################################
+    section('Company Information')
     ## Two columns:
     ##  1. Display Address, phone and website
     ##  2. Display information about sector, industry and employee count
@@ -84,6 +90,7 @@ if __name__ == '__main__':
     #######################################################################################################################
 
     ################################################# Company Description #################################################
+    section('Company Description')
     st.subheader("Description")
     description_str = f"""
     <p style='text-align:justify; word-break:keep-all'>
@@ -94,13 +101,12 @@ if __name__ == '__main__':
     #######################################################################################################################
 
     ################################################# Major Shareholders ##################################################
+    section('Major Shareholders')
     ## Distribution of shares
     st.subheader("Share Distribution")
     df = st.session_state.ticker_obj.major_holders
     if df is not None:
-        s = df.style.set_properties(subset=[1], **{'font-weight': 'bold', 'text-align': 'right'})
-        s = s.hide_index().hide_columns()
-        st.write(s.to_html(), unsafe_allow_html=True)
+        st.write(render_frame(df, bold=[1], align={1: 'right'}, header=False), unsafe_allow_html=True)
     else:
         st.write('Data not available..')
     st.markdown('')
@@ -108,9 +114,7 @@ if __name__ == '__main__':
     st.subheader("Institutional Holders")
     df = st.session_state.ticker_obj.institutional_holders
     if df is not None:
-        s = df.style.set_properties(subset=['Holder', '% Out'], **{'font-weight': 'bold', 'text-align': 'right'})
-        s = s.hide_index()
-        st.write(s.to_html(), unsafe_allow_html=True)
+        st.write(render_frame(df, bold=['Holder', '% Out'], align={'Holder': 'right', '% Out': 'right'}), unsafe_allow_html=True)
     else:
         st.write('Data not available..')
     st.markdown('')
@@ -119,19 +123,23 @@ if __name__ == '__main__':
     st.subheader("Mutual Fund Holders")
     df = st.session_state.ticker_obj.mutualfund_holders
     if df is not None:
-        s = df.style.set_properties(subset=['Holder', '% Out'], **{'font-weight': 'bold', 'text-align': 'right'})
-        s = s.hide_index()
-        st.write(s.to_html(), unsafe_allow_html=True)
+        st.write(render_frame(df, bold=['Holder', '% Out'], align={'Holder': 'right', '% Out': 'right'}), unsafe_allow_html=True)
     else:
         st.write('Data not available..')
     
     #######################################################################################################################
 
     ####################################################### Source ########################################################
+    section('Source')
     source_str="""
     <p style='font-size:15px; color:grey; text-align:right'>
         Source: Yahoo Finance
     </p>
     """
     st.markdown(source_str,unsafe_allow_html=True)
-    #######################################################################################################################
\ No newline at end of file
+    #######################################################################################################################
+
+
+if __name__ == '__main__':
+    with rerun_span('Profile'), capture('Profile'):
+        run()
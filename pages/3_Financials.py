@@ -1,22 +1,26 @@
-import pandas as pd
 import streamlit as st
-import yfinance as yf
+
+from market_data import TickerHandle, sp500_tickers
+from reports import company_name, financial_views
+from rerun_profiler import capture
+from spans import rerun_span, section, span
 
 
 def initialize_ticker_obj():
     """
-    Store the yfinance ticker object for the selected ticker
-    in session state to reduce API hits and persist ticker
-    selection across pages
+    Store a handle for the selected ticker in session state to
+    persist ticker selection across pages. The data itself is
+    held once per process in the shared cache
     """
-    st.session_state['ticker_obj'] = yf.Ticker(st.session_state.ticker)
+    st.session_state['ticker_obj'] = TickerHandle(st.session_state.ticker)
 
 
-if __name__=='__main__':
+def run():
     ## Page config
     st.set_page_config(layout="wide")
 
     ####################################################### Ticker #######################################################
+    section('Ticker')
     ## Set ticker value in session state to persist. Default 'MSFT'
     if "ticker" not in st.session_state:
         st.session_state.ticker = "MSFT"
@@ -31,7 +35,7 @@ if __name__=='__main__':
     
     ################ Reference fin_dashboard01.py ################
     # Get the list of stock tickers from S&P500
-    ticker_list = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]['Symbol']
+    ticker_list = sp500_tickers()
 
     # Add the ticker selection on the sidebar
     st.sidebar.selectbox(label="Select a ticker", options=ticker_list,key='ticker', on_change=initialize_ticker_obj)
@@ -39,51 +43,32 @@ if __name__=='__main__':
     #######################################################################################################################
 
     ##################################################### Company Name ####################################################
-    if st.session_state.ticker_obj.info.get('longName', None):
-        title_str= st.session_state.ticker_obj.info['longName']
-    elif st.session_state.ticker_obj.info.get('shortName', None):
-        title_str= st.session_state.ticker_obj.info['shortName']
-    else:
-        title_str= st.session_state.ticker_obj.info['symbol']
+    section('Company Name')
+    title_str = company_name(st.session_state.ticker_obj.info)
     st.header(title_str)
     #st.header(st.session_state.ticker_obj.info['longName'])
     #######################################################################################################################
 
     ################################################# Financial Information #################################################
-    tab_IS, tab_BS, tab_CF = st.tabs(["Income Statement", "Balance Sheet", "Cash Flow"])
-
-    ## Income Statement
-    with tab_IS:
-        tab_q, tab_y = st.tabs(["Quarterly", "Yearly"])
-        ## Quaterly
-        with tab_q:
-            st.table(st.session_state.ticker_obj.quarterly_financials)
-        ## Yearly
-        with tab_y:
-            st.table(st.session_state.ticker_obj.financials)
-    
-    ## Balance Sheet
-    with tab_BS:
-        tab_q, tab_y = st.tabs(["Quarterly", "Yearly"])
-        ## Quaterly
-        with tab_q:
-            st.table(st.session_state.ticker_obj.quarterly_balance_sheet)
-        ## Yearly
-        with tab_y:
-            st.table(st.session_state.ticker_obj.balance_sheet)
-    
-    ## Cash Flow
-    with tab_CF:
-        tab_q, tab_y = st.tabs(["Quarterly", "Yearly"])
-        ## Quaterly
-        with tab_q:
-            st.table(st.session_state.ticker_obj.quarterly_cashflow)
-        ## Yearly
-        with tab_y:
-            st.table(st.session_state.ticker_obj.cashflow)
+    section('Financial Information')
+    tab_IS, tab_BS, tab_CF, tab_KM = st.tabs(["Income Statement", "Balance Sheet", "Cash Flow", "Key Metrics"])
+    ## Statements come from the versioned store and are only refetched after an earnings report
+    views = financial_views(st.session_state.ticker_obj)
+    for tab, label in ((tab_IS, "Income Statement"), (tab_BS, "Balance Sheet"), (tab_CF, "Cash Flow"), (tab_KM, "Key Metrics")):
+        with tab:
+            tab_q, tab_y = st.tabs(["Quarterly", "Yearly"])
+            ## Quaterly
+            with tab_q:
+                with span('table', 'render'):
+                    st.table(views[(label, "Quarterly")])
+            ## Yearly
+            with tab_y:
+                with span('table', 'render'):
+                    st.table(views[(label, "Yearly")])
     #######################################################################################################################
 
     ####################################################### Source ########################################################
+    section('Source')
     source_str="""
     <p style='font-size:15px; color:grey; text-align:right'>
         Source: Yahoo Finance
@@ -91,4 +76,8 @@ if __name__=='__main__':
     """
     st.markdown(source_str,unsafe_allow_html=True)
     #######################################################################################################################
-        
\ No newline at end of file
+
+
+if __name__=='__main__':
+    with rerun_span('Financials'), capture('Financials'):
+        run()
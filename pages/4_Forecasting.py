@@ -1,26 +1,31 @@
 from datetime import datetime, timedelta
 
-import pandas as pd
 import streamlit as st
-import yfinance as yf
 
-from monte_carlo import MonteCarlo
+from market_data import TickerHandle, sp500_tickers
+from reports import company_name, simulate
+from rerun_profiler import capture, capture_widgets
+from spans import rerun_span, section, span
+from startup_profile import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
 
 
 def initialize_ticker_obj():
     """
-    Store the yfinance ticker object for the selected ticker
-    in session state to reduce API hits and persist ticker
-    selection across pages
+    Store a handle for the selected ticker in session state to
+    persist ticker selection across pages. The data itself is
+    held once per process in the shared cache
     """
-    st.session_state['ticker_obj'] = yf.Ticker(st.session_state.ticker)
+    st.session_state['ticker_obj'] = TickerHandle(st.session_state.ticker)
 
 
-if __name__ == '__main__':
+def run():
     ## Page config
     st.set_page_config(layout="wide")
 
     ####################################################### Ticker #######################################################
+    section('Ticker')
     ## Set ticker value in session state to persist. Default 'MSFT'
     if "ticker" not in st.session_state:
         st.session_state.ticker = "MSFT"
@@ -35,7 +40,7 @@ if __name__ == '__main__':
     
     ################ Reference fin_dashboard01.py ################
     # Get the list of stock tickers from S&P500
-    ticker_list = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]['Symbol']
+    ticker_list = sp500_tickers()
 
     # Add the ticker selection on the sidebar
     st.sidebar.selectbox(label="Select a ticker", options=ticker_list,key='ticker', on_change=initialize_ticker_obj)
@@ -43,17 +48,14 @@ if __name__ == '__main__':
     #######################################################################################################################
 
     ######################################################## Title ########################################################
-    if st.session_state.ticker_obj.info.get('longName', None):
-        title_str= st.session_state.ticker_obj.info['longName']
-    elif st.session_state.ticker_obj.info.get('shortName', None):
-        title_str= st.session_state.ticker_obj.info['shortName']
-    else:
-        title_str= st.session_state.ticker_obj.info['symbol']
+    section('Title')
+    title_str = company_name(st.session_state.ticker_obj.info)
     st.header(title_str)
     #st.header(st.session_state.ticker_obj.info['longName'])
     #######################################################################################################################
 
     ################################## Initialize Parameters of Monte Carlo Simulation ####################################
+    section('Simulation Parameters')
     ## Start Date: Select how far back to look at actuals to initialize the algorithm
     ## Number of Simulations: Number of monte carlo simulation to run
     ## Time Horizon: Number of days in future for which stock price prediction will be made
@@ -71,28 +73,70 @@ if __name__ == '__main__':
     
     with col_time_horizon:
         time_horizon = st.selectbox(label="Time Horizon", options=(30,60,90), help="Number of days in future for which stock price prediction will be made")
+    capture_widgets(start_date=start_date, nsim=nsim, time_horizon=time_horizon)
     #######################################################################################################################
 
     ######################################### Monte Carlo Simulation and Plotting #########################################
-    mc_sim = MonteCarlo(ticker=st.session_state.ticker_obj,
+    section('Monte Carlo Simulation and Plotting')
+    # Run simulation, or reuse the paths of an identical earlier run
+    mc_sim = simulate(st.session_state.ticker_obj,
                     start_date=start_date, end_date=end_date,
                     time_horizon=time_horizon, n_simulation=nsim, seed=1024)
 
-    # Run simulation
-    mc_sim.run_simulation()
-
     # Title and Value at Risk
     st.markdown(f"<p style='font-size:30px; font-weight:bold; text-align: center; margin-bottom:0px'>Monte Carlo simulation for {mc_sim.ticker.info['shortName']} stock price in next {str(mc_sim.time_horizon)} days</p><p style='font-size:20px; text-align:center; color:grey'>{mc_sim.value_at_risk()}</p>",unsafe_allow_html=True)
 
     # Plot the results
-    st.pyplot(mc_sim.plot_simulation_price(), clear_figure=True)
+    fig = mc_sim.plot_simulation_price()
+    with span('pyplot', 'render'):
+        st.pyplot(fig, clear_figure=True)
+    #######################################################################################################################
+
+    ############################################### Value at Risk Backtest ################################################
+    section('Value at Risk Backtest')
+    ## Slide the estimation window over 10 years and count the days the realized loss exceeded the VaR
+    with st.expander("Backtest Value at Risk"):
+        run_backtest = st.checkbox("Run backtest over the last 10 years",
+                                   help="Forecast the VaR every time horizon with an estimation window as long as the selected one, and compare it with the loss realized at the horizon")
+        capture_widgets(backtest=run_backtest)
+        if run_backtest:
+            backtest, summary = mc_sim.backtest(years=10)
+            if not summary['forecasts']:
+                st.text("Not enough history to backtest the selected window and horizon")
+            else:
+                col_breaches, col_kupiec, col_ind, col_cc = st.columns(4)
+                col_breaches.metric("Breaches", f"{summary['breaches']} of {summary['forecasts']}",
+                                    f"{summary['expected']:.1f} expected", delta_color="off")
+                col_kupiec.metric("Kupiec p-value", f"{summary['kupiec_p']:.3f}",
+                                  help="Coverage: is the breach rate 5%? Below 0.05 the VaR is miscalibrated")
+                col_ind.metric("Independence p-value", f"{summary['independence_p']:.3f}",
+                               help="Christoffersen: do breaches cluster? Below 0.05 they do")
+                col_cc.metric("Conditional coverage p-value", f"{summary['conditional_p']:.3f}",
+                              help="Christoffersen: coverage and independence together")
+
+                fig, ax = plt.subplots()
+                fig.set_size_inches(15, 5, forward=True)
+                ax.plot(backtest.index, backtest['var'], color='grey', label='VaR at 95% confidence interval')
+                ax.plot(backtest.index, backtest['loss'], color='tab:blue', label=f'Loss after {time_horizon} days')
+                breaches = backtest[backtest['breach']]
+                ax.scatter(breaches.index, breaches['loss'], color='red', zorder=3, label='Breach')
+                ax.set_ylabel('USD')
+                ax.legend()
+                with span('pyplot', 'render'):
+                    st.pyplot(fig, clear_figure=True)
     #######################################################################################################################
 
     ####################################################### Source ########################################################
+    section('Source')
     source_str="""
     <p style='font-size:15px; color:grey; text-align:right'>
         Historical Data Source: Yahoo Finance
     </p>
     """
     st.markdown(source_str,unsafe_allow_html=True)
-    #######################################################################################################################
\ No newline at end of file
+    #######################################################################################################################
+
+
+if __name__ == '__main__':
+    with rerun_span('Forecasting'), capture('Forecasting'):
+        run()
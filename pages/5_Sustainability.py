@@ -1,24 +1,33 @@
-from humanize import number
 import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
-import yfinance as yf
+
+from esg_index import SCORE_LABELS, SCORES, get_index
+from fundamentals_panel import get_panel
+from market_data import TickerHandle, sp500_tickers
+from reports import company_name, esg_summary
+from rerun_profiler import capture
+from spans import rerun_span, section, span
+from startup_profile import lazy_import, warm_plotly
+
+number = lazy_import('humanize.number')
+go = lazy_import('plotly.graph_objects', on_load=warm_plotly)
 
 
 def initialize_ticker_obj():
     """
-    Store the yfinance ticker object for the selected ticker
-    in session state to reduce API hits and persist ticker
-    selection across pages
+    Store a handle for the selected ticker in session state to
+    persist ticker selection across pages. The data itself is
+    held once per process in the shared cache
     """
-    st.session_state['ticker_obj'] = yf.Ticker(st.session_state.ticker)
+    st.session_state['ticker_obj'] = TickerHandle(st.session_state.ticker)
 
 
-if __name__ == '__main__':
+def run():
     ## Page config
     st.set_page_config(layout="wide")
 
     ####################################################### Ticker #######################################################
+    section('Ticker')
     ## Set ticker value in session state to persist. Default 'MSFT'
     if "ticker" not in st.session_state:
         st.session_state.ticker = "MSFT"
@@ -33,7 +42,7 @@ if __name__ == '__main__':
     
     ################ Reference fin_dashboard01.py ################
     # Get the list of stock tickers from S&P500
-    ticker_list = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]['Symbol']
+    ticker_list = sp500_tickers()
 
     # Add the ticker selection on the sidebar
     st.sidebar.selectbox(label="Select a ticker", options=ticker_list,key='ticker', on_change=initialize_ticker_obj)
@@ -41,27 +50,26 @@ if __name__ == '__main__':
     #######################################################################################################################
 
     ######################################################## Title ########################################################
-    if st.session_state.ticker_obj.info.get('longName', None):
-        title_str= st.session_state.ticker_obj.info['longName']
-    elif st.session_state.ticker_obj.info.get('shortName', None):
-        title_str= st.session_state.ticker_obj.info['shortName']
-    else:
-        title_str= st.session_state.ticker_obj.info['symbol']
+    section('Title')
+    title_str = company_name(st.session_state.ticker_obj.info)
     st.header(title_str)
     #st.header(st.session_state.ticker_obj.info['longName'])
     #######################################################################################################################
 
     ######################################################## Data #########################################################
+    section('Data')
     ## Stop Execution if no data available
-    if st.session_state.ticker_obj.sustainability is None:
+    sustainability = st.session_state.ticker_obj.sustainability
+    if sustainability is None:
         st.text("Sustainaility data is currently unavailable!!")
         st.stop()
 
     ## Data
-    sustain_se = st.session_state.ticker_obj.sustainability.squeeze()
+    esg = esg_summary(sustainability)
     #######################################################################################################################
 
     ################################ Environment, Social and Governance (ESG) Risk Ratings ################################
+    section('ESG Risk Ratings')
     ## Title for sub-section
     st.subheader('Environment, Social and Governance (ESG) Risk Ratings')
     
@@ -90,14 +98,14 @@ if __name__ == '__main__':
             </p>
             <p style='margin-bottom:-10px'>
                 <span style='font-size:40px; font-weight:bold'>
-                    {sustain_se['totalEsg']}
+                    {esg['total_esg']}
                 </span>
                 <span style='font-size:20px'>
-                    |  {number.ordinal(round(sustain_se['percentile']))} percentile
+                    |  {number.ordinal(round(esg['percentile']))} percentile
                 </span>
             </p>
             <p style='font-size:20px; margin-bottom: 20px'>
-                {'Negligile' if sustain_se['esgPerformance']=='LAG_PERF' else 'Low' if sustain_se['esgPerformance']=='UNDER_PERF' else 'Medium' if sustain_se['esgPerformance']=='AVG_PERF' else 'High' if sustain_se['esgPerformance']=='OUT_PERF' else ''}
+                {esg['performance']}
             </p>
             """
         st.markdown(total_str,unsafe_allow_html=True)
@@ -108,7 +116,7 @@ if __name__ == '__main__':
                 Environment Risk Score
             </p>
             <p style='font-size:30px; font-weight:bold'>
-                {sustain_se['environmentScore']}
+                {esg['environment']}
             </p>
             """
         st.markdown(env_str,unsafe_allow_html=True)
@@ -119,7 +127,7 @@ if __name__ == '__main__':
                 Social Risk Score
             </p>
             <p style='font-size:30px; font-weight:bold'>
-                {sustain_se['socialScore']}
+                {esg['social']}
             </p>
             """
         st.markdown(social_str,unsafe_allow_html=True)
@@ -130,18 +138,53 @@ if __name__ == '__main__':
                 Governance Risk Score
             </p>
             <p style='font-size:30px; font-weight:bold'>
-                {sustain_se['governanceScore']}
+                {esg['governance']}
             </p>
             """
         st.markdown(gov_str,unsafe_allow_html=True)
     #######################################################################################################################
+
+    #################################################### Industry Peers ####################################################
+    section('Industry Peers')
+    ## Percentile, rank and nearest peers within the peer group, from the precomputed ESG index
+    esg_index = get_index()
+    industry = esg['peer_group']
+    if esg_index is not None and industry and esg_index.members(industry):
+        st.subheader(f'Industry Peers: {industry}')
+        scores = pd.to_numeric(pd.Series({column: esg[column] for column in SCORES}),
+                               errors='coerce')
+        ranking = pd.DataFrame(index=[SCORE_LABELS[column] for column in scores.index],
+                               columns=['Score', 'Industry Rank', 'Industry Percentile'])
+        for column, value in scores.items():
+            rank = esg_index.rank(industry, column, value)
+            ranking.loc[SCORE_LABELS[column]] = [
+                'N/A' if pd.isna(value) else f'{value:.2f}',
+                f'{rank} of {esg_index.members(industry, column)}' if rank else 'N/A',
+                number.ordinal(round(esg_index.percentile(industry, column, value))) if rank else 'N/A']
+
+        peers = esg_index.peers(industry, scores['total_esg'], exclude=st.session_state.ticker)
+        peers = peers[list(SCORES)].round(2).rename(columns=SCORE_LABELS)
+        peers.insert(0, 'Name', get_panel()['name'].astype(object).reindex(peers.index).fillna(''))
+        peers.index.name = 'Symbol'
+
+        col_rank, col_peers = st.columns([2,3])
+        with col_rank:
+            st.caption('Lower risk ranks first')
+            with span('table', 'render'):
+                st.table(ranking)
+        with col_peers:
+            st.caption('Closest Total ESG Risk Scores in the industry')
+            with span('table', 'render'):
+                st.table(peers)
+    #######################################################################################################################
     
     ################################################## Controversy Level ###################################################
+    section('Controversy Level')
     ## Title for sub-section
     st.subheader('Controversy Level')
     
     ## No Data
-    if not sustain_se['highestControversy']:
+    if not esg['controversy']:
         st.text('Data not available..')
         st.stop()
     
@@ -155,24 +198,31 @@ if __name__ == '__main__':
     st.markdown(formatted_help_str_controversy, unsafe_allow_html=True)
     
     ## Figure
-    gauge_color = 'green' if sustain_se['highestControversy'] <= 2 else 'orange' if sustain_se['highestControversy']<=4 else 'red'
+    gauge_color = 'green' if esg['controversy'] <= 2 else 'orange' if esg['controversy']<=4 else 'red'
     fig = go.Figure(go.Indicator(
             mode = "gauge+number",
-            value = sustain_se['highestControversy'],
+            value = esg['controversy'],
             domain = {'x': [0, 1], 'y': [0, 1]},
             gauge = {
                 'axis': {'range' : [1,5], 'tickvals': [1,2,3,4,5], 'ticktext': ['1','2','3','4','5']},
                 'bar': {'color': gauge_color}
             }
         ))
-    st.plotly_chart(fig, use_container_width=True)
+    with span('plotly_chart', 'render'):
+        st.plotly_chart(fig, use_container_width=True)
     #######################################################################################################################
 
     ####################################################### Source ########################################################
+    section('Source')
     source_str=f"""
     <p style='font-size:15px; color:grey; text-align:right'>
-        ESG data provided by Sustainalytics, Inc. Last updated on {'/'.join(sustain_se.index.name.split('-')[::-1])}
+        ESG data provided by Sustainalytics, Inc. Last updated on {esg['updated']}
     </p>
     """
     st.markdown(source_str,unsafe_allow_html=True)
-    #######################################################################################################################
\ No newline at end of file
+    #######################################################################################################################
+
+
+if __name__ == '__main__':
+    with rerun_span('Sustainability'), capture('Sustainability'):
+        run()
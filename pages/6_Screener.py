@@ -0,0 +1,154 @@
+import time
+
+import streamlit as st
+
+from fundamentals_panel import format_screen, get_panel, screen
+from market_data import TickerHandle, sp500_tickers
+from rerun_profiler import capture, capture_widgets
+from spans import rerun_span, section, span
+
+## Sort choices: label -> panel column
+SORT_COLUMNS = {'Market Cap': 'market_cap', 'P/E': 'pe', 'Forward P/E': 'forward_pe', 'EPS': 'eps',
+                'Beta': 'beta', 'Dividend Yield': 'dividend_yield', 'Upside to Target': 'upside'}
+
+COLUMN_LABELS = {'rank': 'Rank', 'name': 'Name', 'sector': 'Sector', 'industry': 'Industry', 'price': 'Price',
+                 'market_cap': 'Market Cap', 'pe': 'P/E', 'forward_pe': 'Forward P/E', 'eps': 'EPS',
+                 'beta': 'Beta', 'dividend_yield': 'Dividend Yield', 'target_price': 'Target Price',
+                 'upside': 'Upside', 'percentile': 'Percentile'}
+
+
+def initialize_ticker_obj():
+    """
+    Store a handle for the selected ticker in session state to
+    persist ticker selection across pages. The data itself is
+    held once per process in the shared cache
+    """
+    st.session_state['ticker_obj'] = TickerHandle(st.session_state.ticker)
+
+
+def range_filter(label, values, scale=1.0, step=None):
+    """
+    Sidebar slider over the observed range of a panel column. Returns
+    the (low, high) bounds in panel units, or None when the whole range
+    is selected so that rows missing the value are kept
+
+    Parameters
+    ----------
+    label: str
+        Slider label
+
+    values: Series
+        Panel column
+
+    scale: float
+        Display units per panel unit, e.g. 100 for percentages
+        Default: 1.0
+
+    step: float
+        Slider step in display units
+        Default: 1/100 of the range
+    """
+    values = values.dropna()
+    if values.empty:
+        return None
+    low, high = float(values.min() * scale), float(values.max() * scale)
+    if low == high:
+        return None
+    step = step or round((high - low) / 100, 4) or None
+    selected = st.sidebar.slider(label, min_value=low, max_value=high, value=(low, high), step=step)
+    if tuple(selected) == (low, high):
+        return None
+    return selected[0] / scale, selected[1] / scale
+
+
+def run():
+    ## Page config
+    st.set_page_config(layout="wide")
+
+    ####################################################### Ticker #######################################################
+    section('Ticker')
+    ## Set ticker value in session state to persist. Default 'MSFT'
+    if "ticker" not in st.session_state:
+        st.session_state.ticker = "MSFT"
+    else:
+        st.session_state.ticker = st.session_state.ticker
+
+    ## Store stock info in session state to persist
+    if "ticker_obj" not in st.session_state:
+        initialize_ticker_obj()
+    else:
+        st.session_state.ticker_obj = st.session_state.ticker_obj
+
+    ################ Reference fin_dashboard01.py ################
+    # Get the list of stock tickers from S&P500
+    ticker_list = sp500_tickers()
+
+    # Add the ticker selection on the sidebar
+    st.sidebar.selectbox(label="Select a ticker", options=ticker_list,key='ticker', on_change=initialize_ticker_obj)
+    ##############################################################
+    #######################################################################################################################
+
+    ######################################################## Title ########################################################
+    section('Title')
+    st.header("S&P 500 Screener")
+    #######################################################################################################################
+
+    ######################################################## Panel ########################################################
+    section('Panel')
+    ## The panel is read from the local cache only, it is built and refreshed by fundamentals_panel.py
+    with span('fundamentals_panel', 'fetch'):
+        panel = get_panel()
+    if panel.empty:
+        st.warning("The fundamentals panel has not been built yet. Run `python fundamentals_panel.py` to build it.")
+        st.stop()
+    covered = panel.index.isin(ticker_list).sum()
+    st.caption(f"{len(panel)} tickers ({covered} of {len(ticker_list)} in the S&P 500), "
+               f"updated {panel['updated'].min():%Y-%m-%d %H:%M} to {panel['updated'].max():%Y-%m-%d %H:%M}")
+    #######################################################################################################################
+
+    ####################################################### Filters #######################################################
+    section('Filters')
+    st.sidebar.subheader("Filters")
+    sectors = st.sidebar.multiselect("Sector", options=sorted(panel['sector'].cat.categories))
+    ranges = {}
+    for column, label, scale in (('market_cap', 'Market Cap ($B)', 1e-9), ('pe', 'P/E', 1.0),
+                                 ('dividend_yield', 'Dividend Yield (%)', 100.0), ('beta', 'Beta', 1.0),
+                                 ('upside', 'Upside to Target (%)', 100.0)):
+        bounds = range_filter(label, panel[column], scale)
+        if bounds is not None:
+            ranges[column] = bounds
+
+    col1, col2, col3 = st.columns(3)
+    sort_label = col1.selectbox("Sort by", options=list(SORT_COLUMNS))
+    ascending = col2.checkbox("Ascending", value=False)
+    limit = col3.selectbox("Rows", options=[25, 50, 100, 500], index=1)
+    capture_widgets(sectors=sectors, ranges=ranges, sort_by=sort_label, ascending=ascending, rows=limit)
+    #######################################################################################################################
+
+    ####################################################### Results #######################################################
+    section('Results')
+    start = time.perf_counter()
+    result = screen(panel, ranges=ranges, sectors=sectors, sort_by=SORT_COLUMNS[sort_label], ascending=ascending)
+    elapsed = time.perf_counter() - start
+    st.caption(f"{len(result)} of {len(panel)} tickers match, screened in {elapsed * 1000:.1f} ms. "
+               f"Percentile is the {sort_label} percentile within the whole panel.")
+    view = format_screen(result.iloc[:limit]).rename(columns=COLUMN_LABELS)
+    view.index.name = 'Symbol'
+    with span('dataframe', 'render'):
+        st.dataframe(view)
+    #######################################################################################################################
+
+    ####################################################### Source ########################################################
+    section('Source')
+    source_str="""
+    <p style='font-size:15px; color:grey; text-align:right'>
+        Source: Yahoo Finance
+    </p>
+    """
+    st.markdown(source_str,unsafe_allow_html=True)
+    #######################################################################################################################
+
+
+if __name__=='__main__':
+    with rerun_span('Screener'), capture('Screener'):
+        run()
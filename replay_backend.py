@@ -0,0 +1,436 @@
+"""
+Record/replay market data backend for offline and deterministic runs.
+
+The data backend is chosen with the FD_DATA_BACKEND environment variable:
+    live    yfinance over the network (default)
+    record  yfinance over the network, every response is also written
+            to the fixture store
+    replay  responses are served from the fixture store only
+
+Fixtures live in FD_FIXTURE_DIR (default: fixtures/ in the repository),
+one directory per ticker. Replayed price history that was not recorded
+with the exact same arguments is cut from the longest recorded daily
+history and resampled to the requested interval, anchored at the last
+recorded bar so results do not depend on the current date: periods end
+at the last bar, and start/end dates are shifted as if today were the
+day after it.
+
+Record fixtures for a set of tickers from the command line, or generate
+deterministic synthetic ones (price history, info and calendar) for
+benchmarks and CI runs without network access:
+    python replay_backend.py MSFT AAPL --intraday 5m --universe
+    python replay_backend.py MSFT --synthetic
+"""
+import argparse
+from collections import Counter
+from contextlib import contextmanager
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+from fundamentals_store import DATASETS
+
+BACKEND = os.environ.get('FD_DATA_BACKEND', 'live').lower()
+FIXTURE_DIR = os.environ.get('FD_FIXTURE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures'))
+
+ATTRIBUTES = ('info', 'calendar') + DATASETS
+UNIVERSE = '_universe'
+
+## Pandas offsets for replayed periods and resample rules for intervals
+PERIOD_OFFSETS = {'1d': pd.DateOffset(days=1), '5d': pd.DateOffset(days=5), '1mo': pd.DateOffset(months=1),
+                  '3mo': pd.DateOffset(months=3), '6mo': pd.DateOffset(months=6), '1y': pd.DateOffset(years=1),
+                  '2y': pd.DateOffset(years=2), '3y': pd.DateOffset(years=3), '5y': pd.DateOffset(years=5),
+                  '10y': pd.DateOffset(years=10)}
+RESAMPLE_RULES = {'5d': '5D', '1wk': 'W-MON', '1mo': 'MS', '3mo': 'QS'}
+
+## Number of responses served by the replay backend per (ticker, dataset)
+fetch_counts = Counter()
+_counts_lock = threading.Lock()
+_local = threading.local()
+
+
+class FixtureStore(object):
+    """
+    Pickled responses per ticker, kept in memory after the first load
+
+    Parameters
+    ----------
+    root: str
+        Fixture directory
+        Default: FD_FIXTURE_DIR
+    """
+    def __init__(self, root=FIXTURE_DIR):
+        self.root = root
+        self._memory = {}
+        self._lock = threading.RLock()
+
+    def _path(self, symbol, name):
+        return os.path.join(self.root, symbol.upper(), f'{name}.pkl')
+
+    def load(self, symbol, name):
+        """
+        Return a recorded response. Raises KeyError if not recorded
+
+        Parameters
+        ----------
+        symbol: str
+            The ticker symbol
+
+        name: str
+            Name of the response, e.g. info or history
+        """
+        key = (symbol.upper(), name)
+        with self._lock:
+            if key not in self._memory:
+                try:
+                    with open(self._path(symbol, name), 'rb') as f:
+                        self._memory[key] = pickle.load(f)
+                except FileNotFoundError:
+                    raise KeyError(f'No {name} fixture recorded for {symbol} in {self.root}') from None
+            return self._memory[key]
+
+    def save(self, symbol, name, value):
+        """
+        Record a response
+
+        Parameters
+        ----------
+        symbol: str
+            The ticker symbol
+
+        name: str
+            Name of the response
+
+        value: object
+            The response
+        """
+        path = self._path(symbol, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            with open(path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._memory[(symbol.upper(), name)] = value
+
+    def save_item(self, symbol, name, key, value):
+        """
+        Record one entry of a response kept as a dict, e.g. one history
+        request. The dict is replaced, not modified, so readers holding
+        the previous one are not affected
+
+        Parameters
+        ----------
+        symbol: str
+            The ticker symbol
+
+        name: str
+            Name of the response
+
+        key: object
+            Entry key
+
+        value: object
+            Entry value
+        """
+        with self._lock:
+            try:
+                items = dict(self.load(symbol, name))
+            except KeyError:
+                items = {}
+            items[key] = value
+            self.save(symbol, name, items)
+
+    def symbols(self):
+        """
+        Tickers with recorded fixtures
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if name != UNIVERSE and os.path.isdir(os.path.join(self.root, name)))
+
+
+def history_key(period, interval, start, end):
+    """
+    Key of a recorded history response
+    """
+    return (None if start is not None else period, interval,
+            None if start is None else str(pd.Timestamp(start).date()),
+            None if end is None else str(pd.Timestamp(end).date()))
+
+
+class RecordingTicker(object):
+    """
+    yfinance ticker wrapper that records every response
+
+    Parameters
+    ----------
+    ticker_obj: yfinance.Ticker object
+        The live ticker
+
+    store: FixtureStore
+        Where responses are recorded
+    """
+    def __init__(self, ticker_obj, store):
+        self._ticker_obj = ticker_obj
+        self._store = store
+        self.ticker = ticker_obj.ticker
+
+    def __getattr__(self, name):
+        value = getattr(self._ticker_obj, name)
+        if name in ATTRIBUTES:
+            self._store.save(self.ticker, name, value)
+        return value
+
+    def history(self, period='1mo', interval='1d', start=None, end=None, **kwargs):
+        frame = self._ticker_obj.history(period, interval, start, end, **kwargs)
+        self._store.save_item(self.ticker, 'history', history_key(period, interval, start, end), frame)
+        return frame
+
+
+def _resample(frame, interval):
+    """
+    Aggregate daily bars to a longer interval
+    """
+    rule = RESAMPLE_RULES.get(interval)
+    if rule is None or frame.empty:
+        return frame
+    how = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+    how.update({name: 'sum' for name in frame.columns if name not in how})
+    return frame.resample(rule).agg(how).dropna(subset=['Close'])
+
+
+class ReplayTicker(object):
+    """
+    Stand-in for yfinance.Ticker serving recorded responses
+
+    Parameters
+    ----------
+    symbol: str
+        The ticker symbol
+
+    store: FixtureStore
+        The recorded responses
+    """
+    def __init__(self, symbol, store):
+        self.ticker = symbol.upper()
+        self._store = store
+
+    def _count(self, name):
+        with _counts_lock:
+            fetch_counts[(self.ticker, name)] += 1
+        tracked = getattr(_local, 'tracked', None)
+        if tracked is not None:
+            tracked[name] += 1
+
+    def __getattr__(self, name):
+        if name not in ATTRIBUTES:
+            raise AttributeError(name)
+        self._count(name)
+        return self._store.load(self.ticker, name)
+
+    def history(self, period='1mo', interval='1d', start=None, end=None, **kwargs):
+        self._count('history')
+        recorded = self._store.load(self.ticker, 'history')
+        key = history_key(period, interval, start, end)
+        if key in recorded:
+            return recorded[key]
+        intraday = interval.endswith('m') or interval == '1h'
+        if intraday:
+            candidates = [k for k in recorded if k[1] == interval]
+            if not candidates:
+                raise KeyError(f'No {interval} history recorded for {self.ticker}')
+            frame = recorded[candidates[0]]
+        else:
+            daily = [k for k in recorded if k[1] == '1d']
+            if not daily:
+                raise KeyError(f'No daily history recorded for {self.ticker}')
+            frame = max((recorded[k] for k in daily), key=len)
+        if frame.empty:
+            return frame
+        last = frame.index[-1]
+        if start is not None or end is not None:
+            ## Dates are picked relative to today: move them by the time between
+            ## today and the day after the last recorded bar
+            anchor = (last.tz_localize(None) if last.tzinfo is not None else last).normalize() + pd.Timedelta(days=1)
+            shift = pd.Timestamp.today().normalize() - anchor
+            lower = pd.Timestamp(start) - shift if start is not None else frame.index[0]
+            upper = pd.Timestamp(end) - shift if end is not None else last + pd.Timedelta(days=1)
+            if frame.index.tz is not None:
+                lower, upper = (t.tz_localize(frame.index.tz) if t.tzinfo is None else t for t in (lower, upper))
+            frame = frame[(frame.index >= lower) & (frame.index < upper)]
+        elif period == 'ytd':
+            frame = frame[frame.index.year == last.year]
+        elif period in PERIOD_OFFSETS:
+            frame = frame[frame.index > last - PERIOD_OFFSETS[period]]
+        return frame if intraday else _resample(frame, interval)
+
+
+@contextmanager
+def track_fetches():
+    """
+    Count the responses served to the current thread by dataset name.
+    Yields the Counter, which is filled in while the block runs
+    """
+    previous = getattr(_local, 'tracked', None)
+    _local.tracked = Counter()
+    try:
+        yield _local.tracked
+    finally:
+        _local.tracked = previous
+
+
+_store = None
+
+
+def get_fixture_store():
+    """
+    Return the process-wide FixtureStore
+    """
+    global _store
+    if _store is None:
+        _store = FixtureStore()
+    return _store
+
+
+def wrap_ticker(symbol, live_factory):
+    """
+    Return the ticker object for the configured backend
+
+    Parameters
+    ----------
+    symbol: str
+        The ticker symbol
+
+    live_factory: callable
+        Function creating the live yfinance.Ticker for a symbol
+    """
+    if BACKEND == 'replay':
+        return ReplayTicker(symbol, get_fixture_store())
+    if BACKEND == 'record':
+        return RecordingTicker(live_factory(symbol), get_fixture_store())
+    return live_factory(symbol)
+
+
+def wrap_ticker_list(live_fetch):
+    """
+    Return the S&P 500 ticker list for the configured backend
+
+    Parameters
+    ----------
+    live_fetch: callable
+        Function fetching the live ticker list
+    """
+    store = get_fixture_store()
+    if BACKEND == 'replay':
+        try:
+            return store.load(UNIVERSE, 'sp500_tickers')
+        except KeyError:
+            return pd.Series(store.symbols(), name='Symbol')
+    tickers = live_fetch()
+    if BACKEND == 'record':
+        store.save(UNIVERSE, 'sp500_tickers', tickers)
+    return tickers
+
+
+def record(symbols, intraday=(), universe=False, store=None):
+    """
+    Record all datasets used by the pages for a list of tickers
+
+    Parameters
+    ----------
+    symbols: list
+        Ticker symbols
+
+    intraday: iterable
+        Intraday intervals to record for the last 5 days
+
+    universe: bool
+        Also record the S&P 500 ticker list
+        Default: False
+
+    store: FixtureStore
+        Default: the process-wide store
+    """
+    import yfinance as yf
+
+    from http_transport import get_session
+    from market_data import fetch_sp500_tickers
+
+    store = store or get_fixture_store()
+    if universe:
+        store.save(UNIVERSE, 'sp500_tickers', fetch_sp500_tickers())
+    for symbol in symbols:
+        ticker = RecordingTicker(yf.Ticker(symbol, session=get_session()), store)
+        for name in ATTRIBUTES:
+            getattr(ticker, name)
+        ticker.history(period='max', interval='1d')
+        for interval in intraday:
+            ticker.history(period='5d', interval=interval)
+
+
+def synthetic(symbols, store=None, years=10, end='2022-11-30', seed=0):
+    """
+    Write synthetic fixtures for a list of tickers: a random walk of daily
+    bars, info and calendar. The same arguments always give the same
+    fixtures
+
+    Parameters
+    ----------
+    symbols: list
+        Ticker symbols
+
+    store: FixtureStore
+        Default: the process-wide store
+
+    years: int
+        Years of daily bars
+        Default: 10
+
+    end: str
+        Date of the last bar
+        Default: 2022-11-30
+
+    seed: int
+        Seed for random number generator
+        Default: 0
+    """
+    store = store or get_fixture_store()
+    index = pd.bdate_range(end=end, periods=years * 252, name='Date')
+    for position, symbol in enumerate(symbols):
+        rng = np.random.RandomState(seed + position)
+        close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, len(index))))
+        spread = np.abs(rng.normal(0, 0.01, len(index)))
+        history = pd.DataFrame({'Open': close * (1 + rng.normal(0, 0.005, len(index))),
+                                'High': close * (1 + spread), 'Low': close * (1 - spread), 'Close': close,
+                                'Volume': rng.randint(1_000_000, 50_000_000, len(index)),
+                                'Dividends': 0.0, 'Stock Splits': 0.0}, index=index)
+        last = float(close[-1])
+        info = {'symbol': symbol, 'longName': f'{symbol} Synthetic', 'shortName': symbol, 'currency': 'USD',
+                'currentPrice': last, 'previousClose': float(close[-2]), 'open': float(history['Open'].iloc[-1]),
+                'bid': last, 'bidSize': 100, 'ask': last, 'askSize': 100,
+                'dayLow': float(history['Low'].iloc[-1]), 'dayHigh': float(history['High'].iloc[-1]),
+                'fiftyTwoWeekLow': float(close[-252:].min()), 'fiftyTwoWeekHigh': float(close[-252:].max()),
+                'volume': int(history['Volume'].iloc[-1]), 'averageVolume': int(history['Volume'].iloc[-63:].mean()),
+                'marketCap': int(last * 1e9), 'beta': 1.0, 'trailingPE': 20.0, 'trailingEps': last / 20,
+                'dividendRate': None, 'dividendYield': None, 'exDividendDate': None, 'targetMeanPrice': last * 1.1}
+        earnings = pd.Timestamp(end) + pd.DateOffset(months=2)
+        calendar = pd.DataFrame({0: [earnings], 1: [earnings + pd.Timedelta(days=4)]}, index=['Earnings Date'])
+        store.save(symbol, 'info', info)
+        store.save(symbol, 'calendar', calendar)
+        store.save(symbol, 'history', {history_key('max', '1d', None, None): history})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record market data fixtures for offline replay')
+    parser.add_argument('symbols', nargs='+', help='Ticker symbols to record')
+    parser.add_argument('--intraday', nargs='*', default=(), help='Intraday intervals to record, e.g. 5m')
+    parser.add_argument('--universe', action='store_true', help='Also record the S&P 500 ticker list')
+    parser.add_argument('--synthetic', action='store_true', help='Write synthetic fixtures instead of recording')
+    args = parser.parse_args()
+    if args.synthetic:
+        synthetic(args.symbols)
+    else:
+        record(args.symbols, args.intraday, args.universe)
@@ -0,0 +1,301 @@
+"""
+Page computations as plain functions, shared by the Streamlit pages and
+the batch report generator.
+
+Nothing here imports streamlit. Each function takes a TickerHandle (or
+the data read from it) and returns display-ready values, so the same
+numbers appear on the pages and in the reports written by
+batch_report.py.
+
+Monte Carlo simulations are reused: a simulation is identified by its
+ticker, window, horizon, number of paths, seed and the volatility and
+last close of its window. Its paths are kept in the process cache and
+in the cache directory, where every page worker and batch process finds
+them.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import logging
+import os
+import pickle
+import time
+
+import pandas as pd
+
+from data_cache import get_cache
+from fundamentals_store import CACHE_DIR
+from statements import human_format_array, metrics_view, statement_view
+
+SIMULATION_DIR = os.path.join(CACHE_DIR, 'montecarlo')
+## Seconds a simulation is kept in the process cache, and days on disk
+SIMULATION_TTL = 60 * 60
+SIMULATION_MAX_AGE = 7
+
+## (tab, sub-tab) -> statement datasets, in page order
+STATEMENTS = OrderedDict([
+    (('Income Statement', 'Quarterly'), 'quarterly_financials'),
+    (('Income Statement', 'Yearly'), 'financials'),
+    (('Balance Sheet', 'Quarterly'), 'quarterly_balance_sheet'),
+    (('Balance Sheet', 'Yearly'), 'balance_sheet'),
+    (('Cash Flow', 'Quarterly'), 'quarterly_cashflow'),
+    (('Cash Flow', 'Yearly'), 'cashflow'),
+])
+METRICS = OrderedDict([
+    (('Key Metrics', 'Quarterly'), ('quarterly', ('quarterly_financials', 'quarterly_balance_sheet',
+                                                  'quarterly_cashflow'))),
+    (('Key Metrics', 'Yearly'), ('yearly', ('financials', 'balance_sheet', 'cashflow'))),
+])
+
+ESG_PERFORMANCE = {'LAG_PERF': 'Negligible', 'UNDER_PERF': 'Low', 'AVG_PERF': 'Medium', 'OUT_PERF': 'High'}
+
+logger = logging.getLogger(__name__)
+
+
+def company_name(info):
+    """
+    Long name of the company, or its short name or symbol when missing
+
+    Parameters
+    ----------
+    info: dict
+        yfinance ticker info
+    """
+    return info.get('longName') or info.get('shortName') or info['symbol']
+
+
+def _round(value):
+    return f"{round(value, 2) if value else 'N/A'}"
+
+
+def summary_tables(info, calendar):
+    """
+    The two key/value tables of the Summary page: trading data, then
+    valuation and dividend data
+
+    Parameters
+    ----------
+    info: dict
+        yfinance ticker info
+
+    calendar: DataFrame
+        yfinance ticker calendar
+    """
+    trading = OrderedDict([
+        ("Previous Close", _round(info['previousClose'])),
+        ("Open", _round(info['open'])),
+        ("Bid", f"{info['bid']} x {info['bidSize']}"),
+        ("Ask", f"{info['ask']} x {info['askSize']}"),
+        ("Days's Range", f"{info['dayLow']} - {info['dayHigh']}"),
+        ("52 Week Range", f"{info['fiftyTwoWeekLow']} - {info['fiftyTwoWeekHigh']}"),
+        ("Volume", f"{info['volume']:,}"),
+        ("Average Volume", f"{info['averageVolume']:,}"),
+    ])
+    earnings = calendar.loc['Earnings Date']
+    valuation = OrderedDict([
+        ("Market Cap", human_format_array([info['marketCap']])[0] if info['marketCap'] is not None else 'N/A'),
+        ("Beta", _round(info['beta'])),
+        ("PE Ratio (TTM)", _round(info['trailingPE'])),
+        ("EPS (TTM)", _round(info['trailingEps'])),
+        ("Earnings Date", ' - '.join(earnings.map(lambda x: x.date().strftime('%b %d, %Y')).to_list())
+                          if earnings.any() else 'N/A'),
+        ("Forward Dividend & Yield", f"{info.get('dividendRate', 'N/A')} "
+                                     f"({str(round(info['dividendYield'] * 100, 2)) + '%' if info['dividendYield'] else 'N/A'})"),
+        ("exDividendDate", pd.to_datetime(info['exDividendDate'], unit='s', origin='unix').strftime("%b %d, %Y")
+                           if info['exDividendDate'] else "N/A"),
+        ("1y Target EST", _round(info['targetMeanPrice'])),
+    ])
+    return trading, valuation
+
+
+def financial_views(handle):
+    """
+    Formatted statements and key metrics of the Financials page, by
+    (tab, sub-tab), e.g. ('Balance Sheet', 'Yearly')
+
+    Parameters
+    ----------
+    handle: TickerHandle
+        The ticker
+    """
+    versions, frames = {}, {}
+    for name in STATEMENTS.values():
+        versions[name], frames[name] = handle.versioned_dataset(name)
+    views = OrderedDict()
+    for label, name in STATEMENTS.items():
+        views[label] = statement_view(handle.ticker, name, frames[name], versions[name])
+    for label, (frequency, names) in METRICS.items():
+        views[label] = metrics_view(handle.ticker, *(frames[name] for name in names), frequency=frequency,
+                                    version=tuple(versions[name] for name in names))
+    return views
+
+
+def _simulation_path(key):
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(SIMULATION_DIR, f'{key[0]}-{digest}.pkl')
+
+
+def simulate(handle, start_date, end_date, time_horizon, n_simulation, seed=1024):
+    """
+    MonteCarlo for the ticker with its simulation run, reusing the paths
+    of an identical earlier run from this process or the cache directory
+
+    Parameters
+    ----------
+    handle: TickerHandle
+        The ticker
+
+    Other parameters as in MonteCarlo
+    """
+    from monte_carlo import MonteCarlo
+
+    mc_sim = MonteCarlo(ticker=handle, start_date=start_date, end_date=end_date,
+                        time_horizon=time_horizon, n_simulation=n_simulation, seed=seed)
+    close = mc_sim.stock_price['Close']
+    key = (handle.ticker, str(start_date), str(end_date), time_horizon, n_simulation, seed,
+           repr(float(mc_sim.daily_volatility)), repr(float(close.iloc[-1])) if len(close) else None)
+
+    def load_or_run():
+        path = _simulation_path(key)
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+        mc_sim.run_simulation()
+        os.makedirs(SIMULATION_DIR, exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(mc_sim.simulation_df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        return mc_sim.simulation_df
+
+    mc_sim.simulation_df = get_cache().get_or_fetch(('montecarlo',) + key, load_or_run, ttl=SIMULATION_TTL)
+    return mc_sim
+
+
+def prune_simulations(max_age=SIMULATION_MAX_AGE):
+    """
+    Remove saved simulations older than max_age days. Returns the number
+    of files removed
+    """
+    cutoff = time.time() - max_age * 24 * 60 * 60
+    removed = 0
+    for name in os.listdir(SIMULATION_DIR) if os.path.isdir(SIMULATION_DIR) else ():
+        path = os.path.join(SIMULATION_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def forecast_summary(mc_sim, confidence=0.95):
+    """
+    Last close, VaR and percentiles of the simulated final price
+
+    Parameters
+    ----------
+    mc_sim: MonteCarlo
+        A MonteCarlo with its simulation run
+
+    confidence: float
+        VaR confidence level
+        Default: 0.95
+    """
+    final = mc_sim.simulation_df.iloc[-1].to_numpy(dtype='float64')
+    last_price = float(mc_sim.stock_price['Close'].iloc[-1])
+    quantiles = pd.Series(final).quantile([0.05, 0.25, 0.5, 0.75, 0.95])
+    return {'last_price': last_price, 'time_horizon': mc_sim.time_horizon, 'n_simulation': mc_sim.n_simulation,
+            'daily_volatility': float(mc_sim.daily_volatility), 'confidence': confidence,
+            'value_at_risk': last_price - float(pd.Series(final).quantile(1 - confidence)),
+            'final_price_percentiles': {f'p{round(q * 100)}': float(v) for q, v in quantiles.items()}}
+
+
+def esg_summary(sustainability):
+    """
+    Scores shown on the Sustainability page, or None without ESG data
+
+    Parameters
+    ----------
+    sustainability: DataFrame
+        yfinance ticker sustainability
+    """
+    if sustainability is None:
+        return None
+    sustain_se = sustainability.squeeze()
+    return {'total_esg': sustain_se.get('totalEsg'), 'percentile': sustain_se.get('percentile'),
+            'performance': ESG_PERFORMANCE.get(sustain_se.get('esgPerformance'), ''),
+            'environment': sustain_se.get('environmentScore'), 'social': sustain_se.get('socialScore'),
+            'governance': sustain_se.get('governanceScore'), 'controversy': sustain_se.get('highestControversy'),
+            'peer_group': sustain_se.get('peerGroup'),
+            'updated': '/'.join(str(sustain_se.index.name).split('-')[::-1]) if sustain_se.index.name else None}
+
+
+SECTIONS = ('summary', 'financials', 'forecasting', 'sustainability')
+
+
+def build_report(symbol, sections=SECTIONS, start_date=None, end_date=None, time_horizon=30, n_simulation=1000,
+                 seed=1024):
+    """
+    Compute the sections of a ticker report. Returns a dict with the
+    symbol, name, generation time, one entry per section and the errors
+    of the sections that failed
+
+    Parameters
+    ----------
+    symbol: str
+        The ticker symbol
+
+    sections: tuple
+        Valid sections: summary, financials, forecasting, sustainability
+        Default: all
+
+    start_date: date
+        Start of the Monte Carlo estimation window
+        Default: one year before end_date
+
+    end_date: date
+        End of the Monte Carlo estimation window
+        Default: yesterday
+
+    time_horizon, n_simulation, seed:
+        As in MonteCarlo
+    """
+    from market_data import TickerHandle
+
+    handle = TickerHandle(symbol)
+    end_date = end_date or datetime.today().date() - timedelta(days=1)
+    start_date = start_date or end_date - timedelta(days=365)
+    report = {'symbol': handle.ticker, 'generated': datetime.now().isoformat(timespec='seconds'), 'errors': {}}
+    try:
+        info = handle.info
+        report['name'] = company_name(info)
+        report['currency'] = info.get('currency')
+    except Exception as e:
+        report['name'], report['currency'] = handle.ticker, None
+        report['errors']['info'] = repr(e)
+
+    for name in sections:
+        try:
+            if name == 'summary':
+                trading, valuation = summary_tables(handle.info, handle.calendar)
+                report['summary'] = {'current_price': handle.info.get('currentPrice'), 'trading': trading,
+                                     'valuation': valuation,
+                                     'history': handle.history(period='1y', interval='1d')['Close']}
+            elif name == 'financials':
+                report['financials'] = financial_views(handle)
+            elif name == 'forecasting':
+                mc_sim = simulate(handle, start_date, end_date, time_horizon, n_simulation, seed)
+                report['forecasting'] = dict(forecast_summary(mc_sim), simulation=mc_sim,
+                                             start_date=str(start_date), end_date=str(end_date))
+            elif name == 'sustainability':
+                report['sustainability'] = esg_summary(handle.sustainability)
+            else:
+                raise ValueError(f'Unknown section: {name}')
+        except Exception as e:
+            logger.warning('%s %s failed: %r', handle.ticker, name, e)
+            report['errors'][name] = repr(e)
+    return report
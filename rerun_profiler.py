@@ -0,0 +1,267 @@
+"""
+On-demand sampling profiles of single page reruns.
+
+A capture samples the stack of the thread running the page script from a
+background thread, so the rerun itself runs unmodified. It is written
+in the folded stack format read by flamegraph.pl, speedscope and
+inferno, with a JSON file next to it holding the page, ticker and
+widget values of the rerun and how it ended.
+
+Pages run their body inside `with capture(page):`, which stops the
+sampler however the rerun ends, and report their widget values with
+`capture_widgets`.
+
+A rerun is captured when:
+    - the page URL has ?profile=1, for the reruns of that session only
+    - FD_PROFILE is 1/all or a comma separated list of page names;
+      FD_PROFILE_RATE (default 1) is the fraction of those reruns captured
+
+Settings:
+    FD_PROFILE_DIR       output directory (default <FD_CACHE_DIR>/profiles)
+    FD_PROFILE_INTERVAL  seconds between samples (default 0.005)
+"""
+from collections import Counter
+from datetime import date, datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from fundamentals_store import CACHE_DIR
+from spans import rerun_status
+
+PAGES = os.environ.get('FD_PROFILE', '').strip()
+RATE = float(os.environ.get('FD_PROFILE_RATE', 1))
+PROFILE_DIR = os.environ.get('FD_PROFILE_DIR', os.path.join(CACHE_DIR, 'profiles'))
+INTERVAL = float(os.environ.get('FD_PROFILE_INTERVAL', 0.005))
+
+_local = threading.local()
+_counter = 0
+_counter_lock = threading.Lock()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    name = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+    return name.replace(';', ':')
+
+
+class SamplingProfiler(object):
+    """
+    Samples the Python stack of one thread at a fixed interval
+
+    Parameters
+    ----------
+    thread_id: int
+        Identifier of the thread to sample
+        Default: the current thread
+
+    interval: float
+        Seconds between samples
+        Default: FD_PROFILE_INTERVAL
+
+    root: str
+        Path of the script whose outermost frame starts the recorded
+        stacks. Frames above it (thread and script runner machinery)
+        are dropped
+    """
+    def __init__(self, thread_id=None, interval=INTERVAL, root=None):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.root = root
+        self.samples = Counter()
+        self.started = None
+        self.seconds = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stack(self, frame):
+        names = []
+        outermost = None
+        while frame is not None:
+            if frame.f_code.co_filename == self.root:
+                outermost = len(names)
+            names.append(_frame_name(frame))
+            frame = frame.f_back
+        if outermost is not None:
+            names = names[:outermost + 1]
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[self._stack(frame)] += 1
+            del frame
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='rerun-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def folded(self, prefix=None):
+        """
+        Return the samples as folded stacks, one 'frame;frame;... count'
+        line per distinct stack
+
+        Parameters
+        ----------
+        prefix: str
+            Frame added at the root of every stack, e.g. the page and ticker
+        """
+        lines = []
+        for stack, count in self.samples.most_common():
+            if prefix:
+                stack = f'{prefix};{stack}'
+            lines.append(f'{stack} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _query_params():
+    import streamlit as st
+    return st.experimental_get_query_params()
+
+
+def _requested(page):
+    """
+    Whether the current rerun of page is to be captured, and the trigger
+    """
+    requested = _query_params().get('profile')
+    if requested and requested[-1].lower() in ('1', 'true', 'yes'):
+        return 'query'
+    if PAGES:
+        pages = [name.strip().lower() for name in PAGES.split(',')]
+        if ('1' in pages or 'all' in pages or page.lower() in pages) and random.random() < RATE:
+            return 'env'
+    return None
+
+
+def start_capture(page, root=None):
+    """
+    Start sampling the current page rerun if a capture is requested.
+    A capture left running by an earlier rerun of the thread is
+    stopped and discarded
+
+    Parameters
+    ----------
+    page: str
+        Name of the page
+
+    root: str
+        Path of the page script
+        Default: the file of the caller
+    """
+    previous = getattr(_local, 'capture', None)
+    _local.capture = None
+    if previous is not None:
+        previous['profiler'].stop()
+    trigger = _requested(page)
+    if trigger is None:
+        return
+    root = root or sys._getframe(1).f_code.co_filename
+    _local.capture = {'page': page, 'trigger': trigger, 'started': datetime.now(), 'widgets': {},
+                      'profiler': SamplingProfiler(root=root).start()}
+
+
+def capture_widgets(**widgets):
+    """
+    Record values of the page inputs that are not kept in session state,
+    e.g. nsim=1000, with the capture of the current rerun
+
+    Parameters
+    ----------
+    widgets:
+        Input values by name
+    """
+    current = getattr(_local, 'capture', None)
+    if current is not None:
+        current['widgets'].update(widgets)
+
+
+class capture(object):
+    """
+    Context manager capturing the page rerun run inside it if a capture
+    is requested. The capture is finished when the block exits, also
+    when the rerun ends early
+
+    Parameters
+    ----------
+    page: str
+        Name of the page
+    """
+    def __init__(self, page):
+        self.page = page
+
+    def __enter__(self):
+        start_capture(self.page, root=sys._getframe(1).f_code.co_filename)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        finish_capture(status=rerun_status(exc_type))
+        return False
+
+
+def _jsonable(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return repr(value)
+
+
+def finish_capture(status='ok', **widgets):
+    """
+    Stop the capture of the current rerun and write it. Returns the path
+    of the folded stacks file, or None if the rerun was not captured
+
+    Parameters
+    ----------
+    status: str
+        How the rerun ended. Valid status: ok, stopped, rerun, error
+        Default: ok
+
+    widgets:
+        Values of the page inputs that are not kept in session state,
+        e.g. nsim=1000
+    """
+    global _counter
+    current = getattr(_local, 'capture', None)
+    if current is None:
+        return None
+    _local.capture = None
+    page, trigger, started, profiler = current['page'], current['trigger'], current['started'], current['profiler']
+    profiler.stop()
+    widgets = dict(current['widgets'], **widgets)
+
+    import streamlit as st
+    ticker = st.session_state.get('ticker')
+    state = {key: _jsonable(st.session_state[key]) for key in st.session_state if key != 'ticker_obj'}
+    with _counter_lock:
+        _counter += 1
+        number = _counter
+    name = f'{started:%Y%m%dT%H%M%S}-{page}-{ticker}-{os.getpid()}-{number}'
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f'{name}.folded')
+    with open(path, 'w') as f:
+        f.write(profiler.folded(prefix=f'{page} [{ticker}]'))
+    meta = {'page': page, 'ticker': ticker, 'trigger': trigger, 'status': status, 'started': started.isoformat(),
+            'seconds': profiler.seconds, 'samples': sum(profiler.samples.values()), 'interval': profiler.interval,
+            'widgets': {key: _jsonable(value) for key, value in widgets.items()}, 'session_state': state,
+            'query_params': _query_params(), 'pid': os.getpid(), 'python': sys.version.split()[0]}
+    with open(os.path.join(PROFILE_DIR, f'{name}.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    ## The page of a rerun request is replaced before the caption shows
+    if trigger == 'query' and status != 'rerun':
+        st.caption(f'Profile of this rerun written to {path}')
+    return path
@@ -0,0 +1,169 @@
+"""
+Host-wide sharing of cached frames between Streamlit worker processes.
+
+Frames are written once as uncompressed Arrow IPC files in a shared
+memory directory (/dev/shm by default) and every worker maps them
+read-only. Numeric columns are converted to pandas without copying, so
+the data of a hot ticker lives once in the page cache of the host
+instead of once per process.
+
+Files are replaced atomically. Readers that still map an older version
+keep it until they drop their frame. Set FD_SHARED_DIR to change the
+directory, or FD_SHARED_FRAMES=0 to disable sharing.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from startup_profile import lazy_import
+
+pa = lazy_import('pyarrow')
+
+ENABLED = os.environ.get('FD_SHARED_FRAMES', '1').lower() not in ('0', 'false', 'no')
+SHARED_DIR = os.environ.get('FD_SHARED_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'financial_dashboard'))
+
+## Remove segments older than this on every PRUNE_EVERY writes
+MAX_SEGMENT_AGE = 24 * 60 * 60
+PRUNE_EVERY = 100
+
+
+def _dense(df):
+    """
+    Arrow has no sparse columns, store them dense
+    """
+    sparse = [name for name, dtype in df.dtypes.items() if isinstance(dtype, pd.SparseDtype)]
+    if not sparse:
+        return df
+    return df.assign(**{name: df[name].sparse.to_dense() for name in sparse})
+
+
+class SharedFrameStore(object):
+    """
+    Memory-mapped Arrow IPC store for DataFrames shared by all
+    processes on a host
+
+    Parameters
+    ----------
+    root: str
+        Directory for the segments
+        Default: FD_SHARED_DIR
+
+    Methods
+    -------
+
+    get
+        Map a stored frame read-only, or None if missing or too old
+
+    put
+        Store a frame and return its mapped read-only version
+
+    prune
+        Remove old segments
+    """
+    def __init__(self, root=SHARED_DIR):
+        self.root = root
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.root, f'{digest}.arrow')
+
+    @staticmethod
+    def _map(path):
+        ## The mapped buffers keep the memory map alive, do not close it
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        return table.to_pandas(split_blocks=True)
+
+    def get(self, key, max_age=None):
+        """
+        Return the stored frame for key mapped read-only, or None
+
+        Parameters
+        ----------
+        key: hashable
+            The frame key. Its repr identifies the segment
+
+        max_age: float
+            Ignore segments older than this many seconds.
+            None accepts any age
+        """
+        path = self._path(key)
+        try:
+            if max_age is not None and time.time() - os.path.getmtime(path) > max_age:
+                return None
+            return self._map(path)
+        except (OSError, pa.ArrowInvalid):
+            return None
+
+    def put(self, key, df):
+        """
+        Store a frame and return the mapped read-only version of it
+
+        Parameters
+        ----------
+        key: hashable
+            The frame key. Its repr identifies the segment
+
+        df: DataFrame
+            The frame to share
+        """
+        path = self._path(key)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        table = pa.Table.from_pandas(_dense(df), preserve_index=True)
+        with pa.OSFile(tmp, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return self._map(path)
+
+    def prune(self, max_age=MAX_SEGMENT_AGE):
+        """
+        Remove segments older than max_age seconds
+
+        Parameters
+        ----------
+        max_age: float
+            Age in seconds
+            Default: MAX_SEGMENT_AGE
+        """
+        cutoff = time.time() - max_age
+        for entry in os.scandir(self.root):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_shared_store():
+    """
+    Return the SharedFrameStore of this process, or None when
+    sharing is disabled or unavailable
+    """
+    global _store
+    if not ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                pa.__version__
+                _store = SharedFrameStore()
+            except (ImportError, OSError):
+                return None
+        return _store
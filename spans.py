@@ -0,0 +1,343 @@
+"""
+Timing spans for page sections and data calls.
+
+Setting the environment variable FD_SPANS=1 turns the timing on. A page
+rerun runs inside `with rerun_span(page):`, which records it however it
+ends: completed ('ok'), by st.stop() ('stopped'), by a rerun request
+('rerun') or by an exception ('error'). Each rerun is split into the
+sections marked by the banner comments of the page: `section(name)` ends
+the previous section and starts the next.
+Inside a section, `span(name, kind)` times one operation, e.g. a data
+call ('fetch') or sending a chart to the browser ('render'). Time of a
+section not spent in fetch or render spans is counted as compute.
+
+Results go to:
+    - a sidebar debug panel, when FD_SPANS_PANEL=1 or the page URL
+      has ?debug=spans
+    - FD_SPANS_JSONL, a file receiving one JSON line per rerun
+    - FD_SPANS_PROM, a file rewritten at most every PROM_INTERVAL
+      seconds with histograms in Prometheus text format, for the node
+      exporter textfile collector. {pid} in the path is replaced by the
+      process id, to keep one file per worker process
+
+When FD_SPANS is not set, every function returns immediately and `span`
+returns a shared no-op context manager.
+"""
+from bisect import bisect_left
+from collections import Counter
+import json
+import os
+import threading
+import time
+
+from startup_profile import page_rendered, page_started
+
+ENABLED = os.environ.get('FD_SPANS', '').lower() in ('1', 'true', 'yes')
+PANEL = os.environ.get('FD_SPANS_PANEL', '').lower() in ('1', 'true', 'yes')
+JSONL_PATH = os.environ.get('FD_SPANS_JSONL') or None
+PROM_PATH = os.environ.get('FD_SPANS_PROM', '').replace('{pid}', str(os.getpid())) or None
+PROM_INTERVAL = 15
+
+## Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {'fd_rerun_seconds': 'Duration of page reruns',
+           'fd_section_seconds': 'Time spent in page sections by kind',
+           'fd_span_seconds': 'Duration of timed operations'}
+
+_lock = threading.Lock()
+_local = threading.local()
+_histograms = {}  # (metric, labels) -> [bucket counts, sum, count]
+_prom_written = 0.0
+
+
+class _NoopSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span(object):
+    """
+    Times the with block and records it in the current rerun
+    """
+    __slots__ = ('name', 'kind', 'start')
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+
+    def __enter__(self):
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        _local.depth -= 1
+        run = getattr(_local, 'run', None)
+        page = run['page'] if run else '-'
+        section_name = (run['section'] if run else None) or '-'
+        if run is not None:
+            totals = run['spans'].setdefault((section_name, self.name, self.kind), [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            ## Nested spans are part of the outer span's time
+            if _local.depth == 0:
+                run['kinds'][self.kind] += seconds
+        _observe('fd_span_seconds', (('page', page), ('section', section_name), ('name', self.name),
+                                     ('kind', self.kind)), seconds)
+        return False
+
+
+def span(name, kind='compute'):
+    """
+    Context manager timing one operation of the current section
+
+    Parameters
+    ----------
+    name: str
+        Name of the operation, e.g. 'history' or 'plotly_chart'
+
+    kind: str
+        Valid kind: fetch, compute, render
+        Default: compute
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Span(name, kind)
+
+
+def rerun_status(exc_type):
+    """
+    Status of a rerun ended by an exception of type exc_type, ok when
+    exc_type is None: stopped, rerun or error
+    """
+    if exc_type is None:
+        return 'ok'
+    ## Streamlit ends reruns with control flow exceptions
+    if exc_type.__name__ in ('StopException', 'StopScript'):
+        return 'stopped'
+    if exc_type.__name__ in ('RerunException', 'RerunScript'):
+        return 'rerun'
+    return 'error'
+
+
+class rerun_span(object):
+    """
+    Context manager timing a whole page rerun. The rerun is recorded
+    when the block exits, also when it ends early. Also marks the start
+    and first render of the page for the startup profile
+
+    Parameters
+    ----------
+    page: str
+        Name of the page
+    """
+    def __init__(self, page):
+        self.page = page
+
+    def __enter__(self):
+        page_started(self.page)
+        begin_rerun(self.page)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        status = rerun_status(exc_type)
+        end_rerun(status)
+        ## A page stopped early (e.g. no data for the ticker) has rendered all it will
+        if status in ('ok', 'stopped'):
+            page_rendered(self.page)
+        return False
+
+
+def begin_rerun(page):
+    """
+    Start timing a page rerun on the current thread
+
+    Parameters
+    ----------
+    page: str
+        Name of the page
+    """
+    if not ENABLED:
+        return
+    now = time.perf_counter()
+    _local.depth = 0
+    _local.run = {'page': page, 'time': time.time(), 'start': now, 'section': None, 'section_start': now,
+                  'kinds': Counter(), 'sections': [], 'spans': {}}
+
+
+def section(name):
+    """
+    End the current section of the page and start the next one
+
+    Parameters
+    ----------
+    name: str
+        Name of the section, as in the banner comment of the page
+    """
+    if not ENABLED:
+        return
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return
+    if run['section'] is not None:
+        _close_section(run, time.perf_counter())
+    run['section'] = name
+
+
+def _close_section(run, now):
+    kinds = run['kinds']
+    total = now - run['section_start']
+    timing = {'section': run['section'], 'seconds': total, 'fetch': kinds['fetch'], 'render': kinds['render'],
+              'compute': max(0.0, total - kinds['fetch'] - kinds['render'])}
+    run['sections'].append(timing)
+    for kind in ('fetch', 'compute', 'render'):
+        _observe('fd_section_seconds', (('page', run['page']), ('section', run['section']), ('kind', kind)),
+                 timing[kind])
+    run['kinds'] = Counter()
+    run['section_start'] = now
+
+
+def end_rerun(status='ok'):
+    """
+    Finish timing the page rerun of the current thread, export it and
+    show the debug panel when it is turned on. Returns the rerun record,
+    or None when timing is off
+
+    Parameters
+    ----------
+    status: str
+        How the rerun ended. Valid status: ok, stopped, rerun, error
+        Default: ok
+    """
+    if not ENABLED:
+        return None
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return None
+    _local.run = None
+    now = time.perf_counter()
+    if run['section'] is not None:
+        _close_section(run, now)
+    spans = [{'section': key[0], 'name': key[1], 'kind': key[2], 'count': count, 'seconds': seconds}
+             for key, (count, seconds) in run['spans'].items()]
+    record = {'page': run['page'], 'time': run['time'], 'seconds': now - run['start'], 'status': status,
+              'sections': run['sections'], 'spans': spans}
+    _observe('fd_rerun_seconds', (('page', run['page']), ('status', status)), record['seconds'])
+    if JSONL_PATH:
+        line = json.dumps(record) + '\n'
+        with _lock:
+            with open(JSONL_PATH, 'a') as f:
+                f.write(line)
+    if PROM_PATH:
+        _write_prometheus()
+    ## The page of a rerun request is replaced, there is nowhere to show the panel
+    if status != 'rerun' and panel_enabled():
+        show_panel(record)
+    return record
+
+
+def _observe(metric, labels, seconds):
+    with _lock:
+        values = _histograms.get((metric, labels))
+        if values is None:
+            values = _histograms[(metric, labels)] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        values[0][bisect_left(BUCKETS, seconds)] += 1
+        values[1] += seconds
+        values[2] += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text():
+    """
+    Return the recorded histograms in Prometheus text format
+    """
+    with _lock:
+        items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in _histograms.items())
+    worker = str(os.getpid())
+    lines = []
+    for metric, help_text in METRICS.items():
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} histogram')
+        for (name, labels), (counts, total, count) in items:
+            if name != metric:
+                continue
+            base = ','.join(f'{key}="{_escape(value)}"' for key, value in labels + (('worker', worker),))
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{base}}} {total:.6f}')
+            lines.append(f'{metric}_count{{{base}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _write_prometheus(force=False):
+    """
+    Rewrite the Prometheus file if it is older than PROM_INTERVAL
+    """
+    global _prom_written
+    now = time.monotonic()
+    with _lock:
+        if not force and now - _prom_written < PROM_INTERVAL:
+            return
+        _prom_written = now
+    tmp = f'{PROM_PATH}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(tmp, PROM_PATH)
+
+
+def panel_enabled():
+    """
+    Whether the sidebar debug panel is on for the current session
+    """
+    if PANEL:
+        return True
+    import streamlit as st
+    return 'spans' in st.experimental_get_query_params().get('debug', [])
+
+
+def show_panel(record, limit=8):
+    """
+    Show the section breakdown and slowest operations of a rerun in the
+    sidebar. Repeated operations of a section are listed once with their
+    count and total time
+
+    Parameters
+    ----------
+    record: dict
+        Rerun record returned by end_rerun
+
+    limit: int
+        Number of slowest operations to list
+        Default: 8
+    """
+    import pandas as pd
+    import streamlit as st
+
+    with st.sidebar.expander('Timing', expanded=True):
+        status = '' if record.get('status', 'ok') == 'ok' else f" ({record['status']})"
+        st.write(f"**{record['page']}** rerun took {record['seconds'] * 1000:,.0f} ms{status}")
+        if record['sections']:
+            sections = pd.DataFrame(record['sections']).set_index('section')
+            sections = (sections[['seconds', 'fetch', 'compute', 'render']] * 1000).round(1)
+            st.table(sections.rename(columns={'seconds': 'total ms', 'fetch': 'fetch ms', 'compute': 'compute ms',
+                                              'render': 'render ms'}))
+        if record['spans']:
+            slowest = sorted(record['spans'], key=lambda item: item['seconds'], reverse=True)[:limit]
+            spans = pd.DataFrame(slowest)[['section', 'name', 'kind', 'count', 'seconds']]
+            spans['seconds'] = (spans['seconds'] * 1000).round(1)
+            st.table(spans.rename(columns={'seconds': 'ms'}))
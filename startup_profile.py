@@ -0,0 +1,257 @@
+"""
+Lazy imports and cold start instrumentation for the dashboard pages.
+
+Heavy dependencies are loaded through `lazy_import` so that a page only
+pays for a module the first time one of its attributes is used.
+
+Setting the environment variable FD_STARTUP_PROFILE=1 turns on the
+startup profile: the import time of every module loaded afterwards is
+recorded (inclusive and self time, like `python -X importtime`) and the
+first render of each page is timed. A report is logged at INFO level
+to stderr when a page finishes its first render in the process. A
+rerun that ends with st.stop() counts as a render.
+"""
+import importlib
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+import types
+
+ENABLED = os.environ.get('FD_STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+PROCESS_START = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_local = threading.local()
+_lazy_lock = threading.RLock()
+_import_times = {}  # module name -> (inclusive seconds, self seconds)
+_page_starts = {}   # page -> perf_counter at the start of its current run
+_first_render = {}  # page -> (seconds since page start, seconds since process start)
+_warmed = set()     # modules warmed up by warm_plotly
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Module placeholder that imports the real module on first
+    attribute access
+    """
+    def _load(self):
+        module = self.__dict__.get('_module')
+        if module is None:
+            ## Sessions run on separate threads. Concurrent first imports of
+            ## packages with import cycles (plotly) can see a partially
+            ## initialized module, so lazy imports are done one at a time
+            with _lazy_lock:
+                module = self.__dict__.get('_module')
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    on_load = self.__dict__.get('_on_load')
+                    if on_load is not None:
+                        on_load(module)
+                    self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name, on_load=None):
+    """
+    Return a module object for `name` without importing it.
+    The import happens on first attribute access.
+
+    Parameters
+    ----------
+    name: str
+        Fully qualified module name, e.g. 'plotly.graph_objects'
+
+    on_load: callable
+        Called with the module after it is imported and before any
+        thread can use it, e.g. warm_plotly. Also called when the module
+        was already imported, so it must do its work only once
+    """
+    module = sys.modules.get(name)
+    ## A module still being imported by another thread is not ready to use
+    if module is not None and not getattr(getattr(module, '__spec__', None), '_initializing', False):
+        if on_load is not None:
+            on_load(module)
+        return module
+    lazy = _LazyModule(name)
+    lazy.__dict__['_on_load'] = on_load
+    return lazy
+
+
+def warm_plotly(module):
+    """
+    on_load hook for plotly modules: build one figure with the default
+    template, once per process and module. Plotly loads the template
+    and creates its property objects on first access, which fails with
+    'Invalid value' when sessions build their first figures concurrently
+
+    Parameters
+    ----------
+    module: module
+        plotly.express, plotly.graph_objects or plotly.subplots
+    """
+    if module.__name__ in _warmed:
+        return
+    with _lazy_lock:
+        if module.__name__ in _warmed:
+            return
+        if module.__name__ == 'plotly.express':
+            module.area(x=[0, 1], y=[0, 1]).to_plotly_json()
+        else:
+            import plotly.graph_objects as go
+            go.Figure(go.Scatter(x=[0, 1], y=[0, 1])).to_plotly_json()
+        _warmed.add(module.__name__)
+
+
+class _TimedLoader(object):
+    """
+    Wrap a module loader and record how long the module
+    takes to create and execute
+    """
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._timed(spec.name, self._loader.create_module, spec)
+
+    def exec_module(self, module):
+        return self._timed(module.__name__, self._loader.exec_module, module)
+
+    @staticmethod
+    def _timed(name, func, arg):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return func(arg)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with _lock:
+                total, own = _import_times.get(name, (0.0, 0.0))
+                _import_times[name] = (total + elapsed, own + elapsed - children)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder that delegates to the other finders and
+    wraps the loader of every found module with `_TimedLoader`
+    """
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader)
+        return spec
+
+
+def install():
+    """
+    Start recording import times for modules imported from now on
+    """
+    if not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _ImportTimer())
+
+
+def page_started(page):
+    """
+    Mark the start of a page script run
+
+    Parameters
+    ----------
+    page: str
+        Name of the page
+    """
+    if ENABLED:
+        with _lock:
+            _page_starts[page] = time.perf_counter()
+
+
+def page_rendered(page):
+    """
+    Mark the end of a page script run. The first completed run of
+    each page in the process is recorded and the report is logged.
+    Called by spans.rerun_span for reruns that complete or stop.
+
+    Parameters
+    ----------
+    page: str
+        Name of the page
+    """
+    if not ENABLED:
+        return
+    now = time.perf_counter()
+    with _lock:
+        if page in _first_render or page not in _page_starts:
+            return
+        _first_render[page] = (now - _page_starts[page], now - PROCESS_START)
+    logger.info(report())
+
+
+def import_times(limit=None):
+    """
+    Return the recorded imports as (module, inclusive, self) tuples
+    sorted by self time, slowest first
+
+    Parameters
+    ----------
+    limit: int
+        Maximum number of modules to return. None returns all
+    """
+    with _lock:
+        rows = [(name, total, own) for name, (total, own) in _import_times.items()]
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows[:limit] if limit else rows
+
+
+def report(limit=20):
+    """
+    Format the startup profile as text
+
+    Parameters
+    ----------
+    limit: int
+        Number of slowest modules to include
+    """
+    lines = ['Startup profile', 'First render (page: since page start / since process start)']
+    with _lock:
+        renders = sorted(_first_render.items())
+        total_imports = sum(own for _, own in _import_times.values())
+    for page, (since_page, since_process) in renders:
+        lines.append(f'  {page}: {since_page*1000:.1f} ms / {since_process*1000:.1f} ms')
+    lines.append(f'Imports ({total_imports*1000:.1f} ms total, slowest {limit} by self time)')
+    for name, total, own in import_times(limit):
+        lines.append(f'  {own*1000:9.1f} ms self {total*1000:9.1f} ms cumulative  {name}')
+    return '\n'.join(lines)
+
+
+if ENABLED:
+    install()
+    ## Streamlit only configures its own loggers, so the report gets a handler of its own
+    logger.setLevel(logging.INFO)
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+    logger.propagate = False
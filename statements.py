@@ -0,0 +1,292 @@
+"""
+Display formatting and derived metrics for financial statements.
+
+Statement frames from yfinance have line items as rows and reporting
+periods as columns, most recent first. All formatting and ratio
+calculations here work on whole frames at once rather than cell by cell.
+Results are cached per ticker and statement version.
+"""
+from collections import OrderedDict
+import threading
+
+import numpy as np
+import pandas as pd
+
+SUFFIXES = np.array(['', 'K', 'M', 'B', 'T'])
+
+## Display format of each derived metric: pct, human or multiple
+METRIC_FORMATS = OrderedDict([
+    ('Gross Margin', 'pct'),
+    ('Operating Margin', 'pct'),
+    ('Net Margin', 'pct'),
+    ('Revenue Growth', 'pct'),
+    ('Revenue Growth (YoY)', 'pct'),
+    ('Net Income Growth', 'pct'),
+    ('Net Income Growth (YoY)', 'pct'),
+    ('Free Cash Flow', 'human'),
+    ('FCF Margin', 'pct'),
+    ('Debt to Equity', 'multiple'),
+    ('Liabilities to Assets', 'pct'),
+    ('Current Ratio', 'multiple'),
+    ('Interest Coverage', 'multiple'),
+])
+
+_CACHE_SIZE = 256
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def human_format_array(values, decimals=2, na_rep='N/A'):
+    """
+    Vectorized version of Summary.human_format. Format every
+    number in an array to a human-readable string in one pass
+
+    Parameters
+    ----------
+    values: array-like
+        The numbers to format. Missing values are allowed
+
+    decimals: int
+        Number of decimals to show
+        Default: 2
+
+    na_rep: str
+        Text shown for missing values
+        Default: N/A
+    """
+    values = np.asarray(values, dtype='float64')
+    absolute = np.abs(np.nan_to_num(values))
+    magnitude = np.zeros(values.shape, dtype='int64')
+    for threshold in (1e3, 1e6, 1e9, 1e12):
+        magnitude += absolute >= threshold
+    scaled = values / np.power(1000.0, magnitude)
+    text = np.char.add(np.char.mod(f'%.{decimals}f', scaled), SUFFIXES[magnitude]).astype(object)
+    text[np.isnan(values)] = na_rep
+    return text
+
+
+def _format_array(values, kind, na_rep='N/A'):
+    """
+    Format an array of metric values as pct, human or multiple
+    """
+    values = np.asarray(values, dtype='float64')
+    if kind == 'human':
+        return human_format_array(values, na_rep=na_rep)
+    if kind == 'pct':
+        text = np.char.mod('%.2f%%', values * 100).astype(object)
+    else:
+        text = np.char.mod('%.2fx', values).astype(object)
+    text[~np.isfinite(values)] = na_rep
+    return text
+
+
+def _period_labels(columns):
+    """
+    Column labels for display, dates without the time part
+    """
+    if isinstance(columns, pd.DatetimeIndex):
+        return columns.strftime('%Y-%m-%d')
+    return columns
+
+
+def format_statement(df):
+    """
+    Scale a whole statement frame to human-readable display values
+
+    Parameters
+    ----------
+    df: DataFrame
+        Statement with line items as rows and periods as columns
+    """
+    values = df.apply(pd.to_numeric, errors='coerce').to_numpy(dtype='float64')
+    return pd.DataFrame(human_format_array(values), index=df.index, columns=_period_labels(df.columns))
+
+
+def _line(df, periods, *labels):
+    """
+    Return the first available line item among labels aligned
+    to periods, or an all-missing series
+    """
+    if df is not None:
+        for label in labels:
+            if label in df.index:
+                return pd.to_numeric(df.loc[label], errors='coerce').reindex(periods)
+    return pd.Series(np.nan, index=periods, dtype='float64')
+
+
+def _growth(series, lag):
+    """
+    Period over period growth for a series ordered most recent first
+    """
+    return series / series.shift(-lag) - 1
+
+
+def derive_metrics(income, balance, cashflow, frequency='yearly'):
+    """
+    Compute margins, growth, free cash flow and leverage ratios
+    for every reporting period at once
+
+    Parameters
+    ----------
+    income: DataFrame
+        Income statement
+
+    balance: DataFrame
+        Balance sheet
+
+    cashflow: DataFrame
+        Cash flow statement
+
+    frequency: str
+        Reporting frequency of the statements.
+        Valid frequency: quarterly, yearly
+        Default: yearly
+    """
+    frames = [df for df in (income, balance, cashflow) if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame(index=list(METRIC_FORMATS), dtype='float64')
+    periods = frames[0].columns
+    for df in frames[1:]:
+        periods = periods.union(df.columns)
+    periods = periods.sort_values(ascending=False)
+
+    revenue = _line(income, periods, 'Total Revenue')
+    gross_profit = _line(income, periods, 'Gross Profit')
+    operating_income = _line(income, periods, 'Operating Income')
+    net_income = _line(income, periods, 'Net Income')
+    ebit = _line(income, periods, 'Ebit', 'Operating Income')
+    interest_expense = _line(income, periods, 'Interest Expense')
+    total_liab = _line(balance, periods, 'Total Liab')
+    total_assets = _line(balance, periods, 'Total Assets')
+    equity = _line(balance, periods, 'Total Stockholder Equity')
+    current_assets = _line(balance, periods, 'Total Current Assets')
+    current_liab = _line(balance, periods, 'Total Current Liabilities')
+    debt = _line(balance, periods, 'Long Term Debt').fillna(0) + _line(balance, periods, 'Short Long Term Debt').fillna(0)
+    operating_cf = _line(cashflow, periods, 'Total Cash From Operating Activities')
+    capex = _line(cashflow, periods, 'Capital Expenditures').fillna(0)
+
+    ## Quarterly statements show QoQ growth and YoY against the same quarter
+    yoy_lag = 4 if frequency == 'quarterly' else 1
+    free_cash_flow = operating_cf + capex
+    metrics = pd.DataFrame({
+        'Gross Margin': gross_profit / revenue,
+        'Operating Margin': operating_income / revenue,
+        'Net Margin': net_income / revenue,
+        'Revenue Growth': _growth(revenue, 1),
+        'Revenue Growth (YoY)': _growth(revenue, yoy_lag),
+        'Net Income Growth': _growth(net_income, 1),
+        'Net Income Growth (YoY)': _growth(net_income, yoy_lag),
+        'Free Cash Flow': free_cash_flow,
+        'FCF Margin': free_cash_flow / revenue,
+        'Debt to Equity': debt / equity,
+        'Liabilities to Assets': total_liab / total_assets,
+        'Current Ratio': current_assets / current_liab,
+        'Interest Coverage': ebit / interest_expense.abs(),
+    })
+    if frequency != 'quarterly':
+        metrics = metrics.drop(columns=['Revenue Growth (YoY)', 'Net Income Growth (YoY)'])
+    return metrics.replace([np.inf, -np.inf], np.nan).T
+
+
+def format_metrics(metrics):
+    """
+    Format derived metrics for display
+
+    Parameters
+    ----------
+    metrics: DataFrame
+        Output of derive_metrics
+    """
+    values = metrics.to_numpy(dtype='float64')
+    text = np.empty(values.shape, dtype=object)
+    kinds = np.array([METRIC_FORMATS.get(name, 'multiple') for name in metrics.index])
+    for kind in np.unique(kinds):
+        rows = kinds == kind
+        text[rows] = _format_array(values[rows], kind)
+    return pd.DataFrame(text, index=metrics.index, columns=_period_labels(metrics.columns))
+
+
+def statement_version(*frames):
+    """
+    Version key for a set of statements. Changes when a new
+    reporting period or line item is added
+
+    Parameters
+    ----------
+    frames: DataFrame
+        Statement frames
+    """
+    return tuple((None if df is None or df.empty else str(df.columns.max()), None if df is None else df.shape)
+                 for df in frames)
+
+
+def _cached(key, compute):
+    """
+    Return the cached result for key, computing it on a miss
+    """
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    result = compute()
+    with _lock:
+        _cache[key] = result
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def statement_view(ticker, name, df, version=None):
+    """
+    Formatted statement for display, cached per ticker,
+    statement name and version
+
+    Parameters
+    ----------
+    ticker: str
+        The ticker symbol
+
+    name: str
+        Name of the statement, e.g. quarterly_financials
+
+    df: DataFrame
+        The statement
+
+    version: hashable
+        Statement version. Default: derived from the frame
+    """
+    if version is None:
+        version = statement_version(df)
+    return _cached((ticker, name, version), lambda: format_statement(df))
+
+
+def metrics_view(ticker, income, balance, cashflow, frequency='yearly', version=None):
+    """
+    Formatted derived metrics for display, cached per ticker,
+    frequency and statement version
+
+    Parameters
+    ----------
+    ticker: str
+        The ticker symbol
+
+    income: DataFrame
+        Income statement
+
+    balance: DataFrame
+        Balance sheet
+
+    cashflow: DataFrame
+        Cash flow statement
+
+    frequency: str
+        Valid frequency: quarterly, yearly
+        Default: yearly
+
+    version: hashable
+        Statement version. Default: derived from the frames
+    """
+    if version is None:
+        version = statement_version(income, balance, cashflow)
+    return _cached((ticker, f'{frequency}_metrics', version),
+                   lambda: format_metrics(derive_metrics(income, balance, cashflow, frequency)))
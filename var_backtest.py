@@ -0,0 +1,304 @@
+"""
+Rolling-window backtest of the Monte Carlo Value at Risk.
+
+MonteCarlo estimates the daily volatility of the close over its
+estimation window, simulates n paths of time_horizon days of normal
+returns and reports the 5th percentile loss of the final price. The
+backtest slides that estimation window over the price history. At every
+forecast date it compares the forecast VaR with the loss actually
+realized time_horizon days later and counts the breaches.
+
+All windows of a ticker are computed in one batch: the rolling
+volatilities come from a strided view of the returns, and every window
+reuses the same standard normal draws, scaled by its own volatility,
+exactly as separate MonteCarlo runs with the same seed would. The paths
+are built a horizon step at a time over (windows x paths) arrays, in
+chunks of bounded memory.
+
+Calibration is tested with Kupiec's proportion of failures test and
+Christoffersen's independence and conditional coverage tests. Forecast
+dates are time_horizon days apart by default so that realized losses do
+not overlap; overlapping losses produce clustered breaches by
+construction.
+
+Backtest the universe on worker processes from the command line:
+
+    python var_backtest.py --years 10 --workers 8 --output var_backtest.csv
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+## Largest (windows x paths) array built at once
+CHUNK_CELLS = 2 ** 21
+
+logger = logging.getLogger(__name__)
+
+
+def _xlogy(x, y):
+    """
+    x * log(y), with 0 * log(0) = 0
+    """
+    return x * math.log(y) if x else 0.0
+
+
+def chi2_sf(statistic, df):
+    """
+    Survival function of the chi-square distribution with 1 or 2
+    degrees of freedom
+
+    Parameters
+    ----------
+    statistic: float
+        Test statistic
+
+    df: int
+        Valid df: 1, 2
+    """
+    if statistic <= 0:
+        return 1.0
+    if df == 1:
+        return math.erfc(math.sqrt(statistic / 2))
+    if df == 2:
+        return math.exp(-statistic / 2)
+    raise ValueError(f'Unsupported degrees of freedom: {df}')
+
+
+def kupiec(breaches, p):
+    """
+    Kupiec proportion of failures test. Returns (statistic, p-value)
+
+    Parameters
+    ----------
+    breaches: array-like
+        Breach indicator of each forecast
+
+    p: float
+        Expected breach probability, 1 - confidence
+    """
+    breaches = np.asarray(breaches, dtype=bool)
+    n, x = len(breaches), int(breaches.sum())
+    if n == 0:
+        return np.nan, np.nan
+    rate = x / n
+    statistic = -2 * (_xlogy(n - x, 1 - p) + _xlogy(x, p) - _xlogy(n - x, 1 - rate) - _xlogy(x, rate))
+    statistic = max(statistic, 0.0)
+    return statistic, chi2_sf(statistic, 1)
+
+
+def christoffersen(breaches):
+    """
+    Christoffersen independence test of consecutive breaches. Returns
+    (statistic, p-value)
+
+    Parameters
+    ----------
+    breaches: array-like
+        Breach indicator of each forecast, in time order
+    """
+    breaches = np.asarray(breaches, dtype=bool)
+    if len(breaches) < 2:
+        return np.nan, np.nan
+    previous, current = breaches[:-1], breaches[1:]
+    n00 = int(np.sum(~previous & ~current))
+    n01 = int(np.sum(~previous & current))
+    n10 = int(np.sum(previous & ~current))
+    n11 = int(np.sum(previous & current))
+    pi0 = n01 / (n00 + n01) if n00 + n01 else 0.0
+    pi1 = n11 / (n10 + n11) if n10 + n11 else 0.0
+    pi = (n01 + n11) / (n00 + n01 + n10 + n11)
+    statistic = -2 * (_xlogy(n00 + n10, 1 - pi) + _xlogy(n01 + n11, pi)
+                      - _xlogy(n00, 1 - pi0) - _xlogy(n01, pi0) - _xlogy(n10, 1 - pi1) - _xlogy(n11, pi1))
+    statistic = max(statistic, 0.0)
+    return statistic, chi2_sf(statistic, 1)
+
+
+def rolling_var(close, window=252, time_horizon=30, n_simulation=1000, seed=1024, confidence=0.95, step=None):
+    """
+    Monte Carlo VaR forecasts over a sliding estimation window, with the
+    losses realized time_horizon days after each forecast. Returns a
+    DataFrame indexed by forecast date
+
+    Parameters
+    ----------
+    close: Series
+        Daily close prices
+
+    window: int
+        Number of daily returns in each estimation window
+        Default: 252
+
+    time_horizon: int
+        Forecast horizon in days
+        Default: 30
+
+    n_simulation: int
+        Number of paths per window
+        Default: 1000
+
+    seed: int
+        Seed for random number generator
+        Default: 1024
+
+    confidence: float
+        VaR confidence level
+        Default: 0.95
+
+    step: int
+        Days between forecast dates. None uses time_horizon, so that
+        realized losses do not overlap
+    """
+    step = step or time_horizon
+    close = close.dropna().astype('float64')
+    prices = close.to_numpy()
+    returns = np.diff(prices) / prices[:-1]
+    ## Forecast at the close ending each window, when its outcome is known
+    origins = np.arange(window, len(prices) - time_horizon, step)
+    if len(origins) == 0:
+        return pd.DataFrame(columns=['price', 'volatility', 'var', 'loss', 'breach'], index=close.index[:0])
+
+    windows = sliding_window_view(returns, window)[origins - window]
+    volatility = windows.std(axis=1)
+
+    ## Same stream and order as MonteCarlo.run_simulation, one path after the other
+    rng = np.random.RandomState(seed)
+    draws = rng.normal(0, 1, size=(n_simulation, time_horizon)).T
+    quantile = np.empty(len(origins))
+    chunk = max(1, CHUNK_CELLS // n_simulation)
+    for begin in range(0, len(origins), chunk):
+        sigma = volatility[begin:begin + chunk, None]
+        growth = np.ones((len(sigma), n_simulation))
+        for day in range(time_horizon):
+            growth *= 1 + sigma * draws[day]
+        quantile[begin:begin + chunk] = np.percentile(growth, 100 * (1 - confidence), axis=1)
+
+    price = prices[origins]
+    result = pd.DataFrame({'price': price, 'volatility': volatility, 'var': price * (1 - quantile),
+                           'loss': price - prices[origins + time_horizon]}, index=close.index[origins])
+    result['breach'] = result['loss'] > result['var']
+    return result
+
+
+def summarize(result, confidence=0.95):
+    """
+    Breach counts and calibration tests of a rolling_var result
+
+    Parameters
+    ----------
+    result: DataFrame
+        Output of rolling_var
+
+    confidence: float
+        VaR confidence level of the forecasts
+        Default: 0.95
+    """
+    breaches = result['breach'].to_numpy(dtype=bool)
+    p = 1 - confidence
+    pof, pof_p = kupiec(breaches, p)
+    ind, ind_p = christoffersen(breaches)
+    cc = pof + ind
+    return {'forecasts': len(breaches), 'breaches': int(breaches.sum()), 'expected': len(breaches) * p,
+            'breach_rate': float(breaches.mean()) if len(breaches) else np.nan,
+            'kupiec_lr': pof, 'kupiec_p': pof_p, 'independence_lr': ind, 'independence_p': ind_p,
+            'conditional_lr': cc, 'conditional_p': chi2_sf(cc, 2) if not np.isnan(cc) else np.nan}
+
+
+def backtest_ticker(symbol, years=10, window=252, time_horizon=30, n_simulation=1000, seed=1024,
+                    confidence=0.95, step=None):
+    """
+    Backtest the VaR of one ticker over the last years of daily closes.
+    Returns the summary with the symbol, or with the error if the ticker
+    could not be backtested
+
+    Parameters
+    ----------
+    symbol: str
+        The ticker symbol
+
+    years: float
+        Years of backtest history, before the first estimation window
+        Default: 10
+
+    Other parameters as in rolling_var
+    """
+    from market_data import TickerHandle
+
+    end = date.today()
+    start = end - timedelta(days=int(365.25 * years) + int(window * 1.5))
+    try:
+        history = TickerHandle(symbol).history(interval='1d', start=start, end=end)
+        result = rolling_var(history['Close'], window, time_horizon, n_simulation, seed, confidence, step)
+        summary = summarize(result, confidence)
+    except Exception as e:
+        logger.warning('Skipping %s: %s', symbol, e)
+        return {'symbol': symbol, 'error': str(e)}
+    summary['symbol'] = symbol
+    return summary
+
+
+def _backtest_task(args):
+    return backtest_ticker(*args)
+
+
+def backtest_universe(symbols, workers=None, **kwargs):
+    """
+    Backtest many tickers on worker processes. Returns one summary row
+    per ticker
+
+    Parameters
+    ----------
+    symbols: list
+        Ticker symbols
+
+    workers: int
+        Worker processes. Default: the number of CPUs
+
+    kwargs:
+        Parameters of backtest_ticker
+    """
+    params = [kwargs.get(name, default) for name, default in
+              (('years', 10), ('window', 252), ('time_horizon', 30), ('n_simulation', 1000), ('seed', 1024),
+               ('confidence', 0.95), ('step', None))]
+    tasks = [(symbol,) + tuple(params) for symbol in symbols]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(_backtest_task, tasks, chunksize=4))
+    return pd.DataFrame(rows).set_index('symbol')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Backtest the Monte Carlo VaR over rolling estimation windows')
+    parser.add_argument('--symbols', nargs='*', help='Tickers to backtest. Default: the S&P 500 list')
+    parser.add_argument('--years', type=float, default=10, help='Years of history to backtest')
+    parser.add_argument('--window', type=int, default=252, help='Daily returns per estimation window')
+    parser.add_argument('--time-horizon', type=int, default=30, help='Forecast horizon in days')
+    parser.add_argument('--n-simulation', type=int, default=1000, help='Paths per window')
+    parser.add_argument('--seed', type=int, default=1024, help='Seed for random number generator')
+    parser.add_argument('--confidence', type=float, default=0.95, help='VaR confidence level')
+    parser.add_argument('--step', type=int, help='Days between forecasts. Default: the time horizon')
+    parser.add_argument('--workers', type=int, help='Worker processes. Default: the number of CPUs')
+    parser.add_argument('--output', help='Write the summaries to this CSV file')
+    args = parser.parse_args()
+
+    symbols = args.symbols
+    if not symbols:
+        from market_data import sp500_tickers
+        symbols = list(sp500_tickers())
+    summary = backtest_universe(symbols, args.workers, years=args.years, window=args.window,
+                                time_horizon=args.time_horizon, n_simulation=args.n_simulation, seed=args.seed,
+                                confidence=args.confidence, step=args.step)
+    if args.output:
+        summary.to_csv(args.output)
+    if 'kupiec_p' not in summary:
+        parser.exit(1, 'No ticker could be backtested\n')
+    tested = summary.dropna(subset=['kupiec_p'])
+    logger.info('%d tickers backtested, %d breaches in %d forecasts (%.1f%% expected %.1f%%), '
+                'Kupiec rejects at 5%% for %d tickers', len(tested), tested['breaches'].sum(),
+                tested['forecasts'].sum(), 100 * tested['breaches'].sum() / max(tested['forecasts'].sum(), 1),
+                100 * (1 - args.confidence), (tested['kupiec_p'] < 0.05).sum())